@@ -0,0 +1,145 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Hashable, List, Optional, Tuple
+#import spaces
+
+
+class MicroBatcher:
+    """
+    Groups submitted items into batches and runs them on a bounded worker pool.
+
+    Items with the same `key_fn(item)` are compatible and may share a batch. A batch is
+    dispatched once it holds `max_batch_size` items or its oldest item has waited
+    `max_wait_seconds`, and only while fewer than `max_concurrency` batches are running,
+    so the worker pool is also the bound on concurrent GPU work. `process_batch` takes a
+    list of items and returns one result per item, in order.
+    """
+
+    def __init__(
+        self,
+        process_batch: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 8,
+        max_wait_seconds: float = 0.05,
+        max_concurrency: int = 1,
+        key_fn: Optional[Callable[[Any], Hashable]] = None,
+        name: str = "batcher",
+    ):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self.max_concurrency = max_concurrency
+        self.key_fn = key_fn or (lambda item: None)
+        self.name = name
+        # key -> queue of (item, future, enqueued_at); OrderedDict keeps keys in arrival order
+        self._pending: "OrderedDict[Hashable, Deque[Tuple[Any, Future, float]]]" = OrderedDict()
+        self._running = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix=name)
+        self._stats = {"submitted": 0, "batches": 0, "batched_items": 0, "max_batch": 0}
+        self._scheduler = threading.Thread(target=self._schedule, name=f"{name}-scheduler", daemon=True)
+        self._scheduler.start()
+
+    def submit(self, item: Any) -> Future:
+        """Queue an item; the returned future resolves to its result"""
+        future: Future = Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError(f"{self.name} is shut down")
+            self._pending.setdefault(self.key_fn(item), deque()).append((item, future, time.monotonic()))
+            self._stats["submitted"] += 1
+            self._condition.notify()
+        return future
+
+    def pending(self) -> int:
+        """Number of items waiting for a batch"""
+        with self._condition:
+            return sum(len(queue) for queue in self._pending.values())
+
+    def position(self, future: Future) -> Optional[int]:
+        """0-based place of a queued item among all waiting items (oldest first), or None"""
+        with self._condition:
+            waiting = sorted((enqueued, id(f)) for queue in self._pending.values() for _, f, enqueued in queue)
+        for position, (_, future_id) in enumerate(waiting):
+            if future_id == id(future):
+                return position
+        return None
+
+    def _next_batch(self, now: float) -> Tuple[Optional[List[Tuple[Any, Future, float]]], Optional[float]]:
+        """Pop the batch to run next, or return how long to wait before one is due"""
+        # Drop items whose futures were cancelled while queued
+        for key in list(self._pending):
+            queue = deque(entry for entry in self._pending[key] if not entry[1].cancelled())
+            if queue:
+                self._pending[key] = queue
+            else:
+                del self._pending[key]
+
+        if self._running >= self.max_concurrency or not self._pending:
+            return None, None
+
+        # Oldest group first, so a busy key cannot starve the others
+        key = min(self._pending, key=lambda k: self._pending[k][0][2])
+        queue = self._pending[key]
+        due_at = queue[0][2] + self.max_wait_seconds
+        if len(queue) < self.max_batch_size and now < due_at and not self._closed:
+            return None, due_at - now
+
+        batch = [queue.popleft() for _ in range(min(self.max_batch_size, len(queue)))]
+        if not queue:
+            del self._pending[key]
+        return batch, None
+
+    def _schedule(self):
+        with self._condition:
+            while True:
+                batch, wait = self._next_batch(time.monotonic())
+                if batch is not None:
+                    self._running += 1
+                    self._executor.submit(self._run, batch)
+                    continue
+                if self._closed and not self._pending and self._running == 0:
+                    return
+                self._condition.wait(timeout=wait)
+
+    def _run(self, batch: List[Tuple[Any, Future, float]]):
+        """Process one batch and resolve its futures"""
+        entries = [entry for entry in batch if entry[1].set_running_or_notify_cancel()]
+        try:
+            if entries:
+                with self._condition:
+                    self._stats["batches"] += 1
+                    self._stats["batched_items"] += len(entries)
+                    self._stats["max_batch"] = max(self._stats["max_batch"], len(entries))
+                results = self.process_batch([item for item, _, _ in entries])
+                if len(results) != len(entries):
+                    raise RuntimeError(f"{self.name} returned {len(results)} results for {len(entries)} items")
+                for (_, future, _), result in zip(entries, results):
+                    future.set_result(result)
+        except Exception as e:
+            print(f"Error in {self.name} batch: {e}")
+            for _, future, _ in entries:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            with self._condition:
+                self._running -= 1
+                self._condition.notify()
+
+    def stats(self) -> Dict[str, Any]:
+        """Submitted items, dispatched batches and their sizes"""
+        with self._condition:
+            stats = dict(self._stats, pending=sum(len(queue) for queue in self._pending.values()), running=self._running)
+        stats["mean_batch"] = round(stats["batched_items"] / stats["batches"], 2) if stats["batches"] else 0
+        return stats
+
+    def shutdown(self, wait: bool = True):
+        """Stop accepting items; queued ones are still dispatched"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if wait:
+            self._scheduler.join()
+        self._executor.shutdown(wait=wait)
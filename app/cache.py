@@ -0,0 +1,451 @@
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+from urllib.parse import urlparse
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+#import spaces
+
+
+def file_digest(path: Union[str, Path], chunk_size: int = 1 << 20) -> str:
+    """Return the SHA-256 hex digest of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def text_digest(*parts: str) -> str:
+    """Return a SHA-256 hex digest over several text parts"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+IMAGE_SUFFIXES = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'}
+
+
+def stable_filename(url: str, content_type: Optional[str] = None) -> str:
+    """Filename derived from a digest of the URL, keeping a recognisable image extension"""
+    suffix = Path(urlparse(url).path).suffix.lower()
+    if suffix not in IMAGE_SUFFIXES:
+        guessed = mimetypes.guess_extension(content_type.split(";")[0].strip()) if content_type else None
+        suffix = guessed if guessed in IMAGE_SUFFIXES else ".jpg"
+    return f"{text_digest(url)[:32]}{suffix}"
+
+
+class JsonIndexCache:
+    """
+    Base for caches whose metadata lives in one JSON index file under cache_dir.
+
+    Several processes may share a cache (the app, scripts/validate_links.py, worker
+    pools), so the index on disk is the shared state: flush() merges it with this
+    process's entries (the more recently used entry wins per key) under a file lock
+    before writing, and a lookup miss re-reads it when another process has changed it.
+    Subclasses call _forget(key) when they drop an entry, so a merge does not bring
+    it back, and may override _trim() to enforce their limits after a merge.
+    """
+
+    def __init__(self, cache_dir: Union[str, Path]):
+        self.cache_dir = Path(cache_dir)
+        self.index_path = self.cache_dir / "index.json"
+        self.lock_path = self.cache_dir / "index.lock"
+        self._lock = threading.RLock()
+        self._index_version = self._index_stat()
+        self._entries: Dict[str, Dict] = self._load_index()
+        self._forgotten: Dict[str, float] = {}   # key -> when this process dropped it
+
+    def _index_stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.index_path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def _load_index(self) -> Dict[str, Dict]:
+        """Load the on-disk index, starting empty if it is missing or corrupt"""
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            print(f"Error reading cache index {self.index_path}, starting empty: {e}")
+            return {}
+
+    def _merge(self, disk_entries: Dict[str, Dict]):
+        """Fold entries from disk into memory: the more recently used entry wins, dropped keys stay dropped"""
+        for key, entry in disk_entries.items():
+            last_used = entry.get("last_used", 0)
+            if last_used <= self._forgotten.get(key, float("-inf")):
+                continue
+            mine = self._entries.get(key)
+            if mine is None or last_used > mine.get("last_used", 0):
+                self._entries[key] = entry
+
+    def _forget(self, key: str) -> Optional[Dict]:
+        """Drop an entry (evicted or stale) so later merges do not restore it"""
+        self._forgotten[key] = time.time()
+        return self._entries.pop(key, None)
+
+    def _trim(self):
+        """Enforce the cache's limits after a merge; subclasses override"""
+
+    def _refresh(self) -> bool:
+        """Merge the on-disk index if another process has written it since we last read it"""
+        version = self._index_stat()
+        if version is None or version == self._index_version:
+            return False
+        self._merge(self._load_index())
+        self._index_version = version
+        self._trim()
+        return True
+
+    @contextmanager
+    def _file_lock(self):
+        """Serialise index writers across processes (advisory; a no-op where fcntl is missing)"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.lock_path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _save_index(self):
+        """Merge with the index on disk, then atomically replace it through a private temp file"""
+        with self._file_lock():
+            self._merge(self._load_index())
+            self._trim()
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix="index.", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(self._entries, f)
+                os.replace(tmp_path, self.index_path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            self._index_version = self._index_stat()
+            self._forgotten.clear()
+
+    def flush(self):
+        """Persist new entries and the last-used timestamps updated by hits"""
+        with self._lock:
+            try:
+                self._save_index()
+            except Exception as e:
+                print(f"Error writing cache index {self.index_path}: {e}")
+
+
+class DescriptionCache(JsonIndexCache):
+    """
+    Persistent LRU cache of VLM image descriptions.
+    Entries are keyed by image content hash + VLM model name + prompt text and
+    stored in a single JSON index, so the same packshot is never described twice.
+    """
+
+    def __init__(self, cache_dir: Union[str, Path], max_entries: int = 2000):
+        super().__init__(cache_dir)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    def make_key(self, image_path: Union[str, Path], model_name: str, prompt: str, digest: Optional[str] = None) -> str:
+        """Build the cache key for an image under a given model and prompt; pass the file's digest if already known"""
+        return text_digest(digest or file_digest(image_path), model_name, prompt)
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached description for a key, counting the hit or miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and self._refresh():
+                entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry["last_used"] = time.time()
+            return entry["description"]
+
+    def put(self, key: str, description: str):
+        """Store a description, evicting the least recently used entries past max_entries (call flush to persist)"""
+        with self._lock:
+            self._entries[key] = {"description": description, "last_used": time.time()}
+            self._trim()
+
+    def _trim(self):
+        if len(self._entries) > self.max_entries:
+            by_age = sorted(self._entries, key=lambda k: self._entries[k]["last_used"])
+            for stale_key in by_age[:len(self._entries) - self.max_entries]:
+                self._forget(stale_key)
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters and the current entry count"""
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+class DownloadCache(JsonIndexCache):
+    """
+    URL-keyed on-disk cache for downloaded reference images.
+    Files are named by a digest of the URL so names are stable across processes.
+    Entries younger than `ttl` are served without touching the network; older ones
+    are revalidated with ETag/Last-Modified. Total size is bounded by `max_bytes`,
+    evicting least recently used files first. Trimming after merging another
+    process's index spares entries used within the last `trim_grace` seconds,
+    since that process may still be serving them.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Union[str, Path],
+        ttl: float = 24 * 3600,
+        max_bytes: int = 2 * 1024 ** 3,
+        trim_grace: float = 60,
+    ):
+        super().__init__(cache_dir)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.trim_grace = trim_grace
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.bytes_fetched = 0
+
+    def url_key(self, url: str) -> str:
+        """Stable key for a URL"""
+        return text_digest(url)
+
+    def path_for(self, url: str, content_type: Optional[str] = None) -> Path:
+        """Local file path for a URL"""
+        return self.cache_dir / stable_filename(url, content_type)
+
+    def lookup(self, url: str) -> Optional[Dict]:
+        """Return the index entry for a URL if its file is still on disk"""
+        with self._lock:
+            entry = self._entries.get(self.url_key(url))
+            if entry is None and self._refresh():
+                entry = self._entries.get(self.url_key(url))
+            if entry is None:
+                return None
+            if not Path(entry["path"]).exists():
+                self._forget(self.url_key(url))
+                return None
+            return dict(entry)
+
+    def is_fresh(self, entry: Dict) -> bool:
+        """Whether an entry can be served without revalidation"""
+        return time.time() - entry["fetched_at"] < self.ttl
+
+    def conditional_headers(self, entry: Optional[Dict]) -> Dict[str, str]:
+        """Headers for revalidating a stale entry"""
+        headers = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def mark_hit(self, url: str, revalidated: bool = False):
+        """Record that a cached file was served, resetting its TTL if it was revalidated"""
+        with self._lock:
+            entry = self._entries.get(self.url_key(url))
+            if entry is None:
+                return
+            now = time.time()
+            entry["last_used"] = now
+            if revalidated:
+                entry["fetched_at"] = now
+                self.revalidated += 1
+            else:
+                self.hits += 1
+
+    def store(self, url: str, path: Union[str, Path], etag: Optional[str], last_modified: Optional[str], size: int):
+        """Record a freshly downloaded file and evict past max_bytes"""
+        with self._lock:
+            now = time.time()
+            previous = self._entries.get(self.url_key(url))
+            if previous is not None and previous["path"] != str(path):
+                # A new Content-Type changed the file suffix; the old file is no longer indexed
+                self._remove_file(previous["path"])
+            self._entries[self.url_key(url)] = {
+                "url": url,
+                "path": str(path),
+                "etag": etag,
+                "last_modified": last_modified,
+                "size": size,
+                "fetched_at": now,
+                "last_used": now,
+            }
+            self.misses += 1
+            self.bytes_fetched += size
+            self._evict(keep=self.url_key(url))
+
+    @staticmethod
+    def _remove_file(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Error evicting cached download {path}: {e}")
+
+    def _evict(self, keep: Optional[str] = None, grace: float = 0):
+        """
+        Delete least recently used files until the cache fits in max_bytes, sparing
+        `keep` and entries used within the last `grace` seconds
+        """
+        total = sum(entry["size"] for entry in self._entries.values())
+        if total <= self.max_bytes:
+            return
+        recent = time.time() - grace
+        for key in sorted(self._entries, key=lambda k: self._entries[k]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            if key == keep or (grace and self._entries[key]["last_used"] > recent):
+                continue
+            entry = self._forget(key)
+            total -= entry["size"]
+            self._remove_file(entry["path"])
+
+    def _trim(self):
+        self._evict(grace=self.trim_grace)
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/revalidation/miss counters, bytes fetched and current size"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "revalidated": self.revalidated,
+                "misses": self.misses,
+                "bytes_fetched": self.bytes_fetched,
+                "entries": len(self._entries),
+                "bytes": sum(entry["size"] for entry in self._entries.values()),
+            }
+
+
+class PreparedImageCache(JsonIndexCache):
+    """
+    On-disk LRU cache of preprocessed (decoded, downscaled, RGB) reference images.
+    Keys come from the source image's content hash plus the preprocessing settings;
+    total size is bounded by `max_bytes`.
+    """
+
+    def __init__(self, cache_dir: Union[str, Path], max_bytes: int = 512 * 1024 ** 2):
+        super().__init__(cache_dir)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def path_for(self, key: str) -> Path:
+        return self.cache_dir / f"{key[:32]}.jpg"
+
+    def get(self, key: str) -> Optional[str]:
+        """Path of the prepared image for a key, if it is still on disk"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and self._refresh():
+                entry = self._entries.get(key)
+            if entry is None or not Path(entry["path"]).exists():
+                self._forget(key)
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry["last_used"] = time.time()
+            return entry["path"]
+
+    def put(self, key: str, path: Union[str, Path]):
+        """Record a prepared image written to path_for(key), evicting past max_bytes (call flush to persist)"""
+        with self._lock:
+            self._entries[key] = {"path": str(path), "size": os.path.getsize(path), "last_used": time.time()}
+            self._trim(keep=key)
+
+    def _trim(self, keep: Optional[str] = None):
+        """Delete least recently used images past max_bytes, sparing `keep`"""
+        total = sum(entry["size"] for entry in self._entries.values())
+        for stale_key in sorted(self._entries, key=lambda k: self._entries[k]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            if stale_key == keep:
+                continue
+            entry = self._forget(stale_key)
+            total -= entry["size"]
+            try:
+                os.remove(entry["path"])
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters, entry count and total size"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": sum(entry["size"] for entry in self._entries.values()),
+            }
+
+
+class ExportCache(JsonIndexCache):
+    """
+    Cache of rendered download files (MD, TXT, PDF), one directory per brief.
+    Keys come from a hash of the brief content; the least recently used
+    directories are deleted past `max_entries`.
+    """
+
+    def __init__(self, cache_dir: Union[str, Path], max_entries: int = 200):
+        super().__init__(cache_dir)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    def dir_for(self, key: str) -> Path:
+        return self.cache_dir / key[:32]
+
+    def get(self, key: str) -> Optional[str]:
+        """Directory holding the finished exports for a key, if it is still on disk"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and self._refresh():
+                entry = self._entries.get(key)
+            if entry is None or not Path(entry["dir"]).is_dir():
+                self._forget(key)
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry["last_used"] = time.time()
+            return entry["dir"]
+
+    def put(self, key: str):
+        """Record that dir_for(key) holds finished exports, evicting past max_entries (call flush to persist)"""
+        with self._lock:
+            self._entries[key] = {"dir": str(self.dir_for(key)), "last_used": time.time()}
+            self._trim()
+
+    def _trim(self):
+        if len(self._entries) > self.max_entries:
+            by_age = sorted(self._entries, key=lambda k: self._entries[k]["last_used"])
+            for stale_key in by_age[:len(self._entries) - self.max_entries]:
+                shutil.rmtree(self._forget(stale_key)["dir"], ignore_errors=True)
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters and the current entry count"""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
@@ -30,11 +30,139 @@ NUM_BRIEFS = 20
 NUM_STATICS = 10
 NUM_VIDEOS = 10
 
+# === Swipe CSV ===
+# Uploads larger than this are read CSV_CHUNK_ROWS rows at a time, keeping only the swipe columns
+CSV_CHUNK_THRESHOLD_BYTES = 20 * 1024 * 1024
+CSV_CHUNK_ROWS = 50_000
+
 # === Model Configuration ===
 VLM_MODEL_NAME = "HuggingFaceTB/SmolVLM-Instruct"
 LLM_MODEL_NAME = "meta-llama/Llama-3.2-3B-Instruct"
+HEADLINE_MODEL_NAME = "google/gemma-3-1b-it"
+FALLBACK_MODEL_NAME = "microsoft/DialoGPT-medium"
 MAX_NEW_TOKENS = 60000   
 
+# === Model loading ===
+# Models load on first use; names listed here are warmed in a background thread at startup
+MODEL_WARMUP = ["headline"]
+MODEL_MEMORY_BUDGET_BYTES = None   # e.g. 20 * 1024 ** 3 to evict idle models past 20 GB
+MODEL_MIN_IDLE_SECONDS = 60        # never evict a model used more recently than this
+
+# === Model precision ===
+# One of "auto", "fp32", "fp16", "bf16", "int8" (see models/precision.py).
+# auto keeps each model's historical default: fp16 SmolVLM on GPU (fp32 on CPU),
+# pipeline-default Llama, bf16 Gemma. int8 = dynamic quantization for CPU hosts.
+VLM_PRECISION = "auto"
+LLM_PRECISION = "auto"
+HEADLINE_PRECISION = "auto"
+
+# === Brief generation strategy ===
+# "single": one completion writes every brief; "per_brief": one prompt per brief
+# (or per BRIEF_GROUP_SIZE briefs), decoded as padded batches and reassembled in order
+BRIEF_GENERATION_MODE = "single"
+BRIEF_GROUP_SIZE = 1
+LLM_BATCH_SIZE = 8
+PER_BRIEF_MAX_NEW_TOKENS = 1500
+
+# === Brief length limits ===
+# MAX_NEW_TOKENS stays the hard cap; each request is budgeted from its brief counts,
+# and decoding stops once every requested brief is written or the output starts looping
+IMAGE_BRIEF_TOKEN_BUDGET = 450
+VIDEO_BRIEF_TOKEN_BUDGET = 550
+BRIEF_BUDGET_OVERHEAD_TOKENS = 300   # preamble / closing notes
+BRIEF_STOP_ON_COMPLETION = True
+BRIEF_STOP_ON_REPETITION = True
+
+# === Prompt token budget ===
+# The user prompt is trimmed to this many tokens (counted with the LLM's tokenizer) by
+# dropping list items, trailing ones first, from sections in this order
+PROMPT_TOKEN_BUDGET = 12000
+PROMPT_TRIM_ORDER = ["reference_image_description", "content_bank", "social_proof", "subheadlines", "headlines", "benefits"]
+
+# === Prefix KV cache ===
+# Reuse the prefilled system prompt + brand context across clicks and brief variants
+PREFIX_CACHE_ENABLED = True
+PREFIX_CACHE_MAX_ENTRIES = 4
+
+# === Headline generation ===
+# One call samples HEADLINE_NUM_SEQUENCES sets of HEADLINE_COUNT headlines + subheadlines;
+# unused sets serve the next clicks of either button for the same brand and angle
+HEADLINE_COUNT = 3
+HEADLINE_NUM_SEQUENCES = 2
+HEADLINE_MAX_NEW_TOKENS = 300
+HEADLINE_MAX_ATTEMPTS = 2
+# Force the '###Headline N.' line format with a logits processor (each line capped at
+# HEADLINE_MAX_ITEM_TOKENS) so every sequence parses and decoding stops after the last item
+HEADLINE_CONSTRAINED_DECODING = True
+HEADLINE_MAX_ITEM_TOKENS = 24
+
+# === Headline micro-batching ===
+# Headline/subheadline requests from all sessions that arrive within the wait window
+# run through Gemma as one padded batch
+HEADLINE_BATCHING_ENABLED = True
+HEADLINE_MAX_BATCH_SIZE = 8
+HEADLINE_BATCH_WAIT_SECONDS = 0.05
+
+# === Reference image description (VLM) ===
+VLM_DESCRIPTION_PROMPT = "Give a brief 5-10 line description of this image, including any relevant context or information that can help in generating a creative brief."
+VLM_MAX_NEW_TOKENS = 1000
+VLM_BATCH_SIZE = 8   # images per SmolVLM generate call
+VLM_CACHE_DIR = PROCESSED_DIR / "vlm_descriptions"
+VLM_CACHE_MAX_ENTRIES = 2000
+# Reference images are downscaled to the processor's longest edge (or this) and cached as JPEG
+VLM_IMAGE_CACHE_DIR = PROCESSED_DIR / "vlm_images"
+VLM_IMAGE_CACHE_MAX_BYTES = 512 * 1024 ** 2
+VLM_IMAGE_MAX_SIDE = 1536
+VLM_IMAGE_QUALITY = 90
+# Cache misses are decoded/validated/resized in a thread pool once there are this many
+IMAGE_PREP_WORKERS = None         # None = one thread per available core
+IMAGE_PREP_POOL_MIN_IMAGES = 2
+
+# === ZIP asset uploads ===
+# Archives are read member by member from their central directory; only supported
+# types are extracted (once per archive, into a directory named after its content hash)
+ZIP_EXTRACT_DIR = PROCESSED_DIR / "unzipped"
+ZIP_IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".gif", ".bmp", ".webp"}
+ZIP_DOCUMENT_SUFFIXES = {".pdf", ".ppt", ".pptx", ".doc", ".docx", ".txt", ".md", ".csv"}
+ZIP_MAX_MEMBERS = 500
+ZIP_MAX_MEMBER_BYTES = 50 * 1024 ** 2
+ZIP_MAX_TOTAL_BYTES = 500 * 1024 ** 2        # uncompressed, across the extracted members
+ZIP_MAX_COMPRESSION_RATIO = 100              # members packed tighter than this are skipped
+
+# === Reference image downloads ===
+DOWNLOAD_DIR = PROCESSED_DIR / "images"
+DOWNLOAD_MAX_WORKERS = 8
+DOWNLOAD_PER_HOST_LIMIT = 4
+DOWNLOAD_TIMEOUT = 30     # seconds per request
+DOWNLOAD_DEADLINE = 120   # seconds for a whole batch of URLs
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+DOWNLOAD_CACHE_TTL = 24 * 3600              # seconds before a cached image is revalidated
+DOWNLOAD_CACHE_MAX_BYTES = 2 * 1024 ** 3    # evict least recently used files past this
+DOWNLOAD_CACHE_TRIM_GRACE = 60             # seconds a just-used file is safe from trims after an index merge
+
+# === Download files ===
+# MD/TXT/PDF exports are cached by a hash of the brief; PDFs render on background threads
+EXPORT_CACHE_DIR = OUTPUTS_DIR / "exports"
+EXPORT_CACHE_MAX_ENTRIES = 200
+EXPORT_PDF_WORKERS = 1
+EXPORT_PDF_TIMEOUT = 180   # seconds to wait for a PDF before offering the other files alone
+
+# === Telemetry ===
+# One trace record (spans + counters) per brief run, appended as a JSON line.
+# Set a port to also serve the aggregated metrics as Prometheus text at /metrics.
+TELEMETRY_ENABLED = True
+TELEMETRY_TRACE_PATH = OUTPUTS_DIR / "traces.jsonl"
+TELEMETRY_PROMETHEUS_PORT = None   # e.g. 9464
+
+# === Brief job queue ===
+# Briefs run as background jobs; at most JOB_MAX_CONCURRENCY generate at once (one per
+# GPU slot) and queued jobs take the next free slot in arrival order. Within a job,
+# per-brief prompts are batched (LLM_BATCH_SIZE).
+JOBS_DIR = OUTPUTS_DIR / "jobs"
+JOB_MAX_CONCURRENCY = 1
+JOB_POLL_INTERVAL = 0.5        # seconds between UI status checks
+JOB_MAX_IN_MEMORY = 200        # finished jobs beyond this are only kept on disk
+
 # === Ensure folders exist on startup ===
-for folder in [UPLOADS_DIR, PROCESSED_DIR, BRAND_GUIDES_DIR, BRIEFS_DIR, PDF_DIR, ZIP_DIR]:
+for folder in [UPLOADS_DIR, PROCESSED_DIR, BRAND_GUIDES_DIR, BRIEFS_DIR, PDF_DIR, ZIP_DIR, JOBS_DIR]:
     folder.mkdir(parents=True, exist_ok=True)
\ No newline at end of file
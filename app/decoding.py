@@ -0,0 +1,298 @@
+import re
+import threading
+import weakref
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import torch
+from transformers import LogitsProcessor, StoppingCriteria
+
+from app.config import IMAGE_BRIEF_TOKEN_BUDGET, VIDEO_BRIEF_TOKEN_BUDGET, BRIEF_BUDGET_OVERHEAD_TOKENS
+#import spaces
+
+
+class StopOnEvent(StoppingCriteria):
+    """Stop generation as soon as the given event is set (e.g. the user cancelled the run)"""
+
+    def __init__(self, stop_event: threading.Event):
+        self.stop_event = stop_event
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        return torch.full((input_ids.shape[0],), self.stop_event.is_set(), dtype=torch.bool, device=input_ids.device)
+
+
+# Per-tokenizer masks of tokens that end a line / contain a newline mid-token.
+# Decoding a whole vocabulary takes a moment, so it is done once per tokenizer.
+_newline_masks: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_newline_masks_lock = threading.Lock()
+
+
+def newline_masks(tokenizer):
+    """(line_end, inner_newline) bool masks over the vocabulary"""
+    with _newline_masks_lock:
+        if tokenizer not in _newline_masks:
+            texts = tokenizer.batch_decode([[i] for i in range(len(tokenizer))])
+            line_end = torch.tensor([text.endswith("\n") and "\n" not in text.rstrip("\n") for text in texts])
+            inner_newline = torch.tensor(["\n" in text.rstrip("\n") for text in texts])
+            _newline_masks[tokenizer] = (line_end, inner_newline)
+        return _newline_masks[tokenizer]
+
+
+class NumberedItemsProcessor(LogitsProcessor):
+    """
+    Forces output into numbered lines, e.g. "###Headline 1. <text>" ... "###Subheadline 3. <text>".
+
+    Each line starts with its label (forced token by token), followed by at least one
+    and at most `max_item_tokens` free tokens on a single line. After the last item
+    only EOS is allowed, so the output always parses and generation stops as soon as
+    every item is written. Create one instance per generate() call.
+    """
+
+    def __init__(
+        self,
+        tokenizer,
+        labels: Sequence[str],
+        eos_token_id: Union[int, List[int]],
+        max_item_tokens: int = 32,
+    ):
+        self.label_ids = [tokenizer.encode(label, add_special_tokens=False) for label in labels]
+        self.eos_ids = [eos_token_id] if isinstance(eos_token_id, int) else list(eos_token_id)
+        self.newline_id = tokenizer.encode("\n", add_special_tokens=False)[-1]
+        self.max_item_tokens = max_item_tokens
+        self.line_end, self.inner_newline = newline_masks(tokenizer)
+        self.prompt_length: Optional[int] = None
+        self.states: List[Dict[str, int]] = []
+
+    @classmethod
+    def for_kinds(cls, tokenizer, kinds: Sequence[str], count: int, eos_token_id, max_item_tokens: int = 32):
+        """Labels '###<Kind> 1.' .. '###<Kind> count.' for each kind in order"""
+        labels = [f"###{kind} {i}." for kind in kinds for i in range(1, count + 1)]
+        return cls(tokenizer, labels, eos_token_id, max_item_tokens)
+
+    def token_budget(self) -> int:
+        """max_new_tokens that always fits every item plus the closing EOS"""
+        return sum(len(ids) + self.max_item_tokens + 1 for ids in self.label_ids) + 1
+
+    def _advance(self, state: Dict[str, int], token: int):
+        """Move one row's state past a generated token"""
+        if state["done"]:
+            return
+        if state["pos"] < len(self.label_ids[state["item"]]):
+            state["pos"] += 1
+            return
+        state["item_tokens"] += 1
+        if bool(self.line_end[token]):
+            state.update(item=state["item"] + 1, pos=0, item_tokens=0)
+            state["done"] = int(state["item"] == len(self.label_ids))
+
+    def _sync(self, input_ids: torch.LongTensor):
+        """Catch the row states up with the tokens generated so far"""
+        if self.prompt_length is None:
+            self.prompt_length = input_ids.shape[1]
+            self.states = [dict(item=0, pos=0, item_tokens=0, done=0, seen=self.prompt_length) for _ in range(input_ids.shape[0])]
+        for row, state in enumerate(self.states):
+            for token in input_ids[row, state["seen"]:].tolist():
+                self._advance(state, token)
+            state["seen"] = input_ids.shape[1]
+
+    def is_done(self, input_ids: torch.LongTensor) -> torch.BoolTensor:
+        """Which rows have written every item"""
+        self._sync(input_ids)
+        return torch.tensor([bool(state["done"]) for state in self.states], device=input_ids.device)
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        self._sync(input_ids)
+        vocab_size = scores.shape[-1]
+        allowed = torch.ones_like(scores, dtype=torch.bool)
+        line_end = self.line_end[:vocab_size].to(scores.device)
+        inner_newline = self.inner_newline[:vocab_size].to(scores.device)
+
+        for row, state in enumerate(self.states):
+            if state["done"]:
+                forced = self.eos_ids
+            elif state["pos"] < len(self.label_ids[state["item"]]):
+                forced = [self.label_ids[state["item"]][state["pos"]]]
+            elif state["item_tokens"] >= self.max_item_tokens:
+                forced = [self.newline_id]
+            else:
+                forced = None
+
+            if forced is not None:
+                allowed[row] = False
+                allowed[row, forced] = True
+                continue
+            # Free text: one line, not empty, no early EOS
+            allowed[row] &= ~inner_newline
+            if state["item_tokens"] == 0:
+                allowed[row] &= ~line_end
+            allowed[row, self.eos_ids] = False
+
+        masked = scores.masked_fill(~allowed, float("-inf"))
+        # A forced token can carry -inf (e.g. suppressed by an earlier processor); keep it selectable
+        empty = torch.isinf(masked).all(dim=-1)
+        if empty.any():
+            masked[empty] = torch.zeros_like(masked[empty]).masked_fill(~allowed[empty], float("-inf"))
+        return masked
+
+
+class StopWhenItemsComplete(StoppingCriteria):
+    """Stop rows as soon as a NumberedItemsProcessor reports every item written"""
+
+    def __init__(self, processor: NumberedItemsProcessor):
+        self.processor = processor
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        return self.processor.is_done(input_ids)
+
+
+# "## Image Brief 3", "**Video Brief 2:**", "Image Brief #1" ...
+_BRIEF_HEADING = re.compile(r'^[#*\s]*(image|static|video)\s+brief\s*#?\s*(\d+)', re.IGNORECASE)
+# The last field of each brief in the output templates
+_BRIEF_END_MARKERS = {
+    "image": re.compile(r'^[-*\s]*color\s+palette', re.IGNORECASE),
+    "video": re.compile(r'^[-*\s]*voice\s*-?\s*over\s+style', re.IGNORECASE),
+}
+
+
+class BriefCompletionCriteria(StoppingCriteria):
+    """
+    Stops a row once it has written the requested number of image and video briefs.
+
+    A brief counts as written when the line holding its last template field (Color
+    Palette for images, Voiceover Style for videos) is finished, or when a heading
+    for another brief appears. Headings are counted by distinct number rather than
+    read as positions, so "Image Brief 3 of 10" in per-brief mode counts as one.
+    Generated text is decoded a line at a time, so the check costs little per token.
+    `targets` gives the (image, video) counts for each row of the batch and
+    `prompt_length` the width of the (left-padded) input ids passed to generate().
+    """
+
+    def __init__(self, tokenizer, targets: Sequence[Tuple[int, int]], prompt_length: int):
+        self.tokenizer = tokenizer
+        self.targets = [dict(image=image, video=video) for image, video in targets]
+        self.prompt_length = prompt_length
+        self.rows: List[Dict] = []
+
+    def _new_row(self) -> Dict:
+        return dict(
+            line_start=self.prompt_length,
+            partial="",
+            ended=dict(image=0, video=0),
+            headings=dict(image=set(), video=set()),
+            current=None,
+            done=False,
+        )
+
+    def _count_line(self, row: Dict, line: str):
+        heading = _BRIEF_HEADING.match(line)
+        if heading:
+            kind = "video" if heading.group(1).lower() == "video" else "image"
+            row["headings"][kind].add(int(heading.group(2)))
+            row["current"] = kind
+        for kind, marker in _BRIEF_END_MARKERS.items():
+            if marker.match(line):
+                row["ended"][kind] += 1
+
+    def completed(self, row_index: int) -> Dict[str, int]:
+        row = self.rows[row_index]
+        # Every heading but the latest one starts a brief that has since been finished
+        return {
+            kind: max(row["ended"][kind], len(row["headings"][kind]) - (kind == row["current"]))
+            for kind in ("image", "video")
+        }
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        if not self.rows:
+            self.rows = [self._new_row() for _ in range(input_ids.shape[0])]
+        for i, row in enumerate(self.rows):
+            if row["done"]:
+                continue
+            text = row["partial"] + self.tokenizer.decode(input_ids[i, row["line_start"]:], skip_special_tokens=True)
+            if "\n" not in text:
+                continue
+            *lines, row["partial"] = text.split("\n")
+            row["line_start"] = input_ids.shape[1]
+            for line in lines:
+                self._count_line(row, line)
+            target = self.targets[i]
+            completed = self.completed(i)
+            row["done"] = completed["image"] >= target["image"] and completed["video"] >= target["video"]
+        return torch.tensor([row["done"] for row in self.rows], device=input_ids.device)
+
+
+# Markdown scaffolding and punctuation; a repeated block made only of these is structure, not a loop
+_SEPARATOR_CHARS = re.compile(r'[\s\-|*#=_:.,>`~]+')
+
+
+class RepetitionCriteria(StoppingCriteria):
+    """
+    Stops a row that is looping: its output ends in at least `repeats` copies of a
+    unit of up to `max_period` tokens, the unit holds at least `min_unit_chars`
+    characters besides whitespace and Markdown separators, and the copies span at
+    least `min_span_tokens` tokens. Repeated table rules, "---" lines and empty field
+    scaffolding are structure, not a loop. `prompt_length` is the width of the input
+    ids passed to generate(). Checked every `check_every` steps.
+    """
+
+    def __init__(
+        self,
+        tokenizer,
+        prompt_length: int,
+        max_period: int = 256,
+        repeats: int = 3,
+        min_unit_chars: int = 32,
+        min_span_tokens: int = 64,
+        check_every: int = 16,
+    ):
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self.max_period = max_period
+        self.repeats = repeats
+        self.min_unit_chars = min_unit_chars
+        self.min_span_tokens = min_span_tokens
+        self.check_every = check_every
+        self.triggered: List[bool] = []
+
+    def _copies(self, tokens: torch.LongTensor, unit: torch.LongTensor) -> int:
+        """How many copies of unit the tokens end with"""
+        period, copies = len(unit), 0
+        while (copies + 1) * period <= len(tokens) and torch.equal(tokens[len(tokens) - (copies + 1) * period:][:period], unit):
+            copies += 1
+        return copies
+
+    def _looping(self, tokens: torch.LongTensor) -> bool:
+        structural: List[int] = []   # periods of repeated units that are only scaffolding
+        for period in range(1, min(self.max_period, len(tokens) // self.repeats) + 1):
+            blocks = tokens[-period * self.repeats:].view(self.repeats, period)
+            if not bool((blocks == blocks[0]).all()):
+                continue
+            unit = blocks[0]
+            # Several copies of a scaffolding unit are still scaffolding
+            if any(period % q == 0 and torch.equal(unit, unit[:q].repeat(period // q)) for q in structural):
+                continue
+            text = self.tokenizer.decode(unit, skip_special_tokens=True)
+            if len(_SEPARATOR_CHARS.sub("", text)) < self.min_unit_chars:
+                structural.append(period)
+                continue
+            return self._copies(tokens, unit) * period >= self.min_span_tokens
+        return False
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        if not self.triggered:
+            self.triggered = [False] * input_ids.shape[0]
+        generated = input_ids.shape[1] - self.prompt_length
+        if generated > 0 and generated % self.check_every == 0:
+            for i in range(input_ids.shape[0]):
+                if not self.triggered[i] and self._looping(input_ids[i, self.prompt_length:]):
+                    print(f"Stopping row {i}: output is repeating itself")
+                    self.triggered[i] = True
+        return torch.tensor(self.triggered, device=input_ids.device)
+
+
+def brief_token_budget(num_image_briefs: int, num_video_briefs: int, cap: Optional[int] = None) -> int:
+    """max_new_tokens for a response holding the given numbers of briefs"""
+    budget = (
+        BRIEF_BUDGET_OVERHEAD_TOKENS
+        + num_image_briefs * IMAGE_BRIEF_TOKEN_BUDGET
+        + num_video_briefs * VIDEO_BRIEF_TOKEN_BUDGET
+    )
+    return min(budget, cap) if cap else budget
@@ -0,0 +1,217 @@
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.cache import DownloadCache, stable_filename
+from app.telemetry import span, add_counter, run_in_context
+from app.config import (
+    DOWNLOAD_DIR, DOWNLOAD_MAX_WORKERS, DOWNLOAD_PER_HOST_LIMIT,
+    DOWNLOAD_TIMEOUT, DOWNLOAD_DEADLINE, DOWNLOAD_CHUNK_SIZE,
+    DOWNLOAD_CACHE_TTL, DOWNLOAD_CACHE_MAX_BYTES, DOWNLOAD_CACHE_TRIM_GRACE,
+)
+#import spaces
+
+
+def build_session(pool_size: int = DOWNLOAD_MAX_WORKERS) -> requests.Session:
+    """Create a keep-alive session whose connection pool matches the worker count"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def response_size(response: requests.Response) -> Optional[int]:
+    """Full size of the resource behind a response: the Content-Range total for a ranged reply, else Content-Length"""
+    content_range = response.headers.get("Content-Range", "")
+    if response.status_code == 206 and "/" in content_range:
+        total = content_range.rsplit("/", 1)[1]
+        return int(total) if total.isdigit() else None
+    length = response.headers.get("Content-Length")
+    return int(length) if length and length.isdigit() else None
+
+
+class DownloadDeadlineExceeded(Exception):
+    """Raised when a download is still running after the batch deadline"""
+
+
+class ImageDownloader:
+    """
+    Concurrent reference image downloader.
+    All requests share one keep-alive session; at most `max_workers` run at once,
+    at most `per_host_limit` against any single host, and a whole batch is bounded
+    by `deadline` seconds. Bodies are streamed to disk rather than held in memory.
+    With a DownloadCache attached, fresh files are served without any network I/O
+    and stale ones are revalidated conditionally.
+    """
+
+    def __init__(
+        self,
+        save_dir: str = str(DOWNLOAD_DIR),
+        max_workers: int = DOWNLOAD_MAX_WORKERS,
+        per_host_limit: int = DOWNLOAD_PER_HOST_LIMIT,
+        timeout: float = DOWNLOAD_TIMEOUT,
+        deadline: float = DOWNLOAD_DEADLINE,
+        chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+        session: Optional[requests.Session] = None,
+        cache: Optional[DownloadCache] = None,
+    ):
+        self.cache = cache
+        self.save_dir = str(cache.cache_dir) if cache is not None else save_dir
+        self.max_workers = max_workers
+        self.per_host_limit = per_host_limit
+        self.timeout = timeout
+        self.deadline = deadline
+        self.chunk_size = chunk_size
+        self.session = session or build_session(max_workers)
+        self._host_slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._host_lock = threading.Lock()
+
+    def _host_slot(self, url: str) -> threading.BoundedSemaphore:
+        """Return the semaphore limiting concurrent requests to the URL's host"""
+        host = urlparse(url).netloc
+        with self._host_lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return self._host_slots[host]
+
+    def _target_path(self, url: str, content_type: Optional[str] = None) -> str:
+        """Pick the local filename for a URL; digest-based so it is stable across processes"""
+        if self.cache is not None:
+            return str(self.cache.path_for(url, content_type))
+        return os.path.join(self.save_dir, stable_filename(url, content_type))
+
+    def _stream_to_file(self, response: requests.Response, save_path: str, expires_at: float) -> int:
+        """Stream a response body into save_path via a temp file, returning bytes written"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.save_dir, suffix=".part")
+        written = 0
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                    if time.monotonic() > expires_at:
+                        raise DownloadDeadlineExceeded(f"deadline exceeded after {written} bytes")
+                    f.write(chunk)
+                    written += len(chunk)
+            os.replace(tmp_path, save_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return written
+
+    def _fetch(self, url: str, expires_at: float) -> Optional[str]:
+        """Fetch one URL through the cache, returning the local path or None on failure"""
+        entry = self.cache.lookup(url) if self.cache is not None else None
+        if entry and self.cache.is_fresh(entry):
+            self.cache.mark_hit(url)
+            add_counter("download.cache_hits")
+            return entry["path"]
+        try:
+            os.makedirs(self.save_dir, exist_ok=True)
+            headers = self.cache.conditional_headers(entry) if self.cache is not None else {}
+            with self._host_slot(url):
+                remaining = expires_at - time.monotonic()
+                if remaining <= 0:
+                    raise DownloadDeadlineExceeded("deadline exceeded before request started")
+                with self.session.get(url, stream=True, timeout=min(self.timeout, remaining), headers=headers) as response:
+                    if entry and response.status_code == 304:
+                        self.cache.mark_hit(url, revalidated=True)
+                        add_counter("download.revalidated")
+                        return entry["path"]
+                    response.raise_for_status()
+                    save_path = self._target_path(url, response.headers.get("Content-Type"))
+                    size = self._stream_to_file(response, save_path, expires_at)
+                    add_counter("download.fetched")
+                    add_counter("download.bytes_fetched", size)
+                    if self.cache is not None:
+                        self.cache.store(url, save_path, response.headers.get("ETag"), response.headers.get("Last-Modified"), size)
+            return save_path
+        except Exception as e:
+            print(f"Error downloading image from {url}: {e}")
+            add_counter("download.errors")
+            # A stale copy beats no reference image at all
+            return entry["path"] if entry else None
+
+    def probe(self, url: str) -> Dict[str, Any]:
+        """
+        Check a URL without downloading it: a HEAD request, falling back to a one-byte
+        range GET when the server rejects HEAD or omits the content type. `ok` means it
+        answered with an image; Drive links to private files answer with an HTML page.
+        """
+        started = time.monotonic()
+        result: Dict[str, Any] = {"url": url, "ok": False, "status": None, "content_type": None, "size": None, "error": None}
+        try:
+            with self._host_slot(url):
+                response = self.session.head(url, allow_redirects=True, timeout=self.timeout)
+                if response.status_code >= 400 or not response.headers.get("Content-Type"):
+                    response.close()
+                    response = self.session.get(
+                        url, headers={"Range": "bytes=0-0"}, stream=True, allow_redirects=True, timeout=self.timeout
+                    )
+                with response:
+                    content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+                    result.update(status=response.status_code, content_type=content_type or None, size=response_size(response))
+            if result["status"] >= 400:
+                result["error"] = f"HTTP {result['status']}"
+            elif not content_type.startswith("image/"):
+                result["error"] = f"not an image ({content_type or 'no content type'})"
+            else:
+                result["ok"] = True
+        except requests.RequestException as e:
+            result["error"] = str(e)
+        result["elapsed_ms"] = round((time.monotonic() - started) * 1000, 1)
+        return result
+
+    def download(self, url: str) -> Optional[str]:
+        """Download a single URL, returning the local path or None on failure"""
+        with span("download", urls=1):
+            path = self._fetch(url, time.monotonic() + self.deadline)
+        if self.cache is not None:
+            self.cache.flush()
+        return path
+
+    def download_all(self, urls: List[str]) -> List[Optional[str]]:
+        """Download URLs concurrently; results keep the input order, None for failures"""
+        if not urls:
+            return []
+        expires_at = time.monotonic() + self.deadline
+        results: List[Optional[str]] = [None] * len(urls)
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        with span("download", urls=len(urls)) as attributes:
+            try:
+                # Workers run in the caller's context so their counters land on the current trace
+                futures = {executor.submit(run_in_context(self._fetch), url, expires_at): i for i, url in enumerate(urls)}
+                done, not_done = wait(futures, timeout=max(0.0, expires_at - time.monotonic()))
+                for future in done:
+                    results[futures[future]] = future.result()
+                for future in not_done:
+                    future.cancel()
+                    print(f"Download deadline exceeded for {urls[futures[future]]}")
+                attributes["timed_out"] = len(not_done)
+            finally:
+                # Running workers notice the deadline on their next chunk and clean up
+                executor.shutdown(wait=False, cancel_futures=True)
+        if self.cache is not None:
+            self.cache.flush()
+            print(f"Download cache: {self.cache.stats()}")
+        return results
+
+
+# Shared instance so every brief reuses the same connection pool
+_downloader_instance = None
+
+#@spaces.GPU
+def get_downloader() -> ImageDownloader:
+    """Get singleton instance of the downloader"""
+    global _downloader_instance
+    if _downloader_instance is None:
+        cache = DownloadCache(DOWNLOAD_DIR, ttl=DOWNLOAD_CACHE_TTL, max_bytes=DOWNLOAD_CACHE_MAX_BYTES, trim_grace=DOWNLOAD_CACHE_TRIM_GRACE)
+        _downloader_instance = ImageDownloader(cache=cache)
+    return _downloader_instance
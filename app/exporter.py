@@ -0,0 +1,203 @@
+import functools
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+from app.cache import ExportCache, text_digest
+from app.config import EXPORT_CACHE_DIR, EXPORT_CACHE_MAX_ENTRIES, EXPORT_PDF_WORKERS, EXPORT_PDF_TIMEOUT
+#import spaces
+
+# Bump when the rendered files change, so old cache entries are not reused
+EXPORT_VERSION = "1"
+
+BRIEF_CSS = """
+body {
+    font-family: Arial, sans-serif;
+    line-height: 1.6;
+    margin: 40px;
+    color: #333;
+}
+h1, h2, h3 {
+    color: #2c3e50;
+    margin-top: 30px;
+    margin-bottom: 15px;
+}
+h1 {
+    border-bottom: 2px solid #3498db;
+    padding-bottom: 10px;
+}
+p {
+    margin-bottom: 10px;
+}
+ul, ol {
+    margin-left: 20px;
+}
+table {
+    border-collapse: collapse;
+    width: 100%;
+    margin: 20px 0;
+}
+th, td {
+    border: 1px solid #ddd;
+    padding: 8px;
+    text-align: left;
+}
+th {
+    background-color: #f2f2f2;
+}
+code {
+    background-color: #f4f4f4;
+    padding: 2px 4px;
+    border-radius: 3px;
+}
+"""
+
+# Markdown formatting removed for the plain-text download, in order
+_PLAIN_TEXT_RULES = [
+    (re.compile(r'#+\s*'), ''),                 # headers
+    (re.compile(r'\*\*(.*?)\*\*'), r'\1'),      # bold
+    (re.compile(r'\*(.*?)\*'), r'\1'),          # italic
+    (re.compile(r'`(.*?)`'), r'\1'),            # code formatting
+]
+
+
+def markdown_to_text(content: str) -> str:
+    """Plain-text version of a brief"""
+    for pattern, replacement in _PLAIN_TEXT_RULES:
+        content = pattern.sub(replacement, content)
+    return content
+
+
+def _write_atomic(path: Union[str, Path], data: Union[str, bytes]):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data.encode("utf-8") if isinstance(data, str) else data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+# Markdown converters keep per-document state, so each export thread gets its own
+_converters = threading.local()
+
+
+def _markdown_converter():
+    if not hasattr(_converters, "markdown"):
+        import markdown
+        _converters.markdown = markdown.Markdown(extensions=['tables', 'fenced_code'])
+    return _converters.markdown
+
+
+# The stylesheet is parsed once and shared by every render
+@functools.lru_cache(maxsize=None)
+def _stylesheet():
+    from weasyprint import CSS
+    return CSS(string=BRIEF_CSS)
+
+
+def render_pdf(content: str, brand_name: str, pdf_path: str) -> str:
+    """Render a brief's Markdown to a PDF file (run on the export threads)"""
+    from weasyprint import HTML
+
+    html_content = _markdown_converter().reset().convert(content)
+    full_html = f"""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <meta charset="utf-8">
+        <title>Creative Brief - {brand_name}</title>
+    </head>
+    <body>
+        {html_content}
+    </body>
+    </html>
+    """
+    _write_atomic(pdf_path, HTML(string=full_html).write_pdf(stylesheets=[_stylesheet()]))
+    return pdf_path
+
+
+class ExportFiles:
+    """Download files for one brief: MD and TXT are ready at once, the PDF may still be rendering"""
+
+    def __init__(self, md_path: str, txt_path: str, pdf: Future):
+        self.md_path = md_path
+        self.txt_path = txt_path
+        self.pdf = pdf
+
+    def pdf_path(self, timeout: Optional[float] = EXPORT_PDF_TIMEOUT) -> Optional[str]:
+        """Wait for the PDF; None if it failed or is not ready within `timeout`"""
+        try:
+            return self.pdf.result(timeout=timeout)
+        except Exception as e:
+            print(f"Error creating PDF: {type(e).__name__}: {e}")
+            return None
+
+
+class BriefExporter:
+    """
+    Writes a brief's download files. Files are cached under a hash of the brief, so
+    downloading the same brief again is instant; the PDF renders on a background
+    thread, leaving the request thread free to hand out the MD and TXT straight away.
+    WeasyPrint does not touch CUDA, so it needs no process of its own.
+    """
+
+    def __init__(self, cache_dir: Union[str, Path] = EXPORT_CACHE_DIR, max_entries: int = EXPORT_CACHE_MAX_ENTRIES,
+                 pdf_workers: int = EXPORT_PDF_WORKERS):
+        self.cache = ExportCache(cache_dir, max_entries=max_entries)
+        self.pdf_workers = pdf_workers
+        self._pool = ThreadPoolExecutor(max_workers=pdf_workers, thread_name_prefix="pdf-export")
+        self._pending: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def export(self, content: str, brand_name: str) -> ExportFiles:
+        """Write (or reuse) the MD and TXT files and start the PDF"""
+        key = text_digest(content, brand_name, EXPORT_VERSION)
+        base_filename = f"{brand_name.lower().replace(' ', '_')}_brief"
+        export_dir = self.cache.dir_for(key)
+        md_path, txt_path, pdf_path = (str(export_dir / f"{base_filename}.{ext}") for ext in ("md", "txt", "pdf"))
+
+        with self._lock:
+            if key in self._pending:
+                return ExportFiles(md_path, txt_path, self._pending[key])
+            if self.cache.get(key) is not None and os.path.exists(pdf_path):
+                # Persist the refreshed last-used time so LRU order survives a restart
+                self.cache.flush()
+                done: Future = Future()
+                done.set_result(pdf_path)
+                return ExportFiles(md_path, txt_path, done)
+
+            export_dir.mkdir(parents=True, exist_ok=True)
+            _write_atomic(md_path, content)
+            _write_atomic(txt_path, markdown_to_text(content))
+            pdf = self._pool.submit(render_pdf, content, brand_name, pdf_path)
+            self._pending[key] = pdf
+        pdf.add_done_callback(lambda future: self._finish(key, future))
+        return ExportFiles(md_path, txt_path, pdf)
+
+    def _finish(self, key: str, future: Future):
+        with self._lock:
+            self._pending.pop(key, None)
+            if future.cancelled() or future.exception() is not None:
+                return
+            self.cache.put(key)
+            self.cache.flush()
+
+
+_exporter_instance = None
+_exporter_lock = threading.Lock()
+
+
+def get_exporter() -> BriefExporter:
+    """Get the singleton exporter for brief download files"""
+    global _exporter_instance
+    with _exporter_lock:
+        if _exporter_instance is None:
+            _exporter_instance = BriefExporter()
+        return _exporter_instance
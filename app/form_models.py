@@ -1,49 +1,235 @@
-from transformers import pipeline, AutoTokenizer, AutoModelForCausalLM, pipeline, set_seed
+from transformers import LogitsProcessorList, StoppingCriteriaList
 
 import re
-import torch
+import threading
+from collections import OrderedDict, deque
+from app.batching import MicroBatcher
+from app.config import (
+    PREFIX_CACHE_ENABLED, PREFIX_CACHE_MAX_ENTRIES,
+    HEADLINE_BATCHING_ENABLED, HEADLINE_MAX_BATCH_SIZE, HEADLINE_BATCH_WAIT_SECONDS,
+    HEADLINE_COUNT, HEADLINE_NUM_SEQUENCES, HEADLINE_MAX_NEW_TOKENS, HEADLINE_MAX_ATTEMPTS,
+    HEADLINE_CONSTRAINED_DECODING, HEADLINE_MAX_ITEM_TOKENS,
+)
+from app.decoding import NumberedItemsProcessor, StopWhenItemsComplete
+from app.prefix_cache import PrefixCache
+from models.registry import get_registry
 #import spaces
 
-# Use a more powerful model (make sure it's installed or use Hugging Face Inference API)
-generator = pipeline(
-    "text-generation",
-    model="google/gemma-3-1b-it",
-    torch_dtype=torch.bfloat16,
+# The Gemma pipeline is loaded by the model registry on the first headline request
+def get_headline_generator():
+    """Return the Gemma text-generation pipeline, loading it on first use"""
+    return get_registry().get("headline")
+
+# Headline regenerations repeat the same conversation, so keep its prefilled KV state
+_prefix_cache = None
+
+def _drop_prefix_cache():
+    global _prefix_cache
+    _prefix_cache = None
+
+get_registry().on_unload("headline", _drop_prefix_cache)
+
+def _format_constraints(generator, item_count):
+    """Generate kwargs forcing item_count '###Headline N.' then item_count '###Subheadline N.' lines"""
+    eos_token_id = generator.model.generation_config.eos_token_id
+    if eos_token_id is None:
+        eos_token_id = generator.tokenizer.eos_token_id
+    processor = NumberedItemsProcessor.for_kinds(
+        generator.tokenizer, ("Headline", "Subheadline"), item_count, eos_token_id, HEADLINE_MAX_ITEM_TOKENS
+    )
+    return dict(
+        logits_processor=LogitsProcessorList([processor]),
+        stopping_criteria=StoppingCriteriaList([StopWhenItemsComplete(processor)]),
+        max_new_tokens=processor.token_budget(),
+    )
+
+#@spaces.GPU
+def _generate_single(conversation, max_new_tokens, num_return_sequences=1, item_count=None):
+    """Sample replies to one conversation with the Gemma generator"""
+    global _prefix_cache
+    generator = get_headline_generator()
+    kwargs = dict(max_new_tokens=max_new_tokens)
+    if num_return_sequences > 1:
+        kwargs["do_sample"] = True
+    if item_count:
+        kwargs.update(_format_constraints(generator, item_count))
+    if PREFIX_CACHE_ENABLED:
+        if _prefix_cache is None or _prefix_cache.model is not generator.model:
+            _prefix_cache = PrefixCache(generator.model, generator.tokenizer, max_entries=PREFIX_CACHE_MAX_ENTRIES)
+        return _prefix_cache.generate_many(conversation, num_return_sequences=num_return_sequences, **kwargs)
+    result = generator([conversation], num_return_sequences=num_return_sequences, **kwargs)
+    return [sequence['generated_text'][-1]['content'] for sequence in result[0]]
+
+#@spaces.GPU
+def _generate_batch(requests):
+    """
+    Run queued (conversation, max_new_tokens, num_return_sequences, item_count) requests
+    through Gemma as one padded batch. The batcher only groups requests with the same item_count.
+    """
+    # A lone request keeps the prefix-cache path (repeat clicks reuse the prefilled prompt)
+    if len(requests) == 1:
+        return [_generate_single(*requests[0])]
+    generator = get_headline_generator()
+    generator.tokenizer.padding_side = "left"
+    num_return_sequences = max(request[2] for request in requests)
+    kwargs = dict(max_new_tokens=max(request[1] for request in requests))
+    if requests[0][3]:
+        kwargs.update(_format_constraints(generator, requests[0][3]))
+    print(f"Generating {len(requests)} headline requests as one batch")
+    results = generator(
+        [request[0] for request in requests],
+        batch_size=len(requests),
+        num_return_sequences=num_return_sequences,
+        do_sample=True,
+        **kwargs,
+    )
+    return [
+        [sequence['generated_text'][-1]['content'] for sequence in result[:request[2]]]
+        for result, request in zip(results, requests)
+    ]
+
+# Collects headline and subheadline requests from every session into shared batches
+_batcher = None
+
+def get_headline_batcher():
+    """Return the micro-batcher in front of the Gemma generator, starting it on first use"""
+    global _batcher
+    if _batcher is None:
+        _batcher = MicroBatcher(
+            _generate_batch,
+            max_batch_size=HEADLINE_MAX_BATCH_SIZE,
+            max_wait_seconds=HEADLINE_BATCH_WAIT_SECONDS,
+            max_concurrency=1,
+            key_fn=lambda request: request[3],
+            name="headline-batcher",
+        )
+    return _batcher
+
+#@spaces.GPU
+def generate_replies(conversation, max_new_tokens, num_return_sequences=1, item_count=None):
+    """
+    Sample num_return_sequences replies to one conversation, batched with concurrent requests.
+    With item_count, decoding is constrained to item_count headlines and subheadlines.
+    """
+    request = (conversation, max_new_tokens, num_return_sequences, item_count)
+    if HEADLINE_BATCHING_ENABLED:
+        return get_headline_batcher().submit(request).result()
+    return _generate_single(*request)
+
+
+HEADLINE_KINDS = ("headline", "subheadline")
+
+# "###Headline 1. text", "### Subheadline 2: text", "**Sub-headline 3.** text", ...
+_ITEM_PATTERN = re.compile(
+    r'^[#*\s]*(sub[\s-]?headline|headline)\s*(\d+)\s*[.:)\-]\s*\**\s*(.+?)\s*\**\s*$',
+    re.IGNORECASE,
 )
 
-import re
+
+class HeadlineParseError(ValueError):
+    """Raised when generated text contains none of the requested items"""
+
+
+def parse_headline_output(text):
+    """
+    Parse '###Headline N. <text>' / '###Subheadline N. <text>' lines into
+    {"headline": [...], "subheadline": [...]}, in order and without duplicates.
+    Raises HeadlineParseError instead of returning nothing.
+    """
+    items = {kind: [] for kind in HEADLINE_KINDS}
+    for line in text.splitlines():
+        match = _ITEM_PATTERN.match(line)
+        if not match:
+            continue
+        kind = "headline" if match.group(1).lower() == "headline" else "subheadline"
+        item = match.group(3).strip().strip('"\'“”').strip()
+        if item and item.lower() not in (existing.lower() for existing in items[kind]):
+            items[kind].append(item)
+    if not any(items.values()):
+        preview = text.strip()[:80].replace("\n", " ")
+        raise HeadlineParseError(f"No headline or subheadline lines in generated text: {preview!r}")
+    return items
+
+
+def build_headline_conversation(brand_name, angle_description, count):
+    """One conversation asking for `count` headlines and `count` subheadlines in a fixed format"""
+    headline_lines = "\n".join(f"###Headline {i}. <headline>" for i in range(1, count + 1))
+    subheadline_lines = "\n".join(f"###Subheadline {i}. <subheadline>" for i in range(1, count + 1))
+    return [
+        {
+            "role": "system",
+            "content": (
+                "You are a professional writer specializing in creating engaging headlines for advertisements. "
+                "Your task is to generate compelling headlines and subheadlines for given brands in the tone "
+                "specified that capture attention and drive clicks. Respond only with lines in exactly this "
+                "format and no explanations:\n"
+                f"{headline_lines}\n{subheadline_lines}"
+            ),
+        },
+        {
+            "role": "user",
+            "content": (
+                f"Generate {count} compelling Facebook ad headlines and {count} persuasive subheadlines "
+                f"for '{brand_name}' based on this angle: {angle_description}"
+            ),
+        },
+    ]
+
 #@spaces.GPU
-def clean_generated_text(text, original_prompt):
-    """Extract actual subheadline text from generated content, including markdown-style and bolded formats."""
-    if original_prompt in text:
-        text = text.replace(original_prompt, "").strip()
-
-    lines = [line.strip() for line in text.split('\n') if line.strip()]
-    subheadlines = []
-
-    for line in lines:
-        # Match: * **subheadline text**
-        bold_match = re.search(r'\*\*\s*(.*?)\s*\*\*', line)
-
-        # Match: ###SubheadlineX: subheadline text
-        hash_match = re.search(r'^#+Subheadline\d*:\s*(.+)', line, re.IGNORECASE)
-        hash_headline_match = re.search(r'^#+Headline\d*:\s*(.+)', line, re.IGNORECASE)
-        hash_headline_match2= re.search(r'^#+\s*Headline\s*\d*\.\s*(.+)', line, re.IGNORECASE)
-        hash_subheadline_match2= re.search(r'^#+\s*Subheadline\s*\d*\.\s*(.+)', line, re.IGNORECASE)
-        numbered_match = re.search(r'^\d+\.\s*(.+)', line)
-        if bold_match:
-            subheadlines.append(bold_match.group(1).strip())
-        elif hash_match:
-            subheadlines.append(hash_match.group(1).strip())
-        elif hash_headline_match:
-            subheadlines.append(hash_headline_match.group(1).strip())
-        elif hash_headline_match2:
-            subheadlines.append(hash_headline_match2.group(1).strip())
-        elif numbered_match:
-            subheadlines.append(numbered_match.group(1).strip())
-        elif hash_subheadline_match2:
-            subheadlines.append(hash_subheadline_match2.group(1).strip())
-    return subheadlines
+def generate_headline_sets(brand_name, angle_description, count=HEADLINE_COUNT, num_sequences=HEADLINE_NUM_SEQUENCES):
+    """
+    Sample num_sequences combined headline/subheadline sets in one generate call.
+    Returns the parsed sets (unparseable sequences are dropped); raises
+    HeadlineParseError if no sequence parses within HEADLINE_MAX_ATTEMPTS calls.
+    With constrained decoding every sequence parses, so the first call succeeds.
+    """
+    conversation = build_headline_conversation(brand_name, angle_description, count)
+    item_count = count if HEADLINE_CONSTRAINED_DECODING else None
+    for attempt in range(HEADLINE_MAX_ATTEMPTS):
+        texts = generate_replies(conversation, HEADLINE_MAX_NEW_TOKENS, num_sequences, item_count)
+        sets = []
+        for text in texts:
+            try:
+                items = parse_headline_output(text)
+            except HeadlineParseError as e:
+                print(f"Discarding headline sequence: {e}")
+                continue
+            sets.append({kind: values[:count] for kind, values in items.items()})
+        if sets:
+            return sets
+        print(f"Attempt {attempt + 1}: none of {len(texts)} sequences parsed")
+    raise HeadlineParseError(f"No parseable headlines after {HEADLINE_MAX_ATTEMPTS} attempts")
+
+
+# Sets sampled for a (brand, angle) but not shown yet. One generate call yields
+# headlines and subheadlines for several clicks of either button; each kind keeps at
+# most one call's worth, so spares of the button nobody clicks do not pile up.
+_unused_sets = OrderedDict()
+_unused_sets_lock = threading.Lock()
+_UNUSED_SETS_MAX_KEYS = 32
+
+def _take_items(kind, brand_name, angle_description):
+    """Next unseen list of `kind` items for the brand and angle, generating more sets when none are left"""
+    key = (brand_name, angle_description)
+    with _unused_sets_lock:
+        pool = _unused_sets.get(key)
+        if pool and pool[kind]:
+            _unused_sets.move_to_end(key)
+            return pool[kind].popleft()
+
+    sets = generate_headline_sets(brand_name, angle_description)
+    with _unused_sets_lock:
+        pool = _unused_sets.setdefault(key, {k: deque(maxlen=HEADLINE_NUM_SEQUENCES) for k in HEADLINE_KINDS})
+        _unused_sets.move_to_end(key)
+        for items in sets:
+            for k in HEADLINE_KINDS:
+                if items[k]:
+                    pool[k].append(items[k])
+        while len(_unused_sets) > _UNUSED_SETS_MAX_KEYS:
+            _unused_sets.popitem(last=False)
+        if not pool[kind]:
+            raise HeadlineParseError(f"Generated output had no {kind}s")
+        return pool[kind].popleft()
 
 #@spaces.GPU
 def generate_headlines(brand_name, angle_description):
@@ -52,52 +238,11 @@ def generate_headlines(brand_name, angle_description):
         if not brand_name or not angle_description:
             return [["Please provide brand name and angle description"]]
         
-        prompt = (
-            f"Generate 3 compelling Facebook ad headlines for '{brand_name}' "
-            f"based on this angle: {angle_description}\n\n"
-            f"Headlines:\n"
-        )
+        headlines = _take_items("headline", brand_name, angle_description)
+        print(f"Headlines: {headlines}")
         
-        messages = [
-            [
-                {
-                    "role": "system",
-                    "content": "You are a professional writer specializing in creating engaging and engaging headlines for advertisements. Your task is to generate compelling headlines for given brands in the tone specified that capture attention and drive clicks. You will give the response like ###Headline 1. <Headline>, ### Headline 2. <Headline> and no explanations, just the headlines one by one."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                },
-            ],
-        ]
-        
-        retries = 5
-        for attempt in range(retries):
-            try:
-                # Generate text
-                result = generator(messages, max_new_tokens=500)
-                result = result[0][0]['generated_text'][-1]['content']
-                
-                print('Result for headlines:', result)
-                
-                # Clean and extract headlines
-                headlines = clean_generated_text(result, prompt)
-                
-                print(f"Cleaned headlines: {headlines}")
-                
-                # Ensure we have exactly 3 headlines, pad with empty strings if needed
-                headlines = headlines[:3]
-                
-                # Format for Gradio dataframe: each headline as a separate row
-                formatted_headlines = [[headline] for headline in headlines if headline]
-                
-                print(f"Formatted headlines: {formatted_headlines}")
-                
-                return formatted_headlines if formatted_headlines else [["No headlines generated"]]
-            except Exception as e:
-                print(f"Attempt {attempt + 1} failed: {e}")
-                if attempt == retries - 1:
-                    raise
+        # Format for Gradio dataframe: each headline as a separate row
+        return [[headline] for headline in headlines]
         
     except Exception as e:
         print(f"Error generating headlines: {e}")
@@ -109,53 +254,11 @@ def generate_subheadlines(brand_name, angle_description):
         if not brand_name or not angle_description:
             return [["Please provide brand name and angle description"]]
         
-        prompt = (
-            f"Generate persuasive Facebook ad subheadlines for '{brand_name}' "
-            f"based on this angle: {angle_description}\n\n"
-            f"Subheadlines:\n"
-            f"1. "
-        )
-        
-        subheadlines_messages = [
-            [
-                {
-                    "role": "system",
-                    "content": "You are a professional writer specializing in creating engaging and engaging headlines for advertisements. Your task is to generate compelling subheadlines for given brands in the tone specified that capture attention and drive clicks. You will give the response like ###SubHeadline 1. <SubHeadline>, ###SubHeadline 2. <SubHeadline> and no explanations, just the headlines one by one."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                },
-            ],
-        ]
+        subheadlines = _take_items("subheadline", brand_name, angle_description)
+        print(f"Subheadlines: {subheadlines}")
         
-        retries = 5
-        for attempt in range(retries):
-            try:
-                # Generate text
-                result = generator(subheadlines_messages, max_new_tokens=600)
-                result = result[0][0]['generated_text'][-1]['content']
-                
-                print(f"Raw generated text: {result}")
-                
-                # Clean and extract subheadlines
-                subheadlines = clean_generated_text(result, prompt)
-                
-                print(f"Cleaned subheadlines: {subheadlines}")
-                
-                # Ensure we have exactly 2 subheadlines, pad with empty strings if needed
-                subheadlines = subheadlines[:3]
-                
-                # Format for Gradio dataframe: each subheadline as a separate row
-                formatted_subheadlines = [[subheadline] for subheadline in subheadlines if subheadline]
-                
-                print(f"Formatted subheadlines: {formatted_subheadlines}")
-                
-                return formatted_subheadlines if formatted_subheadlines else [["No subheadlines generated"]]
-            except Exception as e:
-                print(f"Attempt {attempt + 1} failed: {e}")
-                if attempt == retries - 1:
-                    raise
+        # Format for Gradio dataframe: each subheadline as a separate row
+        return [[subheadline] for subheadline in subheadlines]
         
     except Exception as e:
         print(f"Error generating subheadlines: {e}")
@@ -1,137 +1,223 @@
-from transformers import pipeline, LlavaForConditionalGeneration, AutoProcessor, AutoModelForVision2Seq
-from transformers.image_utils import load_image
-from typing import List, Optional, Dict, Any
+from transformers import TextIteratorStreamer, StoppingCriteriaList
+from typing import List, Optional, Dict, Any, Iterator, Tuple
 import os
+import threading
 from PIL import Image
 import torch
-from app.config import VLM_MODEL_NAME, LLM_MODEL_NAME, MAX_NEW_TOKENS
+from app.config import (
+    VLM_MODEL_NAME, LLM_MODEL_NAME, MAX_NEW_TOKENS,
+    VLM_DESCRIPTION_PROMPT, VLM_MAX_NEW_TOKENS, VLM_BATCH_SIZE,
+    VLM_CACHE_DIR, VLM_CACHE_MAX_ENTRIES,
+    BRIEF_GENERATION_MODE, BRIEF_GROUP_SIZE, LLM_BATCH_SIZE, PER_BRIEF_MAX_NEW_TOKENS,
+    PREFIX_CACHE_ENABLED, PREFIX_CACHE_MAX_ENTRIES,
+    BRIEF_STOP_ON_COMPLETION, BRIEF_STOP_ON_REPETITION,
+)
+from app.cache import DescriptionCache, file_digest
+from app.decoding import StopOnEvent, BriefCompletionCriteria, RepetitionCriteria, brief_token_budget
+from app.prefix_cache import PrefixCache
+from app.visual_parser import VisualParser
 from app.prompts import PromptBuilder
+from app.telemetry import span, add_counter, run_in_context, GenerationTimer
 from app.io import process_swipe_csv, prepare_reference_images, extract_image_urls_from_csv
+from models.registry import ModelRegistry, ModelLoadError, get_registry
 import traceback
 #import spaces
 
 class CreativeBriefGenerator:
+    DESCRIPTION_FAILED = "Failed to generate image description."
+
     #@spaces.GPU
-    def __init__(self):
-        """Initialize the vision-language model pipeline"""
+    def __init__(self, registry: Optional[ModelRegistry] = None):
+        """Set up the generator; models come from the registry and load on first use"""
+        self.registry = registry or get_registry()
         self.vlm_model_name = VLM_MODEL_NAME
         self.llm_model_name = LLM_MODEL_NAME
-        self.llm_pipe = None
         self.max_tokens = MAX_NEW_TOKENS
-        self.vlm_processor = None
+        self.vlm_batch_size = VLM_BATCH_SIZE
+        self.vlm_max_new_tokens = VLM_MAX_NEW_TOKENS
+        self.generation_mode = BRIEF_GENERATION_MODE
+        self.prefix_cache = None
+        self.description_cache = DescriptionCache(VLM_CACHE_DIR, VLM_CACHE_MAX_ENTRIES)
+        self.visual_parser = VisualParser()
         self.model = None
-        self._load_model()
-        
-    #@spaces.GPU
-    def _load_model(self):
-        """Load the LLaVA model and processor"""
-        try:
-            device = "cuda" if torch.cuda.is_available() else "cpu"
-            print(f"Loading {self.vlm_model_name} on {device}...")
-            
-            # Load processor and model separately for better control
-            DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
-            self.vlm_model = AutoModelForVision2Seq.from_pretrained(
-                self.vlm_model_name,
-                torch_dtype=torch.float16,
-                #device_map="auto",
-                #_attn_implementation="flash_attention_2" if DEVICE == "cuda" else "eager"
-            ).to(DEVICE)
-            self.vlm_processor = AutoProcessor.from_pretrained(self.vlm_model_name)
-            # if device == "cpu":
-            #     self.model = self.model.to(device)                
-            print("VLM Model loaded successfully!")
-        except Exception as e:
-            print(f"Error loading model: {e}")  
-            # Fallback to a text-only model if vision model fails
-            self._load_fallback_model()
-            
+        # Cached KV state pins the Llama weights; drop it when the registry evicts them
+        self.registry.on_unload("llm", self._drop_prefix_cache)
+
+    @property
+    def vlm_model(self):
+        """SmolVLM model, loaded on first use"""
+        return self.registry.get("vlm")[0]
+
+    @property
+    def vlm_processor(self):
+        """SmolVLM processor, loaded on first use"""
+        return self.registry.get("vlm")[1]
+
+    @property
+    def llm_pipe(self):
+        """Llama pipeline, loaded on first use; None (with the fallback loaded) if it cannot load"""
         try:
-            print(f"Loading {self.llm_model_name} for text generation...")
-            self.llm_pipe = pipeline(
-                "text-generation",
-                model=self.llm_model_name,
-                max_new_tokens=self.max_tokens,
-                do_sample=True,
-                temperature=0.7,
-            )
-            print("Text generation model loaded successfully!")
-        except Exception as e:
-            print(f"Error loading model: {e}")  
-            # Fallback to a text-only model if vision model fails
+            return self.registry.get("llm")
+        except ModelLoadError as e:
+            print(f"Error loading model: {e}")
             self._load_fallback_model()
+            return None
+
     #@spaces.GPU
     def _load_fallback_model(self):
-        """Load a fallback text-only model if vision model fails"""
+        """Load a fallback text-only model if the Llama model fails"""
+        if hasattr(self, 'pipe'):
+            return
         try:
-            print("Loading fallback text-generation model...")
-            self.pipe = pipeline(
-                "text-generation",
-                model="microsoft/DialoGPT-medium",
-                max_new_tokens=self.max_tokens,
-                do_sample=True,
-                temperature=0.4
-            )
+            self.pipe = self.registry.get("fallback")
             self.model = None  # Signal that we're using fallback
-            print("Fallback model loaded successfully!")
         except Exception as e:
             print(f"Error loading fallback model: {e}")
             raise
+
+    def _drop_prefix_cache(self):
+        self.prefix_cache = None
         
     #@spaces.GPU    
-    def _get_image_description(self, image_paths: str) -> str:
+    def _get_image_descriptions(self, image_paths: List[str]) -> List[str]:
+        """
+        Describe every reference image, batching them through the VLM in bounded-size chunks.
+        Uncached images are prepared in a thread pool and each batch goes to the VLM as
+        soon as enough of them are ready, so preparation overlaps generation.
+        """
+        descriptions: List[Optional[str]] = [None] * len(image_paths)
+        cache_keys: Dict[int, str] = {}
+        # Each file is hashed once, for both the description and the prepared-image cache
+        digests: List[Optional[str]] = [None] * len(image_paths)
+
+        # Serve repeat images from the description cache
+        for i, path in enumerate(image_paths):
+            try:
+                digests[i] = file_digest(path)
+                cache_keys[i] = self.description_cache.make_key(path, self.vlm_model_name, VLM_DESCRIPTION_PROMPT, digests[i])
+            except Exception as e:
+                print(f"Error hashing image {path}: {e}")
+                continue
+            descriptions[i] = self.description_cache.get(cache_keys[i])
+
+        pending = [i for i, description in enumerate(descriptions) if description is None]
+        add_counter("vlm.cache_hits", len(image_paths) - len(pending))
+        add_counter("vlm.cache_misses", len(pending))
+
+        def describe(batch: List[Tuple[int, Optional[str]]], described: int):
+            print(f"Describing images {described + 1}-{described + len(batch)} of {len(pending)} uncached")
+            batch_descriptions = self._describe_image_batch(
+                [image_paths[i] for i, _ in batch], prepared_paths=[prepared for _, prepared in batch]
+            )
+            for (i, _), description in zip(batch, batch_descriptions):
+                descriptions[i] = description
+                if i in cache_keys and description != self.DESCRIPTION_FAILED:
+                    self.description_cache.put(cache_keys[i], description)
+
+        batch: List[Tuple[int, Optional[str]]] = []
+        described = 0
+        if pending:
+            ready = self.visual_parser.prepare_many(
+                [image_paths[i] for i in pending], self._vlm_image_side(), [digests[i] for i in pending]
+            )
+            for index, prepared in ready:
+                add_counter("image_prep.failed", int(prepared is None))
+                batch.append((pending[index], prepared))
+                if len(batch) == self.vlm_batch_size:
+                    describe(batch, described)
+                    described += len(batch)
+                    batch = []
+        if batch:
+            describe(batch, described)
+
+        self.visual_parser.flush()
+        self.description_cache.flush()
+        print(f"Description cache: {self.description_cache.stats()}")
+        return descriptions
+
+    def _vlm_image_side(self) -> Optional[int]:
+        """Longest edge the VLM processor resizes images to, when it says"""
+        size = getattr(getattr(self.vlm_processor, "image_processor", None), "size", None) or {}
+        return size.get("longest_edge")
+
+    #@spaces.GPU
+    def _describe_image_batch(self, image_paths: List[str], prepared_paths: Optional[List[Optional[str]]] = None) -> List[str]:
+        """
+        Run one padded SmolVLM generate call over a batch of images. `prepared_paths` are
+        their preprocessed copies from the visual parser (None where preparation failed);
+        without them the images are prepared here.
+        """
+        descriptions = [self.DESCRIPTION_FAILED] * len(image_paths)
+
+        # Load what we can, downscaled to what the processor will use; a broken file should not sink the whole batch
+        images, batch_index = [], []
+        max_side = self._vlm_image_side()
+        for i, path in enumerate(image_paths):
+            try:
+                if prepared_paths is None:
+                    images.append(self.visual_parser.prepare(path, max_side))
+                elif prepared_paths[i] is not None:
+                    images.append(self.visual_parser.load(prepared_paths[i]))
+                else:
+                    continue
+                batch_index.append(i)
+            except Exception as e:
+                print(f"Error loading image {path}: {e}")
+        if not images:
+            return descriptions
+
         try:
             DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
-            primary_image_path = image_paths[0] if image_paths else None
-            print(f"Primary image path: {primary_image_path}")            
-            
-            image = load_image(primary_image_path)
-            print(image)
-
             conversation = [
                 {
                     "role": "user",
                     "content": [
                         {"type": "image"},
-                        {"type": "text", "text": "Give a brief 5-10 line description of this image, including any relevant context or information that can help in generating a creative brief."},
+                        {"type": "text", "text": VLM_DESCRIPTION_PROMPT},
                     ],
                 },
             ]
-
             prompt = self.vlm_processor.apply_chat_template(conversation, add_generation_prompt=True)
-            print(f"Processed prompt: {prompt}")
-            
-            inputs = self.vlm_processor(images=[image], text=prompt, return_tensors="pt").to(DEVICE)
-
-            output = self.vlm_model.generate(
-                **inputs,
-                max_new_tokens=1000,
-            )
 
-            generated_text = self.vlm_processor.batch_decode(output, skip_special_tokens=True)[0]
-            print(f"Generated description: {generated_text}")
+            # One prompt per image; left padding keeps the generated tokens aligned at the end
+            inputs = self.vlm_processor(
+                images=[[image] for image in images],
+                text=[prompt] * len(images),
+                padding=True,
+                return_tensors="pt",
+            ).to(DEVICE)
 
-            # Clean up: strip any user/assistant role text
-            if "Assistant:" in generated_text:
-                # Only keep the text after "Assistant:"
-                generated_text = generated_text.split("Assistant:", 1)[-1].strip()
+            with span("vlm", images=len(images)):
+                output = self.vlm_model.generate(
+                    **inputs,
+                    max_new_tokens=self.vlm_max_new_tokens,
+                    streamer=GenerationTimer(
+                        "vlm",
+                        pad_token_id=self.vlm_processor.tokenizer.pad_token_id,
+                        prompt_tokens=int(inputs["attention_mask"].sum()),
+                    ),
+                )
 
-            return generated_text
+            # Decode only the newly generated tokens of each row
+            prompt_length = inputs["input_ids"].shape[1]
+            generated_texts = self.vlm_processor.batch_decode(output[:, prompt_length:], skip_special_tokens=True)
 
-        except Exception as e:
-            print(f"Error in generating image description: {e}")
-            return "Failed to generate image description."
+            for i, generated_text in zip(batch_index, generated_texts):
+                # Clean up: strip any user/assistant role text
+                if "Assistant:" in generated_text:
+                    generated_text = generated_text.split("Assistant:", 1)[-1]
+                descriptions[i] = generated_text.strip()
+                print(f"Generated description for {image_paths[i]}: {descriptions[i]}")
 
-        
         except Exception as e:
-            print(f"Error generating image description: {e}")
+            print(f"Error generating image descriptions: {e}")
             print("Traceback:")
             print(traceback.format_exc())
-            return "Error generating image description"
-        
+
+        return descriptions
         
     #@spaces.GPU
-    def generate_creative_briefs(
+    def _prepare_user_prompt(
         self,
         brand_name: str,
         product_name: str,
@@ -140,7 +226,6 @@ class CreativeBriefGenerator:
         tone: str,
         angle_description: str,
         user_template_path: str,
-        system_template_path: str,
         csv_df=None,
         uploaded_images=None,
         headlines: Optional[List[str]] = None,
@@ -152,9 +237,10 @@ class CreativeBriefGenerator:
         num_image_briefs: int = 10,
         num_video_briefs: int = 10,
         **kwargs
-    ) -> str:
+    ) -> Tuple[str, List[str], Optional[Dict[str, Any]]]:
         """
-        Generate creative briefs using vision-language model with images and text.
+        Gather reference images, describe them and build the user prompt.
+        Returns the prompt, the local reference image paths and the builder's trim report.
         """
         
         # Process CSV data
@@ -162,21 +248,93 @@ class CreativeBriefGenerator:
         reference_image_paths = []
         
         if csv_df is not None:
-            csv_text = process_swipe_csv(csv_df)
-            csv_image_urls = extract_image_urls_from_csv(csv_df)
+            with span("csv_process", rows=len(csv_df)):
+                csv_text = process_swipe_csv(csv_df)
+                csv_image_urls = extract_image_urls_from_csv(csv_df)
             reference_image_paths = prepare_reference_images(uploaded_images, csv_image_urls)
         elif uploaded_images:
             reference_image_paths = prepare_reference_images(uploaded_images, [])
-        image_description = self._get_image_description(reference_image_paths) if reference_image_paths else ""
-        # Build the text prompt
-        prompt_builder = PromptBuilder(user_template_path)
-        user_text_prompt = prompt_builder.build_prompt(
+        add_counter("reference_images", len(reference_image_paths))
+        image_descriptions = self._get_image_descriptions(reference_image_paths) if reference_image_paths else []
+        # Build the text prompt, fitted to the token budget with the LLM's tokenizer
+        with span("prompt_build"):
+            prompt_builder = PromptBuilder(user_template_path, tokenizer=self._prompt_tokenizer())
+            user_text_prompt = prompt_builder.build_prompt(
+                brand_name=brand_name,
+                product_name=product_name,
+                website_url=website_url,
+                target_audience=target_audience,
+                tone=tone,
+                angle_description=angle_description,
+                headlines=headlines,
+                subheadlines=subheadlines,
+                benefits=benefits,
+                social_proof=social_proof,
+                content_bank=content_bank,
+                angle_and_benefits=angle_and_benefits,
+                num_image_briefs=num_image_briefs,
+                num_video_briefs=num_video_briefs,
+                csv_data=csv_text,
+                reference_image_description=image_descriptions
+            )
+        prompt_report = prompt_builder.last_report
+        if prompt_report:
+            add_counter("prompt.tokens", prompt_report["tokens"])
+            add_counter("prompt.dropped_items", sum(prompt_report["dropped"].values()))
+        return user_text_prompt, reference_image_paths, prompt_report
+
+    def _prompt_tokenizer(self):
+        """Tokenizer of the model the prompt will be sent to, for token budgeting"""
+        llm_pipe = self.llm_pipe
+        if llm_pipe is not None:
+            return llm_pipe.tokenizer
+        return getattr(getattr(self, 'pipe', None), 'tokenizer', None)
+
+    def _load_system_prompt(self, system_template: str) -> str:
+        """Read the system prompt from its template file (or accept the text itself)"""
+        if system_template and os.path.isfile(system_template):
+            with open(system_template, "r", encoding="utf-8") as f:
+                return f.read()
+        return system_template
+
+    #@spaces.GPU
+    def generate_creative_briefs(
+        self,
+        brand_name: str,
+        product_name: str,
+        website_url: str,
+        target_audience: str,
+        tone: str,
+        angle_description: str,
+        user_template_path: str,
+        system_template_path: str,
+        csv_df=None,
+        uploaded_images=None,
+        headlines: Optional[List[str]] = None,
+        subheadlines: Optional[List[str]] = None,
+        benefits: Optional[List[str]] = None,
+        social_proof: Optional[List[str]] = None,
+        content_bank: Optional[List[str]] = None,
+        angle_and_benefits: Optional[str] = None,
+        num_image_briefs: int = 10,
+        num_video_briefs: int = 10,
+        prompt_report: Optional[Dict[str, Any]] = None,
+        **kwargs
+    ) -> str:
+        """
+        Generate creative briefs using vision-language model with images and text.
+        A `prompt_report` dict, if given, is filled with this call's prompt size and trimmed items.
+        """
+        user_text_prompt, reference_image_paths, report = self._prepare_user_prompt(
             brand_name=brand_name,
             product_name=product_name,
             website_url=website_url,
             target_audience=target_audience,
             tone=tone,
             angle_description=angle_description,
+            user_template_path=user_template_path,
+            csv_df=csv_df,
+            uploaded_images=uploaded_images,
             headlines=headlines,
             subheadlines=subheadlines,
             benefits=benefits,
@@ -185,43 +343,285 @@ class CreativeBriefGenerator:
             angle_and_benefits=angle_and_benefits,
             num_image_briefs=num_image_briefs,
             num_video_briefs=num_video_briefs,
-            csv_data=csv_text,
-            reference_image_description=image_description
         )
+        if prompt_report is not None and report:
+            prompt_report.update(report)
         
         # Generate briefs using the model
-        if reference_image_paths and self.llm_pipe is not None:
+        if self.generation_mode == "per_brief" and self.llm_pipe is not None:
+            result = ""
+            for result in self._iter_per_brief(user_text_prompt, system_template_path, num_image_briefs, num_video_briefs):
+                pass
+            return result
+        elif reference_image_paths and self.llm_pipe is not None:
             # Use vision model with images
             print(f"Generating briefs with images: {reference_image_paths}")
-            return self._generate_with_images(user_text_prompt, system_template_path, reference_image_paths)
+            return self._generate_with_images(
+                user_text_prompt, system_template_path, reference_image_paths, num_image_briefs, num_video_briefs
+            )
         else:
             # Use text-only generation (fallback or no images)
-            return self._generate_text_only(user_text_prompt)
+            return self._generate_text_only(user_text_prompt, num_image_briefs, num_video_briefs)
+
+    #@spaces.GPU
+    def stream_creative_briefs(
+        self, system_template_path: str, prompt_report: Optional[Dict[str, Any]] = None, **brief_kwargs
+    ) -> Iterator[str]:
+        """
+        Streaming variant of generate_creative_briefs (same arguments).
+        Yields the brief text accumulated so far as tokens are decoded. Closing the
+        iterator (e.g. the user pressed Stop) halts generation and frees the GPU.
+        """
+        user_text_prompt, reference_image_paths, report = self._prepare_user_prompt(**brief_kwargs)
+        if prompt_report is not None and report:
+            prompt_report.update(report)
+        num_image_briefs = brief_kwargs.get("num_image_briefs", 10)
+        num_video_briefs = brief_kwargs.get("num_video_briefs", 10)
+
+        if self.generation_mode == "per_brief" and self.llm_pipe is not None:
+            # Briefs arrive a batch at a time rather than token by token
+            yield from self._iter_per_brief(user_text_prompt, system_template_path, num_image_briefs, num_video_briefs)
+            return
+
+        if self.llm_pipe is None:
+            # Fallback pipeline has no streaming path; deliver the result in one piece
+            yield self._generate_text_only(user_text_prompt, num_image_briefs, num_video_briefs)
+            return
+
+        llm_message = [
+            {"role": "system", "content": self._load_system_prompt(system_template_path)},
+            {"role": "user", "content": user_text_prompt},
+        ]
+        streamer = TextIteratorStreamer(self.llm_pipe.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        stop_event = threading.Event()
+        errors = []
+
+        def run_generation():
+            try:
+                self._llm_generate(
+                    llm_message,
+                    temperature=0.7,
+                    streamer=streamer,
+                    **self._brief_limits(
+                        self.llm_pipe.tokenizer,
+                        [(num_image_briefs, num_video_briefs)],
+                        self._prompt_length(self.llm_pipe.tokenizer, [llm_message]),
+                        [StopOnEvent(stop_event)],
+                    ),
+                )
+            except Exception as e:
+                print(f"Error during streaming generation: {e}")
+                print(traceback.format_exc())
+                errors.append(e)
+                # Unblock the consumer; end() is a no-op if generate already called it
+                streamer.end()
+
+        worker = threading.Thread(target=run_in_context(run_generation), daemon=True)
+        worker.start()
+        generated_text = ""
+        try:
+            for new_text in streamer:
+                generated_text += new_text
+                yield generated_text
+        finally:
+            stop_event.set()
+            worker.join()
+
+        if errors:
+            yield f"{generated_text}\n\nError during generation: {errors[0]}"
     
     
+    def _prompt_length(self, tokenizer, prompts: List[Any]) -> int:
+        """Width of the input ids generate() gets for these chats or texts (left-padded to the longest)"""
+        return max(
+            len(tokenizer.apply_chat_template(prompt, add_generation_prompt=True)) if isinstance(prompt, list)
+            else len(tokenizer(prompt)["input_ids"])
+            for prompt in prompts
+        )
+
+    def _brief_limits(
+        self, tokenizer, targets: List[Tuple[int, int]], prompt_length: int, extra_criteria: Optional[List] = None
+    ) -> Dict[str, Any]:
+        """
+        max_new_tokens and stopping criteria for a generate call whose rows should hold
+        the given (image, video) brief counts, on inputs prompt_length tokens wide. The budget
+        scales with the counts (capped at self.max_tokens); decoding ends early once every
+        brief is written or a row loops.
+        """
+        criteria = list(extra_criteria or [])
+        if BRIEF_STOP_ON_COMPLETION:
+            criteria.append(BriefCompletionCriteria(tokenizer, targets, prompt_length))
+        if BRIEF_STOP_ON_REPETITION:
+            criteria.append(RepetitionCriteria(tokenizer, prompt_length))
+        max_new_tokens = max(brief_token_budget(image, video, cap=self.max_tokens) for image, video in targets)
+        return dict(max_new_tokens=max_new_tokens, stopping_criteria=StoppingCriteriaList(criteria))
+
+    def _assignment_target(self, assignment: Dict[str, Any]) -> Tuple[int, int]:
+        """(image, video) brief counts one assignment's response should hold"""
+        count = assignment["last"] - assignment["first"] + 1
+        return (count, 0) if assignment["kind"] == "Image" else (0, count)
+
+    def _brief_assignments(self, num_image_briefs: int, num_video_briefs: int) -> List[Dict[str, Any]]:
+        """Split the requested briefs into ordered groups of at most BRIEF_GROUP_SIZE"""
+        assignments = []
+        for kind, total in (("Image", num_image_briefs), ("Video", num_video_briefs)):
+            for first in range(1, total + 1, BRIEF_GROUP_SIZE):
+                last = min(first + BRIEF_GROUP_SIZE - 1, total)
+                assignments.append({"kind": kind, "first": first, "last": last, "total": total})
+        return assignments
+
+    def _assignment_instruction(self, assignment: Dict[str, Any]) -> str:
+        """The per-brief suffix appended to the shared user prompt"""
+        kind, first, last, total = assignment["kind"], assignment["first"], assignment["last"], assignment["total"]
+        if first == last:
+            which = f"{kind} Brief {first} of {total}"
+        else:
+            which = f"{kind} Briefs {first} to {last} of {total}"
+        return (
+            f"\n\nYOUR ASSIGNMENT FOR THIS RESPONSE: write only {which}. "
+            f"Make it distinct from the other {kind.lower()} briefs by choosing a different reference concept, "
+            f"headline or benefit focus. Output just the brief itself in the format above, with no preamble."
+        )
+
+    def _assignment_heading(self, assignment: Dict[str, Any]) -> str:
+        """Markdown heading used when reassembling per-brief outputs"""
+        if assignment["first"] == assignment["last"]:
+            return f"## {assignment['kind']} Brief {assignment['first']}"
+        return f"## {assignment['kind']} Briefs {assignment['first']}-{assignment['last']}"
+
+    def _prepare_batch_padding(self):
+        """Llama has no pad token; batched decoding needs one and left padding"""
+        tokenizer = self.llm_pipe.tokenizer
+        if tokenizer.pad_token_id is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        tokenizer.padding_side = "left"
+        if self.llm_pipe.model.generation_config.pad_token_id is None:
+            self.llm_pipe.model.generation_config.pad_token_id = tokenizer.pad_token_id
+
     #@spaces.GPU
-    def _generate_with_images(self, user_text_prompt: str,sys_text_prompt: str, image_paths: List[str]) -> str:
+    def _iter_per_brief(
+        self,
+        user_text_prompt: str,
+        system_template_path: str,
+        num_image_briefs: int,
+        num_video_briefs: int,
+    ) -> Iterator[str]:
+        """
+        Generate each brief (or small group) from its own prompt. All prompts share the
+        system prompt and user prompt prefix and are decoded in padded batches of
+        LLM_BATCH_SIZE; with the prefix cache enabled the shared prefix is prefilled
+        once and each batch only prefills its rows' own suffixes. Yields the
+        reassembled document after every batch.
+        """
+        system_prompt = self._load_system_prompt(system_template_path)
+        assignments = self._brief_assignments(num_image_briefs, num_video_briefs)
+        shared_prefix = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_text_prompt},
+        ]
+        conversations = [
+            [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_text_prompt + self._assignment_instruction(assignment)},
+            ]
+            for assignment in assignments
+        ]
+        max_new_tokens = min(self.max_tokens, PER_BRIEF_MAX_NEW_TOKENS * BRIEF_GROUP_SIZE)
+        sections = []
+
+        self._prepare_batch_padding()
+        for start in range(0, len(conversations), LLM_BATCH_SIZE):
+            batch = conversations[start:start + LLM_BATCH_SIZE]
+            print(f"Generating briefs {start + 1}-{start + len(batch)} of {len(conversations)} as one batch")
+            targets = [self._assignment_target(assignment) for assignment in assignments[start:start + len(batch)]]
+            limits = self._brief_limits(self.llm_pipe.tokenizer, targets, self._prompt_length(self.llm_pipe.tokenizer, batch))
+            limits["max_new_tokens"] = min(limits["max_new_tokens"], max_new_tokens)
+            try:
+                texts = self._llm_generate_batch(batch, prefix_messages=shared_prefix, temperature=0.7, **limits)
+            except Exception as e:
+                print(f"Error generating brief batch: {e}")
+                print(traceback.format_exc())
+                texts = [f"Error during generation: {str(e)}"] * len(batch)
+
+            for assignment, text in zip(assignments[start:start + len(batch)], texts):
+                sections.append(f"{self._assignment_heading(assignment)}\n\n{text.strip()}")
+            yield "\n\n---\n\n".join(sections)
+        if self.prefix_cache is not None:
+            print(f"Prefix cache: {self.prefix_cache.stats()}")
+
+    def _get_prefix_cache(self) -> Optional[PrefixCache]:
+        """Prefix KV cache for the Llama model, created on first use"""
+        llm_pipe = self.llm_pipe
+        if not PREFIX_CACHE_ENABLED or llm_pipe is None:
+            return None
+        if self.prefix_cache is None or self.prefix_cache.model is not llm_pipe.model:
+            self.prefix_cache = PrefixCache(llm_pipe.model, llm_pipe.tokenizer, max_entries=PREFIX_CACHE_MAX_ENTRIES)
+        return self.prefix_cache
+
+    #@spaces.GPU
+    def _llm_generate(self, messages: List[Dict[str, str]], prefix_messages: Optional[List[Dict[str, str]]] = None, **generate_kwargs) -> str:
+        """Generate a reply with the Llama model, reusing cached prefix KV state when enabled"""
+        prefix_cache = self._get_prefix_cache()
+        with span("llm", prefix_cache=prefix_cache is not None):
+            # Times prefill vs decode; wraps (and forwards to) any streamer the caller passed
+            generate_kwargs["streamer"] = GenerationTimer(
+                "llm", generate_kwargs.get("streamer"), pad_token_id=self.llm_pipe.tokenizer.pad_token_id
+            )
+            if prefix_cache is not None:
+                return prefix_cache.generate(messages, prefix_messages=prefix_messages, do_sample=True, **generate_kwargs)
+            output = self.llm_pipe(messages, **generate_kwargs)
+            return output[0]["generated_text"][-1]["content"]
+
+    #@spaces.GPU
+    def _llm_generate_batch(
+        self,
+        conversations: List[List[Dict[str, str]]],
+        prefix_messages: Optional[List[Dict[str, str]]] = None,
+        **generate_kwargs,
+    ) -> List[str]:
+        """Generate replies to several conversations as one padded batch, over the cached shared prefix when enabled"""
+        prefix_cache = self._get_prefix_cache()
+        with span("llm", briefs=len(conversations), prefix_cache=prefix_cache is not None):
+            # Rows are padded to a common width; count each row's own prompt tokens instead
+            tokenizer = self.llm_pipe.tokenizer
+            prompt_tokens = sum(len(tokenizer.apply_chat_template(c, add_generation_prompt=True)) for c in conversations)
+            generate_kwargs["streamer"] = GenerationTimer(
+                "llm", generate_kwargs.get("streamer"), pad_token_id=tokenizer.pad_token_id, prompt_tokens=prompt_tokens
+            )
+            if prefix_cache is not None:
+                return prefix_cache.generate_batch(conversations, prefix_messages=prefix_messages, do_sample=True, **generate_kwargs)
+            outputs = self.llm_pipe(conversations, batch_size=len(conversations), **generate_kwargs)
+            return [output[0]["generated_text"][-1]["content"] for output in outputs]
+
+    #@spaces.GPU
+    def _generate_with_images(
+        self,
+        user_text_prompt: str,
+        sys_text_prompt: str,
+        image_paths: List[str],
+        num_image_briefs: int = 10,
+        num_video_briefs: int = 10,
+    ) -> str:
         """Generate briefs using images and text with LLaVA"""
         try:
             
             llm_message =  [
-                {"role": "system", "content": sys_text_prompt},
+                {"role": "system", "content": self._load_system_prompt(sys_text_prompt)},
                 {"role": "user", "content": user_text_prompt},
             ]
             print(f'Final user prompt: {user_text_prompt}')
-            output_brief = self.llm_pipe(
+            output_brief = self._llm_generate(
                 llm_message,
-                max_new_tokens=self.max_tokens,
                 temperature=0.7,
+                **self._brief_limits(
+                    self.llm_pipe.tokenizer,
+                    [(num_image_briefs, num_video_briefs)],
+                    self._prompt_length(self.llm_pipe.tokenizer, [llm_message]),
+                ),
             )
             print("Generated output brief:", output_brief)
             
-            print(f"clened output brief", output_brief[0]["generated_text"][-1])
-            # Extract only the new generated part
-            #prompt_length = len(self.processor.decode(inputs['input_ids'][0], skip_special_tokens=True))
-            #result = generated_text[prompt_length:].strip()
-            
-            return output_brief[0]["generated_text"][-1]['content'] if output_brief else "Error: No response generated"
+            return output_brief if output_brief else "Error: No response generated"
                 
         except Exception as e:
             print(f"Error generating with images: {e}")
@@ -229,11 +629,16 @@ class CreativeBriefGenerator:
             print(traceback.format_exc())
             return f"Error during generation: {str(e)}"
     #@spaces.GPU
-    def _generate_text_only(self, text_prompt: str) -> str:
+    def _generate_text_only(self, text_prompt: str, num_image_briefs: int = 10, num_video_briefs: int = 10) -> str:
         """Fallback: Generate briefs using text only"""
         try:
             if hasattr(self, 'pipe'):  # Using fallback pipeline
-                result = self.pipe(text_prompt, max_new_tokens=self.max_tokens, num_return_sequences=1)
+                limits = self._brief_limits(
+                    self.pipe.tokenizer,
+                    [(num_image_briefs, num_video_briefs)],
+                    self._prompt_length(self.pipe.tokenizer, [text_prompt]),
+                )
+                result = self.pipe(text_prompt, num_return_sequences=1, **limits)
                 return result[0]['generated_text'] if result else "Error: No text generated"
             else:
                 # Use the main model in text-only mode
@@ -245,10 +650,12 @@ class CreativeBriefGenerator:
                 with torch.no_grad():
                     output = self.model.generate(
                         **inputs,
-                        max_new_tokens=self.max_tokens,
                         do_sample=True,
                         temperature=0.7,
-                        pad_token_id=self.processor.tokenizer.eos_token_id
+                        pad_token_id=self.processor.tokenizer.eos_token_id,
+                        **self._brief_limits(
+                            self.processor.tokenizer, [(num_image_briefs, num_video_briefs)], inputs["input_ids"].shape[1]
+                        ),
                     )
                 
                 generated_text = self.processor.decode(output[0], skip_special_tokens=True)
@@ -1,26 +1,124 @@
+import numpy as np
 import pandas as pd
-from typing import List, Optional, Union, Dict, Any
+from typing import Iterable, List, Optional, Union, Dict, Any
+import json
 import os
 import shutil
+import tempfile
 from pathlib import Path
 import zipfile
-import requests
-from urllib.parse import urlparse
 import re
+from app.cache import file_digest
+from app.config import (
+    CSV_CHUNK_THRESHOLD_BYTES, CSV_CHUNK_ROWS, PROCESSED_DIR, DOWNLOAD_CHUNK_SIZE,
+    ZIP_EXTRACT_DIR, ZIP_IMAGE_SUFFIXES, ZIP_DOCUMENT_SUFFIXES, ZIP_MAX_MEMBERS, ZIP_MAX_MEMBER_BYTES, ZIP_MAX_TOTAL_BYTES,
+    ZIP_MAX_COMPRESSION_RATIO,
+)
+from app.downloader import ImageDownloader, get_downloader
+from app.visual_parser import is_valid_image
 #import spaces
 
 
+# Columns process_swipe_csv expects, with the header variants seen in client swipe files
+SWIPE_COLUMNS = ['Creative Concept Names', 'Short Description', 'Content Requirements Per Variant', 'Format', 'Reference Image']
+SWIPE_COLUMN_ALIASES = {
+    'Creative Concept Names': ['creative concept names', 'creative concept name', 'creative concept', 'concept names', 'concept name', 'concept', 'name'],
+    'Short Description': ['short description', 'description', 'desc'],
+    'Content Requirements Per Variant': ['content requirements per variant', 'content requirements', 'requirements', 'content'],
+    'Format': ['format', 'ad format', 'type'],
+    'Reference Image': ['reference image', 'reference image url', 'reference images', 'reference', 'image', 'image url', 'url', 'link'],
+}
+
+
+def _column_key(name: str) -> str:
+    return re.sub(r'[^a-z0-9]+', ' ', str(name).lower()).strip()
+
+
+_DRIVE_FILE_ID = re.compile(r'/d/([a-zA-Z0-9-_]+)')
+_DRIVE_DOWNLOAD_URL = "https://drive.google.com/uc?export=download&id="
+
+
+_ALIAS_TO_COLUMN = {_column_key(alias): column for column, aliases in SWIPE_COLUMN_ALIASES.items() for alias in aliases}
+
+
+def canonical_swipe_column(name: str) -> Optional[str]:
+    """The expected swipe column a raw CSV header stands for, or None"""
+    return _ALIAS_TO_COLUMN.get(_column_key(name))
+
+
+def swipe_column_mapping(columns: List[str]) -> Dict[str, str]:
+    """Map raw headers to expected column names; an exact header wins over an alias, and the first alias wins"""
+    mapping: Dict[str, str] = {column: column for column in columns if column in SWIPE_COLUMNS}
+    taken = set(mapping.values())
+    for column in columns:
+        canonical = canonical_swipe_column(column)
+        if column not in mapping and canonical and canonical not in taken:
+            mapping[column] = canonical
+            taken.add(canonical)
+    return mapping
+
+
+def processed_csv_path(csv_path: str) -> Path:
+    """Where scripts/preprocess_csv.py stores the normalized copy of a swipe CSV (keyed by content)"""
+    return PROCESSED_DIR / f"swipe-{file_digest(csv_path)[:16]}.parquet"
+
+
 #@spaces.GPU
 def flatten_dataframe(df: pd.DataFrame) -> List[str]:
-    """Flatten a dataframe to a list of non-empty strings"""
-    return [str(cell).strip() for row in df.values for cell in row if pd.notna(cell) and str(cell).strip()]
+    """Flatten a dataframe (row by row) to a list of non-empty strings"""
+    cells = df.to_numpy(dtype=object).ravel()
+    cells = pd.Series(cells[pd.notna(cells)], dtype=object).astype(str).str.strip()
+    return cells[cells != ""].tolist()
+def _reduce_swipe_frame(df: pd.DataFrame, mapping: Dict[str, str]) -> pd.DataFrame:
+    """Keep the mapped swipe columns under their expected names, dropping rows with none of them filled"""
+    if mapping:
+        df = df[[column for column in df.columns if column in mapping]].rename(columns=mapping)
+    return df.dropna(how="all")
+
+
+def _read_csv_whole(csv_path: str) -> pd.DataFrame:
+    """Read a small CSV in one go, reduced the same way as _read_csv_in_chunks"""
+    df = pd.read_csv(csv_path)
+    return _reduce_swipe_frame(df, swipe_column_mapping(list(df.columns))).reset_index(drop=True)
+
+
+def _read_csv_in_chunks(csv_path: str) -> pd.DataFrame:
+    """
+    Read a large CSV CSV_CHUNK_ROWS rows at a time. Each chunk is cut down before the
+    chunks are combined: only the swipe columns are parsed, they are renamed to their
+    expected names and rows with none of them filled are dropped, so peak memory
+    follows the swipe data rather than the whole file.
+    """
+    header = pd.read_csv(csv_path, nrows=0).columns.tolist()
+    mapping = swipe_column_mapping(header)
+    if not mapping:
+        print(f"No swipe columns in {csv_path}, reading every column")
+    reduced = []
+    for chunk in pd.read_csv(csv_path, chunksize=CSV_CHUNK_ROWS, usecols=list(mapping) or None):
+        chunk = _reduce_swipe_frame(chunk, mapping)
+        if not chunk.empty:
+            reduced.append(chunk)
+    return pd.concat(reduced, ignore_index=True) if reduced else pd.DataFrame(columns=list(mapping.values()))
 #@spaces.GPU
 def parse_csv_file(file_obj) -> Optional[pd.DataFrame]:
-    """Safely load a CSV file from Gradio's file input"""
+    """
+    Safely load a CSV file from Gradio's file input. A copy preprocessed by
+    scripts/preprocess_csv.py is loaded instead when one exists; large files are
+    read in chunks. Either way only the swipe columns are kept, under their expected
+    names, and rows with none of them filled are dropped.
+    """
     if file_obj is None:
         return None
     try:
-        return pd.read_csv(file_obj.name)
+        processed_path = processed_csv_path(file_obj.name)
+        if processed_path.exists():
+            try:
+                return pd.read_parquet(processed_path)
+            except Exception as e:
+                print(f"Error reading preprocessed CSV {processed_path}, parsing the original: {e}")
+        if os.path.getsize(file_obj.name) <= CSV_CHUNK_THRESHOLD_BYTES:
+            return _read_csv_whole(file_obj.name)
+        return _read_csv_in_chunks(file_obj.name)
     except Exception as e:
         print(f"Error reading CSV: {e}")
         return None
@@ -32,71 +130,60 @@ def process_swipe_csv(csv_df: pd.DataFrame) -> str:
     """
     if csv_df is None or csv_df.empty:
         return ""
-    
-    formatted_data = "Reference Menu CSV Data:\n\n"
-    
-    for idx, row in csv_df.iterrows():
-        concept_name = row.get('Creative Concept Names', 'N/A')
-        description = row.get('Short Description', 'N/A')
-        content_req = row.get('Content Requirements Per Variant', 'N/A')
-        format_type = row.get('Format', 'N/A')
-        reference_image = row.get('Reference Image', 'N/A')
-        
-        formatted_data += f"Concept {idx + 1}:\n"
-        formatted_data += f"- Name: {concept_name}\n"
-        formatted_data += f"- Description: {description}\n"
-        formatted_data += f"- Content Requirements: {content_req}\n"
-        formatted_data += f"- Format: {format_type}\n"
-        formatted_data += f"- Reference Image URL: {reference_image}\n\n"
-    
-    return formatted_data
+
+    def column(name: str) -> pd.Series:
+        if name not in csv_df.columns:
+            return pd.Series("N/A", index=csv_df.index, dtype=object)
+        values = csv_df[name]
+        # Missing cells print as "nan", the way the row-by-row version showed them
+        return values.astype(str).astype(object).mask(values.isna(), "nan")
+
+    # Whole-column string concatenation, then one join
+    numbers = pd.Series(np.arange(1, len(csv_df) + 1), index=csv_df.index).astype(str)
+    concepts = (
+        "Concept " + numbers + ":\n"
+        + "- Name: " + column('Creative Concept Names') + "\n"
+        + "- Description: " + column('Short Description') + "\n"
+        + "- Content Requirements: " + column('Content Requirements Per Variant') + "\n"
+        + "- Format: " + column('Format') + "\n"
+        + "- Reference Image URL: " + column('Reference Image') + "\n\n"
+    )
+    return "Reference Menu CSV Data:\n\n" + "".join(concepts.tolist())
 #@spaces.GPU
 def extract_image_urls_from_csv(csv_df: pd.DataFrame) -> List[str]:
     """Extract all image URLs from the CSV Reference Image column"""
     if csv_df is None or csv_df.empty:
         return []
     
-    urls = []
-    if 'Reference Image' in csv_df.columns:
-        for url in csv_df['Reference Image'].dropna():
-            if isinstance(url, str) and url.strip():
-                # Handle Google Drive links and convert to direct download links
-                url = convert_google_drive_url(url.strip())
-                urls.append(url)
-    
-    return urls
+    if 'Reference Image' not in csv_df.columns:
+        return []
+    column = csv_df['Reference Image']
+    if not (pd.api.types.is_object_dtype(column) or pd.api.types.is_string_dtype(column)):
+        return []
+    # .str turns non-string cells into NaN, so one dropna removes those and blanks alike
+    urls = column.str.strip().dropna()
+    urls = urls[urls != ""]
+    # Handle Google Drive links and convert to direct download links
+    file_ids = urls.str.extract(_DRIVE_FILE_ID.pattern, expand=False)
+    is_drive = urls.str.contains('drive.google.com', regex=False) & file_ids.notna()
+    urls = urls.where(~is_drive, _DRIVE_DOWNLOAD_URL + file_ids)
+    return urls.tolist()
 #@spaces.GPU
 def convert_google_drive_url(url: str) -> str:
     """Convert Google Drive sharing URL to direct download URL"""
     if 'drive.google.com' in url:
         # Extract file ID from various Google Drive URL formats
-        file_id_match = re.search(r'/d/([a-zA-Z0-9-_]+)', url)
+        file_id_match = _DRIVE_FILE_ID.search(url)
         if file_id_match:
-            file_id = file_id_match.group(1)
-            return f"https://drive.google.com/uc?export=download&id={file_id}"
+            return _DRIVE_DOWNLOAD_URL + file_id_match.group(1)
     return url
 #@spaces.GPU
-def download_image_from_url(url: str, save_dir: str = "data/processed/images") -> Optional[str]:
+def download_image_from_url(url: str, save_dir: Optional[str] = None) -> Optional[str]:
     """Download image from URL and save locally"""
-    try:
-        os.makedirs(save_dir, exist_ok=True)
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
-        
-        # Extract filename from URL or generate one
-        parsed_url = urlparse(url)
-        filename = os.path.basename(parsed_url.path)
-        if not filename or '.' not in filename:
-            filename = f"image_{hash(url) % 10000}.jpg"
-        
-        save_path = os.path.join(save_dir, filename)
-        with open(save_path, 'wb') as f:
-            f.write(response.content)
-        
-        return save_path
-    except Exception as e:
-        print(f"Error downloading image from {url}: {e}")
-        return None
+    downloader = get_downloader()
+    if save_dir is None or save_dir == downloader.save_dir:
+        return downloader.download(url)
+    return ImageDownloader(save_dir=save_dir, session=downloader.session).download(url)
 #@spaces.GPU
 def save_uploaded_files(files: Union[List, None], output_dir: str = "data/raw") -> List[str]:
     """Save uploaded files (like images or PDFs) and return paths"""
@@ -126,15 +213,116 @@ def save_uploaded_files(files: Union[List, None], output_dir: str = "data/raw")
             print(f"Error saving file {file}: {e}")
 
     return saved_paths
+def select_zip_members(
+    zip_ref: zipfile.ZipFile,
+    suffixes: Iterable[str] = ZIP_IMAGE_SUFFIXES | ZIP_DOCUMENT_SUFFIXES,
+    max_members: int = ZIP_MAX_MEMBERS,
+    max_member_bytes: int = ZIP_MAX_MEMBER_BYTES,
+    max_total_bytes: int = ZIP_MAX_TOTAL_BYTES,
+    max_compression_ratio: float = ZIP_MAX_COMPRESSION_RATIO,
+) -> List[zipfile.ZipInfo]:
+    """
+    Pick the archive members worth extracting, using only the central directory
+    (no member data is read): files with a supported suffix, skipping OS metadata,
+    encrypted entries, members over the size or compression-ratio limits, and
+    anything past the member count or total size limits.
+    """
+    suffixes = {suffix.lower() for suffix in suffixes}
+    selected, total = [], 0
+    for info in zip_ref.infolist():
+        name = info.filename
+        basename = name.rsplit("/", 1)[-1]
+        if info.is_dir() or not basename or basename.startswith(".") or name.startswith("__MACOSX/"):
+            continue
+        if Path(basename).suffix.lower() not in suffixes:
+            continue
+        if info.flag_bits & 0x1:
+            print(f"Skipping encrypted ZIP member {name}")
+            continue
+        if info.file_size > max_member_bytes:
+            print(f"Skipping ZIP member {name}: {info.file_size} bytes is over the {max_member_bytes} byte limit")
+            continue
+        if info.compress_size and info.file_size / info.compress_size > max_compression_ratio:
+            print(f"Skipping ZIP member {name}: compression ratio over {max_compression_ratio}")
+            continue
+        if len(selected) >= max_members or total + info.file_size > max_total_bytes:
+            print(f"ZIP limits reached ({max_members} files / {max_total_bytes} bytes); ignoring the rest of the archive")
+            break
+        selected.append(info)
+        total += info.file_size
+    return selected
+
+
+def _copy_zip_member(zip_ref: zipfile.ZipFile, info: zipfile.ZipInfo, target_path: str, max_bytes: int):
+    """
+    Stream one member to disk, stopping at max_bytes whatever its header claims. It is
+    written to a private temp file first, so concurrent extractions of the same
+    archive never share a partial file.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target_path), suffix=".part")
+    written = 0
+    try:
+        with zip_ref.open(info) as source, os.fdopen(fd, "wb") as target:
+            for chunk in iter(lambda: source.read(DOWNLOAD_CHUNK_SIZE), b""):
+                written += len(chunk)
+                if written > max_bytes:
+                    raise ValueError(f"larger than the {max_bytes} byte limit")
+                target.write(chunk)
+        os.replace(tmp_path, target_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
 #@spaces.GPU
-def extract_zip_assets(zip_path: str, extract_dir: str = "data/processed/unzipped") -> List[str]:
-    """Extract contents of a ZIP file"""
+def extract_zip_assets(
+    zip_path: str,
+    extract_dir: Union[str, Path] = ZIP_EXTRACT_DIR,
+    suffixes: Iterable[str] = ZIP_IMAGE_SUFFIXES | ZIP_DOCUMENT_SUFFIXES,
+) -> List[str]:
+    """
+    Extract the supported files of a ZIP archive and return their paths. Members are
+    streamed one at a time into a directory named after the archive's content hash,
+    so each upload gets its own files and an archive seen before is not re-read.
+    """
     extracted_files = []
+    requested = {suffix.lower() for suffix in suffixes}
+    suffixes = requested
     try:
-        os.makedirs(extract_dir, exist_ok=True)
+        archive_dir = Path(extract_dir) / f"zip-{file_digest(zip_path)[:16]}"
+        manifest_path = archive_dir / "manifest.json"
+        if manifest_path.exists():
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            paths = [str(archive_dir / name) for name in manifest["files"]]
+            if requested <= set(manifest["suffixes"]) and all(os.path.exists(path) for path in paths):
+                return [path for path in paths if Path(path).suffix.lower() in requested]
+            # Asked for more types than the earlier extraction kept
+            suffixes = requested | set(manifest["suffixes"])
+
         with zipfile.ZipFile(zip_path, "r") as zip_ref:
-            zip_ref.extractall(extract_dir)
-            extracted_files = [str(p) for p in Path(extract_dir).rglob("*") if p.is_file()]
+            members = select_zip_members(zip_ref, suffixes)
+            os.makedirs(archive_dir, exist_ok=True)
+            names = []
+            for index, info in enumerate(members):
+                # Flat, numbered names: member paths never reach the filesystem
+                basename = re.sub(r'[^\w.\- ]+', '_', info.filename.rsplit("/", 1)[-1])
+                name = f"{index:04d}_{basename}"
+                try:
+                    _copy_zip_member(zip_ref, info, str(archive_dir / name), ZIP_MAX_MEMBER_BYTES)
+                    names.append(name)
+                except Exception as e:
+                    print(f"Error extracting {info.filename} from ZIP: {e}")
+
+        fd, tmp_path = tempfile.mkstemp(dir=archive_dir, suffix=".part")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"suffixes": sorted(suffixes), "files": names}, f)
+            os.replace(tmp_path, manifest_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        extracted_files = [str(archive_dir / name) for name in names if Path(name).suffix.lower() in requested]
     except Exception as e:
         print(f"Error extracting ZIP: {e}")
     return extracted_files
@@ -149,17 +337,19 @@ def prepare_reference_images(uploaded_images: List, csv_image_urls: List[str]) -
     # Handle uploaded images
     if uploaded_images:
         uploaded_paths = save_uploaded_files(uploaded_images, "data/processed/uploaded_images")
-        all_image_paths.extend(uploaded_paths)
+        for path in uploaded_paths:
+            if path.lower().endswith(".zip"):
+                all_image_paths.extend(extract_zip_assets(path, suffixes=ZIP_IMAGE_SUFFIXES))
+            else:
+                all_image_paths.append(path)
     
-    # Handle CSV image URLs
-    for url in csv_image_urls:
-        local_path = download_image_from_url(url)
+    # Handle CSV image URLs, fetched concurrently over the shared session
+    for local_path in get_downloader().download_all(csv_image_urls):
         if local_path:
             all_image_paths.append(local_path)
     
     return all_image_paths
 #@spaces.GPU
 def validate_image_file(filepath: str) -> bool:
-    """Validate if file is a supported image format"""
-    supported_formats = ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp']
-    return any(filepath.lower().endswith(fmt) for fmt in supported_formats)
\ No newline at end of file
+    """Validate that a file really is an image in a supported format (not just by its extension)"""
+    return is_valid_image(filepath)
\ No newline at end of file
@@ -0,0 +1,247 @@
+import inspect
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from app.batching import MicroBatcher
+from app.config import (
+    JOBS_DIR, JOB_MAX_CONCURRENCY, JOB_POLL_INTERVAL, JOB_MAX_IN_MEMORY,
+)
+#import spaces
+
+JOB_STATES = ("queued", "running", "done", "failed", "cancelled")
+
+
+class Job:
+    """One queued brief request and its latest output"""
+
+    def __init__(self, inputs: tuple):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.inputs = inputs
+        self.status = "queued"
+        self.output: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.future: Optional[Future] = None
+        self.cancel_event = threading.Event()
+        self.version = 0
+        self._changed = threading.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed", "cancelled")
+
+    def update(self, **fields):
+        """Set fields and wake anyone following the job"""
+        with self._changed:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self.version += 1
+            self._changed.notify_all()
+
+    def wait_for_update(self, seen_version: int, timeout: float) -> int:
+        """Block until the job changes past seen_version (or timeout); returns the current version"""
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != seen_version, timeout=timeout)
+            return self.version
+
+    def to_record(self) -> Dict[str, Any]:
+        """JSON-serialisable status; a (markdown, md, txt, pdf) output is split into text and files"""
+        output, files = self.output, []
+        if isinstance(output, tuple):
+            output, files = output[0], [path for path in output[1:] if path]
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+            "output": output,
+            "files": files,
+        }
+
+
+class JobManager:
+    """
+    Runs brief requests as background jobs.
+
+    `submit` returns a job id straight away; queued jobs start in arrival order as soon
+    as one of `max_concurrency` workers is free, so GPU work stays bounded however many
+    users click Generate.
+
+    `handler(*inputs)` may return a value or yield partial outputs; the latest one is
+    kept on the job. An output for which `error_fn` returns a message fails the job.
+    Job status is persisted as JSON under `jobs_dir`.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[..., Any],
+        jobs_dir: str = str(JOBS_DIR),
+        max_concurrency: int = JOB_MAX_CONCURRENCY,
+        error_fn: Optional[Callable[[Any], Optional[str]]] = None,
+        max_in_memory: int = JOB_MAX_IN_MEMORY,
+    ):
+        self.handler = handler
+        self.jobs_dir = str(jobs_dir)
+        self.error_fn = error_fn or (lambda output: None)
+        self.max_in_memory = max_in_memory
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        # One job per dispatch, without waiting: the batcher is only the FIFO queue and worker pool
+        self.batcher = MicroBatcher(
+            self._run_one,
+            max_batch_size=1,
+            max_wait_seconds=0,
+            max_concurrency=max_concurrency,
+            name="brief-jobs",
+        )
+        os.makedirs(self.jobs_dir, exist_ok=True)
+
+    def submit(self, *inputs) -> str:
+        """Queue a request and return its job id"""
+        job = Job(inputs)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._forget_finished()
+        self._persist(job)
+        job.future = self.batcher.submit(job)
+        print(f"Queued job {job.job_id} ({self.batcher.pending()} waiting)")
+        return job.job_id
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Status record of a job, from memory or (for older jobs) from disk"""
+        job = self.get(job_id)
+        if job is not None:
+            return job.to_record()
+        try:
+            with open(self._record_path(job_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def queue_position(self, job_id: str) -> Optional[int]:
+        """0-based place of a queued job in line, or None once it has started"""
+        job = self.get(job_id)
+        if job is None or job.future is None or job.status != "queued":
+            return None
+        return self.batcher.position(job.future)
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued job, or stop a running one at its next partial output"""
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return False
+        job.cancel_event.set()
+        if job.future is not None and job.future.cancel():
+            self._finish(job, "cancelled")
+        return True
+
+    def follow(self, job_id: str, poll_interval: float = JOB_POLL_INTERVAL) -> Iterator[Job]:
+        """Yield the job every time it changes, until it finishes"""
+        job = self.get(job_id)
+        if job is None:
+            return
+        seen = -1
+        while True:
+            version = job.wait_for_update(seen, timeout=poll_interval)
+            if version != seen:
+                seen = version
+                yield job
+            if job.finished:
+                return
+
+    def _run_one(self, jobs: List[Job]) -> List[None]:
+        """Batcher callback: run the dispatched job on this worker"""
+        for job in jobs:
+            self._run(job)
+        return [None] * len(jobs)
+
+    def _run(self, job: Job):
+        if job.cancel_event.is_set():
+            self._finish(job, "cancelled")
+            return
+        job.update(status="running", started_at=time.time())
+        self._persist(job)
+        try:
+            result = self.handler(*job.inputs)
+            if inspect.isgenerator(result):
+                try:
+                    for output in result:
+                        job.update(output=output)
+                        if job.cancel_event.is_set():
+                            break
+                finally:
+                    # Closing the handler's generator stops any generation still running
+                    result.close()
+            else:
+                job.update(output=result)
+            error = self.error_fn(job.output) if job.output is not None else None
+            if job.cancel_event.is_set():
+                self._finish(job, "cancelled")
+            elif error:
+                self._finish(job, "failed", error=error)
+            else:
+                self._finish(job, "done")
+        except Exception as e:
+            print(f"Job {job.job_id} failed: {e}")
+            self._finish(job, "failed", error=str(e))
+
+    def _finish(self, job: Job, status: str, error: Optional[str] = None):
+        job.update(status=status, error=error, finished_at=time.time())
+        self._persist(job)
+
+    def _forget_finished(self):
+        """Keep at most max_in_memory jobs in memory; finished ones stay readable from disk"""
+        for job_id in list(self._jobs):
+            if len(self._jobs) <= self.max_in_memory:
+                return
+            if self._jobs[job_id].finished:
+                del self._jobs[job_id]
+
+    def _record_path(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _persist(self, job: Job):
+        """Atomically write the job's status record"""
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.jobs_dir, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(job.to_record(), f, indent=2, default=str)
+            os.replace(tmp_path, self._record_path(job.job_id))
+        except Exception as e:
+            print(f"Error saving job {job.job_id}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Job counts by status plus the batcher's queue statistics"""
+        with self._lock:
+            counts = {state: 0 for state in JOB_STATES}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+        return dict(counts, batcher=self.batcher.stats())
+
+
+# Global instance shared by every Gradio session
+_job_manager_instance = None
+
+#@spaces.GPU
+def get_job_manager() -> JobManager:
+    """Get the singleton job manager running brief requests"""
+    global _job_manager_instance
+    if _job_manager_instance is None:
+        from app.main import generate_brief_stream_callback, brief_output_error
+        _job_manager_instance = JobManager(generate_brief_stream_callback, error_fn=brief_output_error)
+    return _job_manager_instance
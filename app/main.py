@@ -6,13 +6,13 @@ from app.generator import get_generator
 from app.io import parse_csv_file
 from app.config import EVERGREEN_TEMPLATE_PATH, PROMO_TEMPLATE_PATH, EVERGREEN_SYSTEM_PROMPT_PATH, EVERGREEN_USER_PROMPT_PATH
 from app.ui import build_ui
+from app.config import MODEL_WARMUP
+from app.telemetry import get_telemetry, span
+from app.jobs import get_job_manager
+from app.exporter import get_exporter
+from models.registry import get_registry
 import traceback
 import re
-import markdown
-from weasyprint import HTML, CSS
-from io import StringIO
-import tempfile
-import os
 #@spaces.GPU
 def process_dataframe_input(df_data):
     """Convert Gradio dataframe input (Pandas DataFrame) to list"""
@@ -21,103 +21,19 @@ def process_dataframe_input(df_data):
     return df_data.iloc[:, 0].dropna().astype(str).str.strip().tolist()
 #@spaces.GPU
 def create_download_files(content, brand_name):
-    """Create downloadable files in different formats"""
+    """Create downloadable files in different formats, waiting for the PDF"""
     try:
-        # Create a temporary directory for files
-        temp_dir = tempfile.mkdtemp()
-        base_filename = f"{brand_name.lower().replace(' ', '_')}_brief"
-        
-        # 1. Create MD file
-        md_path = os.path.join(temp_dir, f"{base_filename}.md")
-        with open(md_path, 'w', encoding='utf-8') as f:
-            f.write(content)
-        
-        # 2. Create TXT file (plain text version)
-        txt_path = os.path.join(temp_dir, f"{base_filename}.txt")
-        # Convert markdown to plain text (remove markdown formatting)
-        plain_text = re.sub(r'#+\s*', '', content)  # Remove headers
-        plain_text = re.sub(r'\*\*(.*?)\*\*', r'\1', plain_text)  # Remove bold
-        plain_text = re.sub(r'\*(.*?)\*', r'\1', plain_text)  # Remove italic
-        plain_text = re.sub(r'`(.*?)`', r'\1', plain_text)  # Remove code formatting
-        
-        with open(txt_path, 'w', encoding='utf-8') as f:
-            f.write(plain_text)
-        
-        # 3. Create PDF file
-        pdf_path = os.path.join(temp_dir, f"{base_filename}.pdf")
-        
-        # Convert markdown to HTML
-        html_content = markdown.markdown(content, extensions=['tables', 'fenced_code'])
-        
-        # Add CSS styling for better PDF appearance
-        css_content = """
-        body {
-            font-family: Arial, sans-serif;
-            line-height: 1.6;
-            margin: 40px;
-            color: #333;
-        }
-        h1, h2, h3 {
-            color: #2c3e50;
-            margin-top: 30px;
-            margin-bottom: 15px;
-        }
-        h1 {
-            border-bottom: 2px solid #3498db;
-            padding-bottom: 10px;
-        }
-        p {
-            margin-bottom: 10px;
-        }
-        ul, ol {
-            margin-left: 20px;
-        }
-        table {
-            border-collapse: collapse;
-            width: 100%;
-            margin: 20px 0;
-        }
-        th, td {
-            border: 1px solid #ddd;
-            padding: 8px;
-            text-align: left;
-        }
-        th {
-            background-color: #f2f2f2;
-        }
-        code {
-            background-color: #f4f4f4;
-            padding: 2px 4px;
-            border-radius: 3px;
-        }
-        """
-        
-        # Create HTML with CSS
-        full_html = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="utf-8">
-            <title>Creative Brief - {brand_name}</title>
-            <style>{css_content}</style>
-        </head>
-        <body>
-            {html_content}
-        </body>
-        </html>
-        """
-        
-        # Generate PDF
-        HTML(string=full_html).write_pdf(pdf_path)
-        
-        return md_path, txt_path, pdf_path
+        files = get_exporter().export(content, brand_name)
+        with span("export.pdf"):
+            pdf_path = files.pdf_path()
+        return files.md_path, files.txt_path, pdf_path
         
     except Exception as e:
         print(f"Error creating download files: {e}")
         return None, None, None
     
 #@spaces.GPU
-def generate_brief_callback(
+def prepare_brief_request(
     brand_name, product_name, website_url, target_audience, tone,
     content_bank, campaign_type, swipe_csv, reference_images,
     angle_description, angle_and_benefits,
@@ -127,86 +43,225 @@ def generate_brief_callback(
     num_image_briefs, num_video_briefs,
     brand_guide, campaign_deck, misc_assets
 ):
-    """Main callback function for generating creative briefs"""
+    """
+    Validate the form inputs and turn them into generator arguments.
+    Returns (brief_kwargs, None) on success or (None, error_markdown).
+    """
+    # Validate required inputs
+    if not brand_name or not product_name or not angle_description:
+        return None, "❌ **Error**: Please fill in Brand Name, Product Name, and Angle Description."
     
-    try:
-        # Validate required inputs
-        if not brand_name or not product_name or not angle_description:
-            return "❌ **Error**: Please fill in Brand Name, Product Name, and Angle Description.", None, None, None
-        
-        # Process CSV file
-        csv_df = None
-        if swipe_csv is not None:
+    # Process CSV file
+    csv_df = None
+    if swipe_csv is not None:
+        with span("csv_parse"):
             csv_df = parse_csv_file(swipe_csv)
-            if csv_df is None:
-                return "❌ **Error**: Could not parse the uploaded CSV file.", None, None, None
-        
-        # Process headlines and subheadlines from dataframes
-        headlines = process_dataframe_input(headlines_df) if auto_headlines else None
-        subheadlines = process_dataframe_input(subheadlines_df) if auto_subheadlines else None
-        
-        # Determine template path based on campaign type
-        template_path = EVERGREEN_USER_PROMPT_PATH if campaign_type == "Evergreen" else PROMO_TEMPLATE_PATH
-        
-        # Check if template exists
-        if not Path(template_path).exists():
-            return f"❌ **Error**: Template file not found at {template_path}. Please create the template file.", None, None, None
-        
-        content_bank = [i.strip() for i in re.split(r'[;,]', content_bank) if i.strip()]
-        if angle_and_benefits:
-            angle_and_benefits = [i.strip() for i in re.split(r'[;,]', angle_and_benefits) if i.strip()]
-        if social_proof:
-            social_proof = [i.strip() for i in re.split(r'[;,]', social_proof) if i.strip()]
-        
-        # Get generator instance
-        generator = get_generator()
-        
-        # Generate the creative briefs
-        result = generator.generate_creative_briefs(
-            brand_name=brand_name,
-            product_name=product_name,
-            website_url=website_url or "",
-            target_audience=target_audience or "",
-            tone=tone or "",
-            angle_description=angle_description,
-            user_template_path=EVERGREEN_USER_PROMPT_PATH,
-            system_template_path=EVERGREEN_SYSTEM_PROMPT_PATH,
-            csv_df=csv_df,
-            uploaded_images=reference_images,
-            headlines=headlines,
-            subheadlines=subheadlines,
-            social_proof=social_proof if social_proof else None,
-            angle_and_benefits=angle_and_benefits,
-            num_image_briefs=int(num_image_briefs),
-            num_video_briefs=int(num_video_briefs),
-            content_bank=content_bank or "",
-        )
-        
+        if csv_df is None:
+            return None, "❌ **Error**: Could not parse the uploaded CSV file."
+    
+    # Process headlines and subheadlines from dataframes
+    headlines = process_dataframe_input(headlines_df) if auto_headlines else None
+    subheadlines = process_dataframe_input(subheadlines_df) if auto_subheadlines else None
+    
+    # Determine template path based on campaign type
+    template_path = EVERGREEN_USER_PROMPT_PATH if campaign_type == "Evergreen" else PROMO_TEMPLATE_PATH
+    
+    # Check if template exists
+    if not Path(template_path).exists():
+        return None, f"❌ **Error**: Template file not found at {template_path}. Please create the template file."
+    
+    content_bank = [i.strip() for i in re.split(r'[;,]', content_bank) if i.strip()]
+    if angle_and_benefits:
+        angle_and_benefits = [i.strip() for i in re.split(r'[;,]', angle_and_benefits) if i.strip()]
+    if social_proof:
+        social_proof = [i.strip() for i in re.split(r'[;,]', social_proof) if i.strip()]
+    
+    brief_kwargs = dict(
+        brand_name=brand_name,
+        product_name=product_name,
+        website_url=website_url or "",
+        target_audience=target_audience or "",
+        tone=tone or "",
+        angle_description=angle_description,
+        user_template_path=EVERGREEN_USER_PROMPT_PATH,
+        system_template_path=EVERGREEN_SYSTEM_PROMPT_PATH,
+        csv_df=csv_df,
+        uploaded_images=reference_images,
+        headlines=headlines,
+        subheadlines=subheadlines,
+        social_proof=social_proof if social_proof else None,
+        angle_and_benefits=angle_and_benefits,
+        num_image_briefs=int(num_image_briefs),
+        num_video_briefs=int(num_video_briefs),
+        content_bank=content_bank or "",
+    )
+    return brief_kwargs, None
+
+def describe_brief_request(brief_kwargs):
+    """Trace attributes for a brief run (sizes and settings, no brand content)"""
+    csv_df = brief_kwargs.get("csv_df")
+    return {
+        "num_image_briefs": brief_kwargs["num_image_briefs"],
+        "num_video_briefs": brief_kwargs["num_video_briefs"],
+        "csv_rows": len(csv_df) if csv_df is not None else 0,
+        "uploaded_images": len(brief_kwargs.get("uploaded_images") or []),
+    }
+
+def prompt_trim_note(prompt_report):
+    """A note for the output when the prompt was trimmed to its token budget, else an empty string"""
+    dropped = (prompt_report or {}).get("dropped") or {}
+    if not dropped:
+        return ""
+    details = ", ".join(f"{count} {name.replace('_', ' ')}" for name, count in dropped.items())
+    return (
+        f"\n**Note:** the prompt was over its {prompt_report['budget']}-token budget, "
+        f"so {sum(dropped.values())} items were trimmed ({details}).\n"
+    )
+
+#@spaces.GPU
+def start_brief_export(generator, result, brand_name, prompt_report=None):
+    """Save the finished brief and start its download files; returns (output text, ExportFiles or None)"""
+    with span("export"):
         # Save the result to file
         output_filename = f"{brand_name.lower().replace(' ', '_')}_brief.md"
         saved_path = generator.save_brief_to_file(result, output_filename)
         
-        # Create download files
-        md_path, txt_path, pdf_path = create_download_files(result, brand_name)
-        
-        # Format the output with file info
-        output_text = f"""
+        # MD and TXT are written now, the PDF renders in the background
+        try:
+            files = get_exporter().export(result, brand_name)
+        except Exception as e:
+            print(f"Error creating download files: {e}")
+            files = None
+    
+    # Format the output with file info
+    output_text = f"""
 ## ✅ Creative Brief Generated Successfully!
 
 **Saved to:** `{saved_path}`
-
+{prompt_trim_note(prompt_report)}
 ---
 
 {result}
-        """
-        
-        return output_text, md_path, txt_path, pdf_path
+    """
+    
+    return output_text, files
+
+#@spaces.GPU
+def finalize_brief(generator, result, brand_name, prompt_report=None):
+    """Save the finished brief, create the download files and format the output"""
+    output_text, files = start_brief_export(generator, result, brand_name, prompt_report)
+    if files is None:
+        return output_text, None, None, None
+    with span("export.pdf"):
+        pdf_path = files.pdf_path()
+    return output_text, files.md_path, files.txt_path, pdf_path
+
+#@spaces.GPU
+def generate_brief_callback(*form_inputs):
+    """Main callback function for generating creative briefs"""
+    
+    trace = get_telemetry().start_trace("brief", streaming=False)
+    try:
+        with trace.active():
+            brief_kwargs, error_msg = prepare_brief_request(*form_inputs)
+            if error_msg:
+                trace.set_status("invalid_input", error_msg)
+                return error_msg, None, None, None
+            trace.attributes.update(describe_brief_request(brief_kwargs))
+            
+            # Get generator instance
+            generator = get_generator()
+            
+            # Generate the creative briefs
+            prompt_report = {}
+            result = generator.generate_creative_briefs(**brief_kwargs, prompt_report=prompt_report)
+            
+            return finalize_brief(generator, result, brief_kwargs["brand_name"], prompt_report)
         
     except Exception as e:
+        trace.set_status("error", str(e))
         error_msg = f"❌ **Error during generation**: {str(e)}"
         print("Generation error:")
         traceback.print_exc()  # Prints the full traceback to stderr
         return error_msg, None, None, None
+    finally:
+        trace.finish()
+
+#@spaces.GPU
+def generate_brief_stream_callback(*form_inputs):
+    """Streaming callback: yields the brief as it is written, then the download files"""
+    
+    # Gradio may resume this generator on another thread, so the trace is re-activated per step
+    trace = get_telemetry().start_trace("brief", streaming=True)
+    try:
+        with trace.active():
+            brief_kwargs, error_msg = prepare_brief_request(*form_inputs)
+        if error_msg:
+            trace.set_status("invalid_input", error_msg)
+            yield error_msg, None, None, None
+            return
+        trace.attributes.update(describe_brief_request(brief_kwargs))
+        
+        generator = get_generator()
+        yield "⏳ Preparing reference images and prompt...", None, None, None
+        
+        result = ""
+        prompt_report = {}
+        for result in trace.iterate(generator.stream_creative_briefs(**brief_kwargs, prompt_report=prompt_report)):
+            yield f"## ⏳ Generating...\n\n---\n\n{result}", None, None, None
+        
+        with trace.active():
+            output_text, files = start_brief_export(generator, result, brief_kwargs["brand_name"], prompt_report)
+        if files is None:
+            yield output_text, None, None, None
+            return
+        # Offer the Markdown and text files while the PDF is still rendering
+        yield output_text, files.md_path, files.txt_path, None
+        with trace.active(), span("export.pdf"):
+            pdf_path = files.pdf_path()
+        yield output_text, files.md_path, files.txt_path, pdf_path
+        
+    except GeneratorExit:
+        # The user pressed Stop
+        trace.set_status("cancelled")
+        raise
+    except Exception as e:
+        trace.set_status("error", str(e))
+        error_msg = f"❌ **Error during generation**: {str(e)}"
+        print("Generation error:")
+        traceback.print_exc()  # Prints the full traceback to stderr
+        yield error_msg, None, None, None
+    finally:
+        trace.finish()
+
+def brief_output_error(output):
+    """The message of a callback output that reports an error (invalid input or a failed run), else None"""
+    if isinstance(output, tuple) and output and isinstance(output[0], str) and output[0].startswith("❌ **Error"):
+        return output[0]
+    return None
+
+#@spaces.GPU
+def generate_brief_job_callback(*form_inputs):
+    """Queue the brief as a background job and stream its progress until it finishes"""
+    manager = get_job_manager()
+    job_id = manager.submit(*form_inputs)
+    try:
+        for job in manager.follow(job_id):
+            if job.status == "queued":
+                position = manager.queue_position(job_id)
+                ahead = f" ({position} ahead of you)" if position else ""
+                yield f"⏳ Queued as job `{job_id}`{ahead}...", None, None, None
+            elif job.status == "failed":
+                if brief_output_error(job.output):
+                    yield job.output
+                else:
+                    yield f"❌ **Error during generation**: {job.error}", None, None, None
+            elif job.output is not None:
+                yield job.output
+    except GeneratorExit:
+        # The user pressed Stop or closed the page
+        manager.cancel(job_id)
+        raise
 
 def generate_gradio_interface():
     """Return the Gradio Blocks interface for Modal deployment"""
@@ -232,7 +287,7 @@ Generate {num_image_briefs} static image briefs and {num_video_briefs} video bri
 Please create detailed creative briefs following the format specified in the assignment requirements.
 """)
 
-    demo = build_ui(generate_brief_callback)
+    demo = build_ui(generate_brief_job_callback)
     return demo
    
 #@spaces.GPU
@@ -271,18 +326,15 @@ Please create detailed creative briefs following the format specified in the ass
         print("✅ Created basic template files for testing.")
     
     # Build and launch the UI
-    demo = build_ui(generate_brief_callback)
+    demo = build_ui(generate_brief_job_callback)
     
     print("🚀 Starting Creative Brief Generator...")
-    print("📝 Loading AI model (this may take a few minutes)...")
     
-    # Pre-load the model to show any errors early
-    try:
-        get_generator()
-        print("✅ Model loaded successfully!")
-    except Exception as e:
-        print(f"❌ Error loading model: {e}")
-        print("⚠️  The app will still launch, but generation may fail.")
+    # Models load on first use; warm the configured ones in the background
+    registry = get_registry()
+    for model_name in MODEL_WARMUP:
+        print(f"📝 Warming {model_name} model in the background...")
+        registry.warm(model_name)
     
     # Launch the app
     demo.launch(
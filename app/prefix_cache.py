@@ -0,0 +1,228 @@
+import copy
+import threading
+from typing import Dict, List, Optional
+
+import torch
+from transformers import DynamicCache
+
+from app.telemetry import add_counter
+#import spaces
+
+
+class PrefixCache:
+    """
+    Reuses the KV state of prompt prefixes across generations of one causal LM.
+
+    The first call for a brand pays the prefill for the system prompt and the brand
+    context; later calls that share a token prefix with a cached entry (headline
+    regenerations, brief variants, per-brief prompts) only prefill the tokens after it.
+    """
+
+    def __init__(self, model, tokenizer, max_entries: int = 4, min_prefix_tokens: int = 32):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_entries = max_entries
+        self.min_prefix_tokens = min_prefix_tokens
+        self.hits = 0
+        self.misses = 0
+        self.reused_tokens = 0
+        self._entries: List[Dict] = []   # most recently used last
+        self._lock = threading.Lock()
+
+    def _encode(self, messages: List[Dict[str, str]], add_generation_prompt: bool = True) -> torch.LongTensor:
+        """Render a conversation with the chat template and tokenize it"""
+        return self.tokenizer.apply_chat_template(
+            messages,
+            add_generation_prompt=add_generation_prompt,
+            return_tensors="pt",
+        ).to(self.model.device)
+
+    def _common_prefix_length(self, a: torch.LongTensor, b: torch.LongTensor) -> int:
+        """Number of leading tokens two (1, L) id tensors share"""
+        length = min(a.shape[1], b.shape[1])
+        mismatch = (a[0, :length] != b[0, :length]).nonzero()
+        return int(mismatch[0, 0]) if len(mismatch) else length
+
+    def _new_cache(self) -> DynamicCache:
+        """Empty KV cache laid out for this model (sliding-window layers included)"""
+        try:
+            return DynamicCache(config=self.model.config)
+        except TypeError:
+            return DynamicCache()
+
+    @torch.no_grad()
+    def _prefill(self, input_ids: torch.LongTensor, cache: Optional[DynamicCache] = None) -> DynamicCache:
+        """Extend `cache` (or a fresh one) with the KV state of the tokens it does not cover yet"""
+        cache = cache if cache is not None else self._new_cache()
+        start = cache.get_seq_length()
+        if start < input_ids.shape[1]:
+            self.model(
+                input_ids=input_ids[:, start:],
+                past_key_values=cache,
+                cache_position=torch.arange(start, input_ids.shape[1], device=input_ids.device),
+                use_cache=True,
+            )
+        return cache
+
+    def _lookup(self, input_ids: torch.LongTensor):
+        """Find the cached entry sharing the longest prefix with input_ids"""
+        best, best_length = None, 0
+        for entry in self._entries:
+            length = self._common_prefix_length(entry["ids"], input_ids)
+            if length > best_length:
+                best, best_length = entry, length
+        return best, best_length
+
+    def _cache_for(self, input_ids: torch.LongTensor, prefix_messages: Optional[List[Dict[str, str]]]):
+        """Return a private copy of a KV cache covering as much of input_ids as possible"""
+        # generate() needs at least one uncached token to produce logits from
+        max_reuse = input_ids.shape[1] - 1
+        if prefix_messages is not None:
+            prefix_ids = self._encode(prefix_messages, add_generation_prompt=False)
+            wanted = min(self._common_prefix_length(prefix_ids, input_ids), max_reuse)
+        else:
+            wanted = max_reuse
+
+        with self._lock:
+            entry, length = self._lookup(input_ids)
+            reuse = min(length, max_reuse) if entry is not None else 0
+            if reuse < self.min_prefix_tokens:
+                entry, reuse = None, 0
+
+            if entry is not None:
+                self.hits += 1
+                self.reused_tokens += reuse
+                add_counter("llm.prefix_cache_hits")
+                add_counter("llm.prefix_reused_tokens", reuse)
+                # Entries hold tensors, so reorder by identity rather than list.remove's ==
+                self._entries = [e for e in self._entries if e is not entry] + [entry]
+                if reuse >= wanted:
+                    cache = copy.deepcopy(entry["cache"])
+                    cache.crop(reuse)
+                    return cache
+            else:
+                self.misses += 1
+                add_counter("llm.prefix_cache_misses")
+
+            if wanted < self.min_prefix_tokens:
+                return None
+
+            # Extend the shared part (e.g. the system prompt) with this prompt's own prefix
+            base = None
+            if entry is not None:
+                base = copy.deepcopy(entry["cache"])
+                base.crop(reuse)
+            new_entry = {"ids": input_ids[:, :wanted], "cache": self._prefill(input_ids[:, :wanted], base)}
+            self._entries.append(new_entry)
+            if len(self._entries) > self.max_entries:
+                self._entries.pop(0)
+            return copy.deepcopy(new_entry["cache"])
+
+    @torch.no_grad()
+    def generate(
+        self,
+        messages: List[Dict[str, str]],
+        prefix_messages: Optional[List[Dict[str, str]]] = None,
+        **generate_kwargs,
+    ) -> str:
+        """
+        Generate a reply to `messages`, reusing cached KV state for their prefix.
+        `prefix_messages` marks the part worth caching (e.g. system prompt + brand
+        context); without it the whole prompt is cached for exact repeats.
+        """
+        return self.generate_many(messages, prefix_messages, num_return_sequences=1, **generate_kwargs)[0]
+
+    @torch.no_grad()
+    def generate_many(
+        self,
+        messages: List[Dict[str, str]],
+        prefix_messages: Optional[List[Dict[str, str]]] = None,
+        num_return_sequences: int = 1,
+        **generate_kwargs,
+    ) -> List[str]:
+        """Sample several replies to `messages` in one batch that shares the cached prefix"""
+        input_ids = self._encode(messages)
+        try:
+            cache = self._cache_for(input_ids, prefix_messages)
+        except Exception as e:
+            print(f"Prefix cache unavailable, running full prefill: {e}")
+            cache = None
+        if cache is not None and num_return_sequences > 1:
+            # generate() repeats the prompt per sequence but not a cache passed in
+            cache.batch_repeat_interleave(num_return_sequences)
+
+        if self.tokenizer.pad_token_id is not None:
+            generate_kwargs.setdefault("pad_token_id", self.tokenizer.pad_token_id)
+        else:
+            generate_kwargs.setdefault("pad_token_id", self.tokenizer.eos_token_id)
+
+        output = self.model.generate(
+            input_ids=input_ids,
+            attention_mask=torch.ones_like(input_ids),
+            past_key_values=cache,
+            num_return_sequences=num_return_sequences,
+            **generate_kwargs,
+        )
+        return self.tokenizer.batch_decode(output[:, input_ids.shape[1]:], skip_special_tokens=True)
+
+    @torch.no_grad()
+    def generate_batch(
+        self,
+        conversations: List[List[Dict[str, str]]],
+        prefix_messages: Optional[List[Dict[str, str]]] = None,
+        **generate_kwargs,
+    ) -> List[str]:
+        """
+        Decode several conversations that share a prefix in one padded batch. The
+        shared prefix is prefilled once (or taken from the cache) and repeated across
+        the batch; each row's own suffix is left-padded after it, so rows are laid out
+        as [prefix][padding][suffix] with the padding masked out.
+        """
+        if len(conversations) == 1:
+            return [self.generate(conversations[0], prefix_messages, **generate_kwargs)]
+        rows = [self._encode(conversation) for conversation in conversations]
+        shared = min(self._common_prefix_length(rows[0], row) for row in rows[1:])
+        # Every row keeps at least one uncached token of its own
+        shared = min(shared, min(row.shape[1] for row in rows) - 1)
+        try:
+            cache = self._cache_for(rows[0][:, :shared + 1], prefix_messages)
+        except Exception as e:
+            print(f"Prefix cache unavailable, running full prefill: {e}")
+            cache = None
+        cached = cache.get_seq_length() if cache is not None else 0
+
+        pad_token_id = self.tokenizer.pad_token_id if self.tokenizer.pad_token_id is not None else self.tokenizer.eos_token_id
+        generate_kwargs.setdefault("pad_token_id", pad_token_id)
+        width = max(row.shape[1] for row in rows) - cached
+        input_ids = torch.full((len(rows), cached + width), pad_token_id, dtype=rows[0].dtype, device=rows[0].device)
+        attention_mask = torch.zeros_like(input_ids)
+        for i, row in enumerate(rows):
+            suffix = row.shape[1] - cached
+            input_ids[i, :cached] = row[0, :cached]
+            input_ids[i, cached + width - suffix:] = row[0, cached:]
+            attention_mask[i, :cached] = 1
+            attention_mask[i, cached + width - suffix:] = 1
+        if cache is not None:
+            cache.batch_repeat_interleave(len(rows))
+
+        output = self.model.generate(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            past_key_values=cache,
+            **generate_kwargs,
+        )
+        return self.tokenizer.batch_decode(output[:, input_ids.shape[1]:], skip_special_tokens=True)
+
+    def clear(self):
+        """Drop every cached prefix"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters and how many prefill tokens were skipped"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "reused_tokens": self.reused_tokens,
+            "entries": len(self._entries),
+        }
@@ -1,19 +1,27 @@
 import pandas as pd
-import re
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple, Union
+
+from app.config import PROMPT_TOKEN_BUDGET, PROMPT_TRIM_ORDER
+from app.template_compiler import load_template
 #import spaces
 
 class PromptBuilder:
     
-    def __init__(self, template_path: str):
-        """Initialize with the path to the prompt template file."""
+    def __init__(self, template_path: str, tokenizer=None, token_budget: Optional[int] = PROMPT_TOKEN_BUDGET):
+        """
+        Initialize with the path to the prompt template file. With a tokenizer, prompts
+        longer than token_budget tokens are trimmed (see _fit_to_budget).
+        """
         self.template_path = template_path
-        self.base_template = self._load_template()
-    
-    def _load_template(self) -> str:
-        """Load the base prompt template from file."""
-        with open(self.template_path, "r", encoding="utf-8") as f:
-            return f.read()
+        self.template = load_template(template_path)
+        self.tokenizer = tokenizer
+        self.token_budget = token_budget
+        self.last_report: Optional[Dict[str, Any]] = None
+
+    @property
+    def base_template(self) -> str:
+        """The template text as read from file."""
+        return self.template.source
     
     def build_prompt(
         self,
@@ -36,15 +44,21 @@ class PromptBuilder:
         num_video_briefs: int = 10,
         csv_data: Optional[str] = None,
         offer_headline_options: str = '',
-        reference_image_description: Optional[str] = None,
+        reference_image_description: Optional[Union[str, List[str]]] = None,
     ) -> str:
         """
-        Build the complete prompt by formatting the template and removing unavailable sections.
+        Build the complete prompt by rendering the compiled template: placeholders are
+        filled, list sections get the given items and optional sections without items are dropped.
+        With a tokenizer the prompt is fitted to token_budget; last_report says what was dropped.
         """
-        prompt = self.base_template
+        # Cached per file; only recompiled when the template changes on disk
+        self.template = load_template(self.template_path)
 
-        # Replace placeholders with actual values
-        prompt = self._replace_placeholders(prompt, {
+        # Add CSV data if provided
+        # if csv_data:
+        #     prompt = self._add_csv_data_section(prompt, csv_data)
+
+        values = {
             'brand_name': brand_name,
             'website_url': website_url,
             'product_name': product_name,
@@ -54,208 +68,78 @@ class PromptBuilder:
             'num_image_briefs': num_image_briefs,
             'num_video_briefs': num_video_briefs,
             'angle_and_benefits': angle_and_benefits if angle_and_benefits else '',
-            'reference_image_description': reference_image_description if reference_image_description else '',
+            'reference_image_description': self._format_image_descriptions(reference_image_description),
             'offer_headline_options': offer_headline_options if offer_headline_options else '',
-        })
-
-        # Format list sections
-        prompt = self._format_headlines_section(prompt, headlines)
-        prompt = self._format_subheadlines_section(prompt, subheadlines)
-        prompt = self._format_customer_reviews_section(prompt, customer_reviews)
-        prompt = self._format_benefits_section(prompt, benefits)
-        prompt = self._format_social_proof_section(prompt, social_proof)
-        prompt = self._format_content_bank_section(prompt, content_bank)
-
-        # Add CSV data if provided
-        # if csv_data:
-        #     prompt = self._add_csv_data_section(prompt, csv_data)
-
-        # Clean up any remaining placeholder sections
-        prompt = self._clean_empty_sections(prompt)
-
-        return prompt
-  
-    def _replace_placeholders(self, prompt: str, replacements: Dict[str, Any]) -> str:
-        """Replace placeholder values in the prompt."""
-        for key, value in replacements.items():
-            placeholder = '{' + key + '}'
-            if placeholder in prompt:
-                prompt = prompt.replace(placeholder, str(value))
-        return prompt
-  
-    def _format_headlines_section(self, prompt: str, headlines: Optional[List[str]]) -> str:
-        """Format or remove ONLY the 'Headlines Options' section, preserving the rest."""
-        if not headlines:
-            # Safely remove just the 'Headlines Options' section if no headlines are given
-            prompt = re.sub(
-                r'(Headlines Options:\n)(.*?)(\n(?:\w|[A-Z][a-z]+|Subheadline|Benefits|Social|Content|$))',
-                r'\3',  # preserve the following section header
-                prompt,
-                flags=re.DOTALL
-            )
-            return prompt
-
-        # Only the lines, not the section title
-        headlines_lines = ""
-        for i, headline in enumerate(headlines, 1):
-            headlines_lines += f"[Headline {i}] {headline}\n"
-
-        # Replace existing section if present
-        if "Headlines Options:" in prompt:
-            prompt = re.sub(
-                r'(Headlines Options:\n)(.*?)(\n(?:\w|[A-Z][a-z]+|Subheadline|Benefits|Social|Content|$))',
-                r'\1' + headlines_lines.strip() + r'\3',
-                prompt,
-                flags=re.DOTALL
-            )
-        else:
-            # No section exists – insert before Subheadline/Explainer Options or Benefits or Content Bank
-            insert_point = re.search(r'(?=\nSubheadline|Benefits of the product|Social Proof|Content Bank)', prompt)
-            if insert_point:
-                idx = insert_point.start()
-                prompt = prompt[:idx] + "\nHeadlines Options:\n" + headlines_lines.strip() + "\n" + prompt[idx:]
-            else:
-                # Fallback: append at the end
-                prompt += "\nHeadlines Options:\n" + headlines_lines.strip()
-
-        return prompt
-   
-    def _format_subheadlines_section(self, prompt: str, subheadlines: Optional[List[str]]) -> str:
-        """Format or remove the subheadlines section."""
-        if not subheadlines:
-            prompt = re.sub(
-                r'Subheadline/Explainer Options.*?(?=\n\n|\n[A-Z]|\nCustomer|\nBenefits|\nSocial|\nContent|$)',
-                '',
-                prompt,
-                flags=re.DOTALL
-            )
-            return prompt
-
-        subheadlines_text = "Subheadline/Explainer Options (often Explainer type lines):\n"
-        for i, subheadline in enumerate(subheadlines, 1):
-            subheadlines_text += f"[Subheadline {i}] {subheadline}\n"
-
-        prompt = re.sub(
-            r'Subheadline/Explainer Options.*?(?=\n\n|\n[A-Z]|\nCustomer|\nBenefits|\nSocial|\nContent|$)',
-            subheadlines_text.strip(),
-            prompt,
-            flags=re.DOTALL
-        )
-
-        return prompt
-    
-   
-    def _format_customer_reviews_section(self, prompt: str, customer_reviews: Optional[str]) -> str:
-        """Format or remove the customer reviews section."""
-        if not customer_reviews:
-            prompt = re.sub(
-                r'Customer Reviews for.*?(?=\n\n|\n[A-Z]|\nBenefits|\nSocial|\nContent|$)',
-                '',
-                prompt,
-                flags=re.DOTALL
-            )
+        }
+        sections = {
+            'headlines': headlines,
+            'subheadlines': subheadlines,
+            'customer_reviews': customer_reviews,
+            'benefits': benefits,
+            'social_proof': social_proof,
+            'content_bank': content_bank,
+        }
+        prompt = self.template.render(values, sections)
+
+        self.last_report = None
+        if self.tokenizer is None or not self.token_budget:
             return prompt
-
-        reviews_text = f"Customer Reviews for [Angle]: \n{customer_reviews}"
-        prompt = re.sub(
-            r'Customer Reviews for.*?(?=\n\n|\n[A-Z]|\nBenefits|\nSocial|\nContent|$)',
-            reviews_text,
-            prompt,
-            flags=re.DOTALL
-        )
-
-        return prompt
-   
-    def _format_benefits_section(self, prompt: str, benefits_list: Optional[List[str]]) -> str:
-        """Format the Product Benefits section."""
-        if not benefits_list:
-            # Use default benefits from template
-            return prompt
-
-        # Create the new benefits text block
-        benefits_text = "Product Benefits:\n"
-        for benefit in benefits_list:
-            benefits_text += f"- {benefit}\n"
-
-        # Replace the existing Product Benefits block using regex
-        prompt = re.sub(
-            r'Product Benefits:\n(?:- .*\n)*',
-            benefits_text,
-            prompt,
-            flags=re.DOTALL
-        )
-
+        prompt, self.last_report = self._fit_to_budget(prompt, values, sections, reference_image_description)
         return prompt
 
+    def count_tokens(self, text: str) -> int:
+        """Number of tokens text takes with the builder's tokenizer."""
+        return len(self.tokenizer(text, add_special_tokens=False)["input_ids"])
 
-    # def _format_benefits_section(self, prompt: str, benefits: Optional[List[str]]) -> str:
-    #     """Format or remove the benefits section."""
-    #     if not benefits:
-    #         prompt = re.sub(
-    #             r'Benefits of the product.*?(?=\n\n|\n[A-Z]|\nSocial|\nContent|$)',
-    #             '',
-    #             prompt,
-    #             flags=re.DOTALL
-    #         )
-    #         return prompt
-
-    #     benefits_text = "Benefits of the product for this angle:\n"
-    #     for i, benefit in enumerate(benefits, 1):
-    #         benefits_text += f"[Benefit {i}] {benefit}\n"
-
-    #     prompt = re.sub(
-    #         r'Benefits of the product.*?(?=\n\n|\n[A-Z]|\nSocial|\nContent|$)',
-    #         benefits_text.strip(),
-    #         prompt,
-    #         flags=re.DOTALL
-    #     )
-
-    #     return prompt
-    
-    def _format_social_proof_section(self, prompt: str, social_proof: Optional[List[str]]) -> str:
-        """Format or remove the social proof section."""
-        if not social_proof:
-            prompt = re.sub(
-                r'Social Proof Points.*?(?=\n\n|\n[A-Z]|\nContent|$)',
-                '',
-                prompt,
-                flags=re.DOTALL
-            )
-            return prompt
-
-        social_proof_text = "Social Proof Points (# of customers, PR logos, or very notable PR quotes, any other social proof points)\n"
-        for i, proof in enumerate(social_proof, 1):
-            social_proof_text += f"Social proof point {i}: {proof}\n"
-
-        prompt = re.sub(
-            r'Social Proof Points \(# of customers, PR logos,.*?(?=\n\n|\n[A-Z]|\nContent|$)',
-            social_proof_text.strip(),
-            prompt,
-            flags=re.DOTALL
-        )
-
-        return prompt
-    
-    def _format_content_bank_section(self, prompt: str, content_bank: Optional[List[str]]) -> str:
-        """Format the content bank section."""
-        if not content_bank:
-            # Use default content bank from template
-            return prompt
-
-        content_bank_text = "Content Bank - Please limit your visual recommendations to the following types of content, and anything that deviates from this list must only be very realistically accessible stock images/videos:\n"
-        for content_type in content_bank:
-            content_bank_text += f"{content_type}\n"
-
-        prompt = re.sub(
-            r'(Content Bank - Please limit.*?)(?=\nReference Materials:)',
-            content_bank_text.strip() + '\n',
-            prompt,
-            flags=re.DOTALL
-        )
-
-        return prompt
-
-   
+    def _fit_to_budget(
+        self,
+        prompt: str,
+        values: Dict[str, Any],
+        sections: Dict[str, Any],
+        reference_image_description: Optional[Union[str, List[str]]],
+    ) -> Tuple[str, Dict[str, Any]]:
+        """
+        Trim the prompt to token_budget by dropping list items, last ones first, from the
+        sections in PROMPT_TRIM_ORDER (lowest priority first). Each round drops enough of
+        one section's items to cover the estimated overflow, then re-renders and recounts.
+        Returns the prompt and a report of its size and what was dropped.
+        """
+        original_tokens = tokens = self.count_tokens(prompt)
+        items = dict(sections, reference_image_description=reference_image_description)
+        trimmable = {name: list(items[name]) for name in PROMPT_TRIM_ORDER if isinstance(items.get(name), list) and items[name]}
+        dropped: Dict[str, int] = {}
+
+        while tokens > self.token_budget:
+            name = next((name for name in PROMPT_TRIM_ORDER if trimmable.get(name)), None)
+            if name is None:
+                print(f"Prompt is {tokens} tokens, over the {self.token_budget} budget with every optional item dropped")
+                break
+            overflow = tokens - self.token_budget
+            while trimmable[name] and overflow > 0:
+                overflow -= self.count_tokens(str(trimmable[name].pop())) + 1
+                dropped[name] = dropped.get(name, 0) + 1
+            if name == 'reference_image_description':
+                values = dict(values, reference_image_description=self._format_image_descriptions(trimmable[name]))
+            else:
+                sections = dict(sections, **{name: trimmable[name]})
+            prompt = self.template.render(values, sections)
+            tokens = self.count_tokens(prompt)
+
+        if dropped:
+            summary = ", ".join(f"{count} from {name}" for name, count in dropped.items())
+            print(f"Prompt trimmed from {original_tokens} to {tokens} tokens (budget {self.token_budget}); dropped {summary}")
+        return prompt, {"tokens": tokens, "original_tokens": original_tokens, "budget": self.token_budget, "dropped": dropped}
+  
+    def _format_image_descriptions(self, descriptions: Optional[Union[str, List[str]]]) -> str:
+        """Format one description, or a per-image list of them, for the reference materials section."""
+        if not descriptions:
+            return ''
+        if isinstance(descriptions, str):
+            return descriptions
+        if len(descriptions) == 1:
+            return descriptions[0]
+        return "\n" + "\n".join(f"[Image {i}] {description}" for i, description in enumerate(descriptions, 1))
+  
     def _add_csv_data_section(self, prompt: str, csv_data: str) -> str:
         """Add CSV data section to the prompt after a specific reference sentence."""
 
@@ -276,13 +160,6 @@ class PromptBuilder:
 
         return prompt
 
-   
-    def _clean_empty_sections(self, prompt: str) -> str:
-        """Clean up any remaining empty sections or multiple newlines."""
-        # Remove multiple consecutive newlines
-        prompt = re.sub(r'\n{3,}', '\n\n', prompt)
-        
-        return prompt.strip()
 def create_ad_brief_prompt(
     brand_name: str,
     template_path: str = "templates/evergreen_template.txt",
@@ -0,0 +1,386 @@
+import contextvars
+import json
+import os
+import re
+import resource
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional
+
+from transformers.generation.streamers import BaseStreamer
+
+from app.config import TELEMETRY_ENABLED, TELEMETRY_TRACE_PATH, TELEMETRY_PROMETHEUS_PORT
+#import spaces
+
+# The trace (one per brief run) and span that work on this thread/context belongs to
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("current_trace", default=None)
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+def _cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        return None
+
+
+class Trace:
+    """
+    Spans and counters for one brief run.
+    Spans are timed relative to the start of the trace; counters are summed. Both can
+    be recorded from worker threads as long as they run in a copy of the run's context.
+    """
+
+    def __init__(self, telemetry: "Telemetry", name: str, **attributes):
+        self.telemetry = telemetry
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.attributes: Dict[str, Any] = dict(attributes)
+        self.spans: List[Dict[str, Any]] = []
+        self.counters: Dict[str, float] = {}
+        self.status = "ok"
+        self.error: Optional[str] = None
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self._cpu_started = _cpu_seconds()
+        self._rss_started = _rss_bytes()
+        self._finished = False
+        self._lock = threading.Lock()
+
+    def offset_ms(self, timestamp: float) -> float:
+        """Milliseconds between the trace start and a perf_counter timestamp"""
+        return round((timestamp - self._started) * 1000, 3)
+
+    def add_span(self, name: str, started: float, ended: float, parent: Optional[str] = None, **attributes):
+        """Record a finished span from perf_counter start/end timestamps"""
+        span = {
+            "name": name,
+            "parent": parent,
+            "start_ms": self.offset_ms(started),
+            "duration_ms": round((ended - started) * 1000, 3),
+        }
+        if attributes:
+            span["attributes"] = attributes
+        with self._lock:
+            self.spans.append(span)
+
+    def add(self, name: str, value: float = 1):
+        """Increment a counter"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_status(self, status: str, error: Optional[str] = None):
+        self.status = status
+        self.error = error
+
+    @contextmanager
+    def active(self) -> Iterator["Trace"]:
+        """Make this the current trace for the enclosed block"""
+        token = _current_trace.set(self)
+        try:
+            yield self
+        finally:
+            _current_trace.reset(token)
+
+    def iterate(self, iterator: Iterator) -> Iterator:
+        """
+        Advance `iterator` with this trace active on every step. Gradio may resume a
+        streaming callback on a different thread each time, so a context set in one
+        step does not carry over to the next.
+        """
+        iterator = iter(iterator)
+        try:
+            while True:
+                with self.active():
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        return
+                yield item
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                with self.active():
+                    close()
+
+    def to_record(self) -> Dict[str, Any]:
+        """The JSON-serialisable trace record handed to exporters"""
+        rss_finished = _rss_bytes()
+        with self._lock:
+            return {
+                "trace_id": self.trace_id,
+                "name": self.name,
+                "started_at": self.started_at,
+                "duration_ms": self.offset_ms(time.perf_counter()),
+                "status": self.status,
+                "error": self.error,
+                "attributes": self.attributes,
+                "spans": sorted(self.spans, key=lambda span: span["start_ms"]),
+                "counters": dict(self.counters),
+                "resources": {
+                    "cpu_seconds": round(_cpu_seconds() - self._cpu_started, 3),
+                    "rss_bytes": rss_finished,
+                    "rss_delta_bytes": rss_finished - self._rss_started
+                    if rss_finished is not None and self._rss_started is not None else None,
+                },
+            }
+
+    def finish(self):
+        """Close the trace and hand it to the exporters (once)"""
+        if self._finished:
+            return
+        self._finished = True
+        self.telemetry.export(self.to_record())
+
+
+class JsonlExporter:
+    """Appends one JSON line per trace to a file"""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._lock = threading.Lock()
+
+    def export(self, record: Dict[str, Any]):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        line = json.dumps(record, default=str)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+class PrometheusExporter:
+    """
+    Aggregates traces into Prometheus text-format metrics served at /metrics:
+    run counts by status, span duration sum/count by span name, counter totals.
+    """
+
+    def __init__(self, port: int, host: str = "0.0.0.0", prefix: str = "brief"):
+        self.prefix = prefix
+        self._runs: Dict[str, int] = {}
+        self._span_seconds: Dict[str, float] = {}
+        self._span_count: Dict[str, int] = {}
+        self._counters: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        threading.Thread(target=self.server.serve_forever, name="prometheus-exporter", daemon=True).start()
+        print(f"Serving Prometheus metrics on http://{host}:{self.server.server_address[1]}/metrics")
+
+    def _handler(self):
+        exporter = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = exporter.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return MetricsHandler
+
+    def export(self, record: Dict[str, Any]):
+        with self._lock:
+            self._runs[record["status"]] = self._runs.get(record["status"], 0) + 1
+            for span in record["spans"]:
+                self._span_seconds[span["name"]] = self._span_seconds.get(span["name"], 0.0) + span["duration_ms"] / 1000
+                self._span_count[span["name"]] = self._span_count.get(span["name"], 0) + 1
+            for name, value in record["counters"].items():
+                self._counters[name] = self._counters.get(name, 0) + value
+
+    def _metric_name(self, name: str) -> str:
+        return f"{self.prefix}_{re.sub(r'[^a-zA-Z0-9_]', '_', name)}"
+
+    def render(self) -> str:
+        """Current metrics in the Prometheus text exposition format"""
+        runs, spans = f"{self.prefix}_runs_total", f"{self.prefix}_span_seconds"
+        with self._lock:
+            lines = [f"# TYPE {runs} counter"]
+            lines += [f'{runs}{{status="{status}"}} {count}' for status, count in sorted(self._runs.items())]
+            lines.append(f"# TYPE {spans} summary")
+            for name in sorted(self._span_count):
+                lines.append(f'{spans}_sum{{span="{name}"}} {self._span_seconds[name]:.6f}')
+                lines.append(f'{spans}_count{{span="{name}"}} {self._span_count[name]}')
+            for name, value in sorted(self._counters.items()):
+                metric = self._metric_name(name) + "_total"
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class Telemetry:
+    """Creates traces and passes each finished one to every exporter"""
+
+    def __init__(self, exporters: Optional[List[Any]] = None, enabled: bool = True):
+        self.exporters = exporters or []
+        self.enabled = enabled
+
+    def start_trace(self, name: str, **attributes) -> Trace:
+        return Trace(self, name, **attributes)
+
+    @contextmanager
+    def trace(self, name: str, **attributes) -> Iterator[Trace]:
+        """Run the enclosed block as one trace; exceptions mark it as failed"""
+        trace = self.start_trace(name, **attributes)
+        try:
+            with trace.active():
+                yield trace
+        except Exception as e:
+            trace.set_status("error", str(e))
+            raise
+        finally:
+            trace.finish()
+
+    def export(self, record: Dict[str, Any]):
+        if not self.enabled:
+            return
+        for exporter in self.exporters:
+            try:
+                exporter.export(record)
+            except Exception as e:
+                print(f"Error exporting trace with {type(exporter).__name__}: {e}")
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Dict[str, Any]]:
+    """
+    Time the enclosed block as a span of the current trace (a no-op outside one).
+    Yields a dict; attributes added to it inside the block are recorded with the span.
+    """
+    trace = _current_trace.get()
+    attributes = dict(attributes)
+    if trace is None:
+        yield attributes
+        return
+    parent = _current_span.get()
+    token = _current_span.set(name)
+    started = time.perf_counter()
+    try:
+        yield attributes
+    except Exception as e:
+        attributes["error"] = str(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        trace.add_span(name, started, time.perf_counter(), parent=parent, **attributes)
+
+
+def add_counter(name: str, value: float = 1):
+    """Increment a counter on the current trace (a no-op outside one)"""
+    trace = _current_trace.get()
+    if trace is not None and value:
+        trace.add(name, value)
+
+
+def run_in_context(fn):
+    """
+    Wrap fn so it runs in a copy of the caller's context (current trace included) on
+    another thread. Wrap once per task: a context cannot be entered by two threads at once.
+    """
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+class GenerationTimer(BaseStreamer):
+    """
+    Streamer that splits a generate() call into prefill and decode spans.
+    generate() hands the prompt to the streamer first and then every decoded step,
+    so the second put() marks the first token. Optionally forwards to another streamer.
+
+    Token counts leave out padding: with `pad_token_id`, padded prompt rows and the
+    pad tokens finished rows keep emitting are not counted (nor an EOS that doubles as
+    pad). `prompt_tokens` gives the exact unpadded prompt size when the caller knows it.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        streamer: Optional[BaseStreamer] = None,
+        pad_token_id: Optional[int] = None,
+        prompt_tokens: Optional[int] = None,
+    ):
+        self.name = name
+        self.streamer = streamer
+        self.pad_token_id = pad_token_id
+        self.trace = _current_trace.get()
+        self.parent = _current_span.get()
+        self.started = time.perf_counter()
+        self.first_token: Optional[float] = None
+        self.known_prompt_tokens = prompt_tokens
+        self.prompt_tokens = 0
+        self.generated_tokens = 0
+        self._seen_prompt = False
+
+    def _count(self, value) -> int:
+        """Tokens in value other than padding"""
+        if self.pad_token_id is None:
+            return int(value.numel())
+        return int((value != self.pad_token_id).sum())
+
+    def put(self, value):
+        if not self._seen_prompt:
+            self._seen_prompt = True
+            if self.known_prompt_tokens is not None:
+                self.prompt_tokens = self.known_prompt_tokens
+            else:
+                # A single row has no padding (and may hold an EOS that doubles as pad)
+                self.prompt_tokens = int(value.numel()) if value.dim() < 2 or value.shape[0] == 1 else self._count(value)
+        else:
+            if self.first_token is None:
+                self.first_token = time.perf_counter()
+            self.generated_tokens += self._count(value)
+        if self.streamer is not None:
+            self.streamer.put(value)
+
+    def end(self):
+        if self.streamer is not None:
+            self.streamer.end()
+        self.record()
+
+    def record(self):
+        """Record the prefill/decode spans and token counters (once, at the end of generate)"""
+        if self.trace is None:
+            return
+        ended = time.perf_counter()
+        first_token = self.first_token or ended
+        self.trace.add_span(f"{self.name}.prefill", self.started, first_token, parent=self.parent, tokens=self.prompt_tokens)
+        self.trace.add_span(f"{self.name}.decode", first_token, ended, parent=self.parent, tokens=self.generated_tokens)
+        self.trace.add(f"{self.name}.prompt_tokens", self.prompt_tokens)
+        self.trace.add(f"{self.name}.generated_tokens", self.generated_tokens)
+        self.trace = None
+
+
+# Global instance configured from app.config
+_telemetry_instance = None
+
+#@spaces.GPU
+def get_telemetry() -> Telemetry:
+    """Get the singleton telemetry with the configured exporters"""
+    global _telemetry_instance
+    if _telemetry_instance is None:
+        exporters: List[Any] = [JsonlExporter(TELEMETRY_TRACE_PATH)]
+        if TELEMETRY_PROMETHEUS_PORT:
+            try:
+                exporters.append(PrometheusExporter(TELEMETRY_PROMETHEUS_PORT))
+            except OSError as e:
+                print(f"Error starting Prometheus exporter: {e}")
+        _telemetry_instance = Telemetry(exporters, enabled=TELEMETRY_ENABLED)
+    return _telemetry_instance
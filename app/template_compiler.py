@@ -0,0 +1,163 @@
+import os
+import re
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional, Pattern, Tuple, Union
+#import spaces
+
+_PLACEHOLDER = re.compile(r'\{(\w+)\}')
+_BLANK_RUNS = re.compile(r'\n{3,}')
+
+
+class SectionSpec(NamedTuple):
+    """A list section of the user prompt templates and how build_prompt fills it"""
+    name: str               # build_prompt argument the items come from
+    header: str             # prefix of the section's header line
+    item: str               # format of each item line ({i} is 1-based)
+    body_end: Pattern       # first line after the header matching this ends the body
+    optional: bool          # dropped without items; otherwise the template's own body is kept
+    filled_header: Optional[str] = None   # header line written with items (default: the template's)
+    filled_footer: str = ""               # text written after the items
+
+
+_BLANK_OR_CAPITAL = re.compile(r'\s*$|[A-Z]')
+
+# Filled headers and spacing match what PromptBuilder wrote before templates were compiled;
+# tests/golden holds the rendered prompts
+SECTION_SPECS = [
+    SectionSpec("headlines", "Headlines Options:", "[Headline {i}] {item}", re.compile(r'\w'), True),
+    SectionSpec(
+        "subheadlines", "Subheadline/Explainer Options", "[Subheadline {i}] {item}", _BLANK_OR_CAPITAL, True,
+        filled_header="Subheadline/Explainer Options (often Explainer type lines):",
+    ),
+    SectionSpec(
+        "customer_reviews", "Customer Reviews for", "{item}", _BLANK_OR_CAPITAL, True,
+        filled_header="Customer Reviews for [Angle]: ",
+    ),
+    SectionSpec("benefits", "Product Benefits:", "- {item}", re.compile(r'(?!- )'), False),
+    SectionSpec(
+        "social_proof", "Social Proof Points", "Social proof point {i}: {item}", _BLANK_OR_CAPITAL, True,
+        filled_header="Social Proof Points (# of customers, PR logos, or very notable PR quotes, any other social proof points)",
+    ),
+    SectionSpec(
+        "content_bank", "Content Bank", "{item}", re.compile(r'\s*$|Reference Materials:'), False,
+        filled_header=(
+            "Content Bank - Please limit your visual recommendations to the following types of content, "
+            "and anything that deviates from this list must only be very realistically accessible stock images/videos:"
+        ),
+        filled_footer="\n",
+    ),
+]
+
+# Text split into (literal, placeholder name or None) pieces
+Pieces = List[Tuple[str, Optional[str]]]
+
+
+def _split_placeholders(text: str) -> Pieces:
+    pieces, last = [], 0
+    for match in _PLACEHOLDER.finditer(text):
+        pieces.append((text[last:match.start()], match.group(1)))
+        last = match.end()
+    pieces.append((text[last:], None))
+    return pieces
+
+
+class CompiledTemplate:
+    """
+    A prompt template parsed once into text runs and list sections.
+
+    Text is pre-split around {placeholders}; each line starting with a SECTION_SPECS
+    header opens a section whose body runs until a line matching the spec's body_end.
+    render() fills everything in one pass over these nodes.
+    """
+
+    def __init__(self, source: str):
+        self.source = source
+        self.nodes: List[Tuple] = []
+        self._parse(source)
+        self.placeholders = {
+            name
+            for node in self.nodes
+            for pieces in node[1:] if isinstance(pieces, list)
+            for _, name in pieces if name
+        }
+        self.sections = [node[1].name for node in self.nodes if node[0] == "section"]
+
+    def _parse(self, source: str):
+        lines = source.splitlines(keepends=True)
+        text: List[str] = []
+        i = 0
+        while i < len(lines):
+            spec = next((spec for spec in SECTION_SPECS if lines[i].startswith(spec.header)), None)
+            if spec is None:
+                text.append(lines[i])
+                i += 1
+                continue
+            if text:
+                self.nodes.append(("text", _split_placeholders("".join(text))))
+                text = []
+            header = lines[i] if lines[i].endswith("\n") else lines[i] + "\n"
+            i += 1
+            body_start = i
+            while i < len(lines) and not spec.body_end.match(lines[i]):
+                i += 1
+            self.nodes.append(("section", spec, _split_placeholders(header), _split_placeholders("".join(lines[body_start:i]))))
+        if text:
+            self.nodes.append(("text", _split_placeholders("".join(text))))
+
+    def render(self, values: Dict[str, Any], sections: Dict[str, Optional[Union[str, List[str]]]]) -> str:
+        """
+        Fill placeholders from `values` (missing ones render empty) and list sections
+        from `sections`; a dropped section leaves a blank line, runs of blank lines are
+        collapsed and the result stripped.
+        """
+        out: List[str] = []
+
+        def emit(pieces: Pieces):
+            for literal, name in pieces:
+                out.append(literal)
+                if name is not None:
+                    value = values.get(name)
+                    out.append("" if value is None else str(value))
+
+        for node in self.nodes:
+            if node[0] == "text":
+                emit(node[1])
+                continue
+            _, spec, header, body = node
+            items = sections.get(spec.name)
+            if isinstance(items, str):
+                items = [items]
+            if items:
+                if spec.filled_header is None:
+                    emit(header)
+                else:
+                    out.append(spec.filled_header + "\n")
+                out.extend(spec.item.format(i=i, item=item) + "\n" for i, item in enumerate(items, 1))
+                out.append(spec.filled_footer)
+            elif not spec.optional:
+                emit(header)
+                emit(body)
+            else:
+                out.append("\n")
+        return _BLANK_RUNS.sub("\n\n", "".join(out)).strip()
+
+
+# Compiled templates keyed by absolute path, with the (mtime, size) they were read at
+_compiled_templates: Dict[str, Tuple[Tuple[int, int], CompiledTemplate]] = {}
+_compiled_lock = threading.Lock()
+
+
+def load_template(path: Union[str, os.PathLike]) -> CompiledTemplate:
+    """Compiled template for a file, recompiled only when the file has changed"""
+    path = os.path.abspath(str(path))
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    with _compiled_lock:
+        cached = _compiled_templates.get(path)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    with open(path, "r", encoding="utf-8") as f:
+        template = CompiledTemplate(f.read())
+    with _compiled_lock:
+        _compiled_templates[path] = (version, template)
+    return template
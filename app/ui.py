@@ -1,3 +1,4 @@
+import inspect
 import gradio as gr
 from app.form_models import generate_headlines, generate_subheadlines
 #import spaces
@@ -18,7 +19,7 @@ def build_ui(generate_callback):
         with gr.Accordion("📌 Angle + Content Input", open=True):
             campaign_type = gr.Radio(["Evergreen", "Promo"], label="Campaign Type")
             swipe_csv = gr.File(label="Upload Swipe CSV", file_types=[".csv"])
-            reference_images = gr.File(label="Upload Reference Images", file_types=[".png", ".jpg", ".jpeg"], file_count="multiple")
+            reference_images = gr.File(label="Upload Reference Images", file_types=[".png", ".jpg", ".jpeg", ".zip"], file_count="multiple")
 
             angle_description = gr.Textbox(label="Angle Description", lines=3, placeholder="e.g., Emphasize natural air purification without harsh chemicals.")
             angle_and_benefits = gr.Textbox(label="Product Benefits with this angle", lines=3, placeholder="e.g., Azuna purifies air with plant-based technology...")
@@ -41,7 +42,9 @@ def build_ui(generate_callback):
             num_image_briefs = gr.Slider(label="Number of Static Briefs", minimum=1, maximum=20, value=10, step=1)
             num_video_briefs = gr.Slider(label="Number of Video Briefs", minimum=1, maximum=20, value=10, step=1)
 
-        generate_btn = gr.Button("🚀 Generate Brief", variant="primary")
+        with gr.Row():
+            generate_btn = gr.Button("🚀 Generate Brief", variant="primary")
+            stop_btn = gr.Button("⏹️ Stop", variant="stop")
         
         # Output section
         output_markdown = gr.Markdown("### Brief Output will appear here...")
@@ -66,6 +69,8 @@ def build_ui(generate_callback):
             ),
             inputs=[brand_name, angle_description],
             outputs=headlines_df,
+            # Concurrent clicks are merged into one Gemma batch by the headline batcher
+            concurrency_limit=None,
         )
 
         generate_subheadlines_btn.click(
@@ -74,38 +79,25 @@ def build_ui(generate_callback):
             ),
             inputs=[brand_name, angle_description],
             outputs=subheadlines_df,
+            concurrency_limit=None,
         )
 
         # Final prompt generation with download functionality
-        def handle_generation_and_downloads(*args):
-            # Call the original generate callback
-            result = generate_callback(*args)
-            
+        def render_result(result):
             if isinstance(result, tuple) and len(result) == 4:
                 output_text, md_path, txt_path, pdf_path = result
                 
-                # If generation was successful and files were created
-                if md_path and txt_path and pdf_path:
-                    return (
-                        output_text,
-                        gr.update(visible=True),  # Show download row
-                        gr.update(value=md_path, visible=True),  # MD download
-                        gr.update(value=txt_path, visible=True),  # TXT download
-                        gr.update(value=pdf_path, visible=True),  # PDF download
-                        md_path,  # Store in state
-                        txt_path,  # Store in state
-                        pdf_path   # Store in state
-                    )
-                else:
-                    # Generation failed
-                    return (
-                        output_text,
-                        gr.update(visible=False),  # Hide download row
-                        gr.update(visible=False),  # Hide MD download
-                        gr.update(visible=False),  # Hide TXT download
-                        gr.update(visible=False),  # Hide PDF download
-                        None, None, None  # Clear states
-                    )
+                # MD and TXT arrive as soon as the brief is saved; the PDF may follow later or not at all
+                return (
+                    output_text,
+                    gr.update(visible=any((md_path, txt_path, pdf_path))),  # Download row
+                    gr.update(value=md_path, visible=md_path is not None),  # MD download
+                    gr.update(value=txt_path, visible=txt_path is not None),  # TXT download
+                    gr.update(value=pdf_path, visible=pdf_path is not None),  # PDF download
+                    md_path,  # Store in state
+                    txt_path,  # Store in state
+                    pdf_path   # Store in state
+                )
             else:
                 # Handle old format or errors
                 return (
@@ -117,7 +109,15 @@ def build_ui(generate_callback):
                     None, None, None
                 )
 
-        generate_btn.click(
+        def handle_generation_and_downloads(*args):
+            # Streaming callbacks yield partial briefs; plain ones return once
+            if inspect.isgeneratorfunction(generate_callback):
+                for result in generate_callback(*args):
+                    yield render_result(result)
+            else:
+                yield render_result(generate_callback(*args))
+
+        generation_event = generate_btn.click(
             handle_generation_and_downloads,
             inputs=[
                 brand_name, product_name, website_url, target_audience, tone,
@@ -138,7 +138,12 @@ def build_ui(generate_callback):
                 md_file_state,
                 txt_file_state,
                 pdf_file_state
-            ]
+            ],
+            # Jobs bound the GPU work, so sessions only wait here while following their job
+            concurrency_limit=None,
         )
 
+        # Cancelling closes the streaming generator, which stops decoding on the GPU
+        stop_btn.click(fn=None, inputs=None, outputs=None, cancels=[generation_event])
+
     return demo
\ No newline at end of file
@@ -0,0 +1,217 @@
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+from pathlib import Path
+
+from PIL import Image, ImageOps
+
+from app.cache import PreparedImageCache, file_digest, text_digest
+from app.config import (
+    VLM_IMAGE_CACHE_DIR, VLM_IMAGE_CACHE_MAX_BYTES, VLM_IMAGE_MAX_SIDE, VLM_IMAGE_QUALITY,
+    IMAGE_PREP_WORKERS, IMAGE_PREP_POOL_MIN_IMAGES,
+)
+#import spaces
+
+# Bump when prepare_image changes its output, so old cache entries are not reused
+PREPARE_VERSION = "1"
+
+# Pillow formats accepted as reference images
+IMAGE_FORMATS = {"JPEG", "MPO", "PNG", "GIF", "BMP", "WEBP"}
+
+
+def is_valid_image(path: Union[str, Path]) -> bool:
+    """Whether a file is a readable image in a supported format (checks structure without decoding pixels)"""
+    try:
+        with Image.open(path) as image:
+            if image.format not in IMAGE_FORMATS:
+                return False
+            image.verify()
+        return True
+    except Exception:
+        return False
+
+
+def prepare_image(source_path: str, target_path: str, max_side: int, quality: int = VLM_IMAGE_QUALITY) -> str:
+    """
+    Decode an image at reduced size, downscale it to fit max_side, normalize it to RGB
+    (transparency flattened onto white, EXIF rotation applied) and write it as JPEG.
+    JPEGs are decoded in draft mode, which scales during decoding, so a 6000px photo is
+    never held in memory at full resolution.
+    """
+    with Image.open(source_path) as image:
+        if image.format == "JPEG":
+            image.draft("RGB", (max_side, max_side))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+
+        os.makedirs(os.path.dirname(target_path) or ".", exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target_path) or ".", suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                image.save(f, format="JPEG", quality=quality)
+            os.replace(tmp_path, target_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    return target_path
+
+
+def _prepare_checked(source_path: str, target_path: str, max_side: int, quality: int) -> Tuple[Optional[str], Optional[str]]:
+    """Validate and prepare one image; returns (target_path, None) or (None, error)"""
+    try:
+        if not is_valid_image(source_path):
+            return None, "not a valid image"
+        return prepare_image(source_path, target_path, max_side, quality), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def available_cpus() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def image_pool_workers() -> int:
+    """Threads in the image preparation pool: IMAGE_PREP_WORKERS, or one per available core"""
+    return IMAGE_PREP_WORKERS or available_cpus()
+
+
+# Shared pool for image preparation, started on first use
+_image_pool: Optional[ThreadPoolExecutor] = None
+_image_pool_lock = threading.Lock()
+
+
+def get_image_pool() -> ThreadPoolExecutor:
+    """
+    Get the thread pool preparing images. Pillow releases the GIL while decoding,
+    resizing and encoding, so threads run those in parallel without the start-up
+    cost and memory of worker processes.
+    """
+    global _image_pool
+    with _image_pool_lock:
+        if _image_pool is None:
+            _image_pool = ThreadPoolExecutor(max_workers=image_pool_workers(), thread_name_prefix="image-prep")
+        return _image_pool
+
+
+class VisualParser:
+    """
+    Preprocessing stage between downloaded reference images and the VLM processor.
+    Each image is decoded and downscaled once (see prepare_image) and the result is
+    cached by content hash + target size, so repeat runs load a small JPEG instead of
+    the original file.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Union[str, Path] = VLM_IMAGE_CACHE_DIR,
+        max_side: int = VLM_IMAGE_MAX_SIDE,
+        max_bytes: int = VLM_IMAGE_CACHE_MAX_BYTES,
+        quality: int = VLM_IMAGE_QUALITY,
+    ):
+        self.cache = PreparedImageCache(cache_dir, max_bytes=max_bytes)
+        self.max_side = max_side
+        self.quality = quality
+
+    def cache_key(self, image_path: str, max_side: int, digest: Optional[str] = None) -> str:
+        """Cache key for an image at a target size; pass the file's digest if it is already known"""
+        return text_digest(digest or file_digest(image_path), str(max_side), str(self.quality), PREPARE_VERSION)
+
+    def prepare_path(self, image_path: str, max_side: Optional[int] = None) -> str:
+        """Path of the prepared copy of an image, creating it on a cache miss"""
+        max_side = max_side or self.max_side
+        key = self.cache_key(image_path, max_side)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        target_path = str(self.cache.path_for(key))
+        prepare_image(image_path, target_path, max_side, self.quality)
+        self.cache.put(key, target_path)
+        return target_path
+
+    def prepare_many(
+        self,
+        image_paths: List[str],
+        max_side: Optional[int] = None,
+        digests: Optional[List[Optional[str]]] = None,
+    ) -> Iterator[Tuple[int, Optional[str]]]:
+        """
+        Prepare several images, yielding (index, prepared path or None) as each one is
+        ready: cache hits first, then misses in completion order. With at least
+        IMAGE_PREP_POOL_MIN_IMAGES misses they are validated, decoded and resized in the
+        shared thread pool, so the caller can start on early images while later ones
+        are still being prepared. Invalid or unreadable files yield None. `digests`
+        holds the files' content digests when the caller has already hashed them.
+        """
+        max_side = max_side or self.max_side
+        hits: List[Tuple[int, Optional[str]]] = []
+        misses: Dict[int, str] = {}
+        for i, path in enumerate(image_paths):
+            try:
+                key = self.cache_key(path, max_side, digests[i] if digests else None)
+            except Exception as e:
+                print(f"Error reading image {path}: {e}")
+                hits.append((i, None))
+                continue
+            cached = self.cache.get(key)
+            if cached is not None:
+                hits.append((i, cached))
+            else:
+                misses[i] = key
+
+        if len(misses) < IMAGE_PREP_POOL_MIN_IMAGES:
+            yield from hits
+            for i, key in misses.items():
+                yield i, self._finish(image_paths[i], key, *_prepare_checked(
+                    image_paths[i], str(self.cache.path_for(key)), max_side, self.quality
+                ))
+            return
+
+        pool = get_image_pool()
+        futures = {
+            pool.submit(_prepare_checked, image_paths[i], str(self.cache.path_for(key)), max_side, self.quality): (i, key)
+            for i, key in misses.items()
+        }
+        try:
+            yield from hits
+            for future in as_completed(futures):
+                i, key = futures[future]
+                yield i, self._finish(image_paths[i], key, *future.result())
+        finally:
+            # The caller stopped early: drop work that has not started
+            for future in futures:
+                future.cancel()
+
+    def _finish(self, image_path: str, key: str, target_path: Optional[str], error: Optional[str]) -> Optional[str]:
+        if target_path is None:
+            print(f"Error preparing image {image_path}: {error}")
+            return None
+        self.cache.put(key, target_path)
+        return target_path
+
+    @staticmethod
+    def load(prepared_path: str) -> Image.Image:
+        """Open a prepared image, ready for the VLM processor"""
+        image = Image.open(prepared_path)
+        # load() reads the pixels and closes the file
+        image.load()
+        return image
+
+    def prepare(self, image_path: str, max_side: Optional[int] = None) -> Image.Image:
+        """The prepared image, loaded and ready for the VLM processor"""
+        return self.load(self.prepare_path(image_path, max_side))
+
+    def flush(self):
+        self.cache.flush()
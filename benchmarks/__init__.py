@@ -0,0 +1,2 @@
+# benchmarks/__init__.py
+# Offline benchmark scripts; run from the repo root, e.g. `python -m benchmarks.bench_precision`
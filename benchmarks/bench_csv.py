@@ -0,0 +1,125 @@
+"""
+Throughput benchmark for swipe-CSV handling in app/io.py.
+
+    python -m benchmarks.bench_csv                      # 10k and 100k rows
+    python -m benchmarks.bench_csv --rows 1000,10000,100000 --runs 5
+    python -m benchmarks.bench_csv --output outputs/bench_csv.json
+
+For each size, writes a synthetic swipe CSV and times parse_csv_file,
+process_swipe_csv, flatten_dataframe and extract_image_urls_from_csv. The
+row-at-a-time implementations these replaced are kept below as a baseline;
+their outputs are checked against the current ones before timing.
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from types import SimpleNamespace
+from typing import Callable, Dict, List
+
+import pandas as pd
+
+from app.io import (
+    parse_csv_file, process_swipe_csv, flatten_dataframe, extract_image_urls_from_csv, convert_google_drive_url,
+)
+from benchmarks.fixtures import write_swipe_csv
+
+
+def baseline_process_swipe_csv(csv_df: pd.DataFrame) -> str:
+    """process_swipe_csv as it was: iterrows() and repeated +="""
+    if csv_df is None or csv_df.empty:
+        return ""
+    formatted_data = "Reference Menu CSV Data:\n\n"
+    for idx, row in csv_df.iterrows():
+        formatted_data += f"Concept {idx + 1}:\n"
+        formatted_data += f"- Name: {row.get('Creative Concept Names', 'N/A')}\n"
+        formatted_data += f"- Description: {row.get('Short Description', 'N/A')}\n"
+        formatted_data += f"- Content Requirements: {row.get('Content Requirements Per Variant', 'N/A')}\n"
+        formatted_data += f"- Format: {row.get('Format', 'N/A')}\n"
+        formatted_data += f"- Reference Image URL: {row.get('Reference Image', 'N/A')}\n\n"
+    return formatted_data
+
+
+def baseline_flatten_dataframe(df: pd.DataFrame) -> List[str]:
+    """flatten_dataframe as it was: every cell through Python"""
+    return [str(cell).strip() for row in df.values for cell in row if pd.notna(cell) and str(cell).strip()]
+
+
+def baseline_extract_image_urls(csv_df: pd.DataFrame) -> List[str]:
+    urls = []
+    for url in csv_df['Reference Image'].dropna():
+        if isinstance(url, str) and url.strip():
+            urls.append(convert_google_drive_url(url.strip()))
+    return urls
+
+
+def time_call(fn: Callable, arg, runs: int) -> float:
+    """Median seconds per call"""
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn(arg)
+        times.append(time.perf_counter() - started)
+    return statistics.median(times)
+
+
+def bench_size(rows: int, runs: int, work_dir: str) -> Dict[str, Dict[str, float]]:
+    """Time current and baseline implementations on a CSV of `rows` rows"""
+    urls = [f"https://drive.google.com/file/d/file{i}/view" for i in range(50)] + [f"https://example.com/{i}.jpg" for i in range(50)]
+    csv_path = write_swipe_csv(os.path.join(work_dir, f"swipe_{rows}.csv"), urls, rows)
+    file_obj = SimpleNamespace(name=csv_path)
+    df = parse_csv_file(file_obj)
+    # Sprinkle in blanks so the NaN handling is exercised
+    df.loc[df.index[::7], "Short Description"] = None
+
+    assert process_swipe_csv(df) == baseline_process_swipe_csv(df)
+    assert flatten_dataframe(df) == baseline_flatten_dataframe(df)
+    assert extract_image_urls_from_csv(df) == baseline_extract_image_urls(df)
+
+    cases = {
+        "parse_csv_file": (parse_csv_file, None, file_obj),
+        "process_swipe_csv": (process_swipe_csv, baseline_process_swipe_csv, df),
+        "flatten_dataframe": (flatten_dataframe, baseline_flatten_dataframe, df),
+        "extract_image_urls_from_csv": (extract_image_urls_from_csv, baseline_extract_image_urls, df),
+    }
+    results = {}
+    for name, (current, baseline, arg) in cases.items():
+        seconds = time_call(current, arg, runs)
+        result = {"ms": round(seconds * 1000, 2), "rows_per_s": round(rows / seconds)}
+        if baseline is not None:
+            baseline_seconds = time_call(baseline, arg, max(1, runs // 2))
+            result["baseline_ms"] = round(baseline_seconds * 1000, 2)
+            result["speedup"] = round(baseline_seconds / seconds, 1)
+        results[name] = result
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", default="10000,100000", help="comma-separated CSV sizes")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--output", default="", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    report = {}
+    with tempfile.TemporaryDirectory(prefix="bench_csv_") as work_dir:
+        for rows in [int(r) for r in args.rows.split(",") if r.strip()]:
+            print(f"Benchmarking {rows} rows...")
+            report[rows] = bench_size(rows, args.runs, work_dir)
+
+    print(f"\n{'rows':>7} {'function':<28} {'ms':>9} {'rows/s':>11} {'baseline ms':>12} {'speedup':>8}")
+    for rows, results in report.items():
+        for name, r in results.items():
+            print(f"{rows:>7} {name:<28} {r['ms']:>9.1f} {r['rows_per_s']:>11,} "
+                  f"{r.get('baseline_ms', float('nan')):>12.1f} {r.get('speedup', float('nan')):>8.1f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"runs": args.runs, "results": report}, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
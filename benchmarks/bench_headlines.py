@@ -0,0 +1,112 @@
+"""
+Throughput of headline/subheadline generation under concurrent clicks.
+
+    python -m benchmarks.bench_headlines                         # 8 clients, tiny Gemma stand-in
+    python -m benchmarks.bench_headlines --clients 1,4,16 --requests 4 --new-tokens 32
+
+Each simulated client sends requests back to back, alternating headline and
+subheadline conversations. "serial" runs them one at a time, as Gradio's default
+per-event queue did; "batched" goes through the headline micro-batcher.
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+
+import torch
+
+import app.form_models as form_models
+from app.batching import MicroBatcher
+from app.config import TEMPLATES_DIR, HEADLINE_MAX_BATCH_SIZE, HEADLINE_BATCH_WAIT_SECONDS
+from benchmarks.fixtures import build_tiny_tokenizer, build_tiny_llm_pipeline
+from models.registry import get_registry
+
+SYSTEM_PROMPT = "You are a professional writer. Give the response like ###Headline 1. <Headline> and no explanations."
+
+
+def conversation(i: int):
+    kind = "headlines" if i % 2 == 0 else "subheadlines"
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": f"Generate 3 compelling Facebook ad {kind} for 'Brand {i}' based on this angle: saves time\n\n"},
+    ]
+
+
+def run_clients(send, clients: int, requests: int, max_new_tokens: int) -> dict:
+    """Run `clients` threads that each send `requests` requests; returns throughput and latency"""
+    latencies = []
+    lock = threading.Lock()
+
+    def client(c):
+        for r in range(requests):
+            started = time.perf_counter()
+            send(conversation(c * requests + r), max_new_tokens)
+            with lock:
+                latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(c,)) for c in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return {
+        "requests_per_s": round(len(latencies) / elapsed, 2),
+        "latency_ms_p50": round(statistics.median(latencies) * 1000, 1),
+        "latency_ms_max": round(max(latencies) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", default="1,8", help="comma-separated concurrent client counts")
+    parser.add_argument("--requests", type=int, default=4, help="requests per client")
+    parser.add_argument("--new-tokens", type=int, default=32)
+    parser.add_argument("--size", default="tiny", choices=["tiny", "small"], help="size of the random stand-in")
+    parser.add_argument("--max-batch-size", type=int, default=HEADLINE_MAX_BATCH_SIZE)
+    parser.add_argument("--wait", type=float, default=HEADLINE_BATCH_WAIT_SECONDS, help="batch window in seconds")
+    parser.add_argument("--output", default="", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    corpus = [line for path in sorted(TEMPLATES_DIR.glob("*.txt")) for line in path.read_text(encoding="utf-8").splitlines()]
+    pipe = build_tiny_llm_pipeline(build_tiny_tokenizer(corpus), size=args.size, max_new_tokens=args.new_tokens)
+    get_registry().register("headline", lambda: pipe)
+
+    serial_lock = threading.Lock()
+
+    def send_serial(conv, max_new_tokens):
+        with serial_lock:
+            return form_models._generate_single(conv, max_new_tokens)
+
+    batcher = MicroBatcher(form_models._generate_batch, max_batch_size=args.max_batch_size, max_wait_seconds=args.wait, name="bench-batcher")
+
+    def send_batched(conv, max_new_tokens):
+        return batcher.submit((conv, max_new_tokens, 1, None)).result()
+
+    # Warm-up so lazy init is not timed
+    send_serial(conversation(0), args.new_tokens)
+    form_models._generate_batch([(conversation(0), args.new_tokens, 1, None), (conversation(1), args.new_tokens, 1, None)])
+
+    results = []
+    for clients in [int(c) for c in args.clients.split(",") if c.strip()]:
+        for mode, send in (("serial", send_serial), ("batched", send_batched)):
+            print(f"Benchmarking {mode} with {clients} clients...")
+            results.append(dict(mode=mode, clients=clients, **run_clients(send, clients, args.requests, args.new_tokens)))
+    batcher.shutdown()
+
+    print(f"\n{'mode':<8} {'clients':>7} {'req/s':>8} {'p50 ms':>9} {'max ms':>9}")
+    for r in results:
+        print(f"{r['mode']:<8} {r['clients']:>7} {r['requests_per_s']:>8.2f} {r['latency_ms_p50']:>9.1f} {r['latency_ms_max']:>9.1f}")
+    print(f"\nBatcher: {batcher.stats()}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "batcher": batcher.stats(), "results": results}, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Reference-image preparation benchmark: serial VisualParser.prepare_path calls
+against VisualParser.prepare_many on the shared thread pool.
+
+    python -m benchmarks.bench_images                       # 50 images at 3000x2000
+    python -m benchmarks.bench_images --images 20 --size 6000x4000 --runs 5
+
+Each run starts from an empty preparation cache, so every image is decoded,
+resized and written; the figures are the median of --runs.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from app.config import VLM_IMAGE_MAX_SIDE
+from app.visual_parser import VisualParser, available_cpus, get_image_pool, image_pool_workers
+from benchmarks.fixtures import write_reference_images
+
+
+def time_serial(image_paths, cache_dir: str) -> float:
+    parser = VisualParser(cache_dir)
+    started = time.perf_counter()
+    for path in image_paths:
+        parser.prepare_path(path, VLM_IMAGE_MAX_SIDE)
+    return time.perf_counter() - started
+
+
+def time_pool(image_paths, cache_dir: str) -> float:
+    parser = VisualParser(cache_dir)
+    started = time.perf_counter()
+    prepared = list(parser.prepare_many(image_paths, VLM_IMAGE_MAX_SIDE))
+    elapsed = time.perf_counter() - started
+    assert all(path is not None for _, path in prepared)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=50)
+    parser.add_argument("--size", default="3000x2000", help="WIDTHxHEIGHT of the generated JPEGs")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+    width, height = (int(side) for side in args.size.split("x"))
+
+    with tempfile.TemporaryDirectory(prefix="bench_images_") as root:
+        print(f"Writing {args.images} {args.size} JPEGs...")
+        image_paths = write_reference_images(os.path.join(root, "images"), args.images, size=(width, height))
+        get_image_pool()   # started once per app process; not part of the timing
+
+        serial, pooled = [], []
+        for run in range(args.runs):
+            serial.append(time_serial(image_paths, os.path.join(root, f"serial_{run}")))
+            pooled.append(time_pool(image_paths, os.path.join(root, f"pool_{run}")))
+
+    serial_s, pooled_s = statistics.median(serial), statistics.median(pooled)
+    print(f"\n{available_cpus()} CPUs, {image_pool_workers()} pool threads")
+    print(f"serial        {serial_s * 1000:>9.0f} ms  {args.images / serial_s:>7.1f} images/s")
+    print(f"prepare_many  {pooled_s * 1000:>9.0f} ms  {args.images / pooled_s:>7.1f} images/s  ({serial_s / pooled_s:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
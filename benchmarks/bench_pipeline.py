@@ -0,0 +1,316 @@
+"""
+End-to-end latency benchmark for the brief pipeline, fully offline.
+
+    python -m benchmarks.bench_pipeline                               # 5 cold runs, tiny models
+    python -m benchmarks.bench_pipeline --images 16 --new-tokens 128 --runs 10
+    python -m benchmarks.bench_pipeline --warm-caches --output outputs/bench_pipeline.json
+
+Submits the brief form to the app's own generate_brief_callback, with randomly
+initialised stand-ins for SmolVLM and Llama and a local HTTP server for the
+swipe-file images, so every stage a user waits for is measured:
+
+    csv_parse -> csv_process -> download -> vlm -> prompt_build -> llm -> export
+
+Stage timings are the spans of each run's telemetry trace; the report gives
+p50/p90/p99 per span name, LLM decode tokens/s and peak RSS. Absolute numbers
+only mean something relative to another run of this script on the same machine
+(e.g. before/after a change); compare the JSON reports.
+"""
+import argparse
+import inspect
+import json
+import math
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+from contextlib import contextmanager, redirect_stdout
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+import torch
+
+import app.downloader
+import app.exporter
+import app.generator
+import app.telemetry
+from app.cache import DescriptionCache, DownloadCache, ExportCache
+from app.config import TEMPLATES_DIR, DOWNLOAD_CACHE_TTL, DOWNLOAD_CACHE_MAX_BYTES, VLM_CACHE_MAX_ENTRIES
+from app.downloader import ImageDownloader
+from app.exporter import BriefExporter
+from app.generator import CreativeBriefGenerator
+from app.main import generate_brief_callback, prepare_brief_request
+from app.telemetry import Telemetry
+from app.visual_parser import VisualParser
+from benchmarks.fixtures import (
+    build_tiny_tokenizer, build_tiny_llm_pipeline, build_tiny_vlm,
+    write_reference_images, write_swipe_csv, serve_directory,
+)
+from models.registry import ModelRegistry
+
+# Spans reported first and in this order; any other span in the trace follows
+STAGES = [
+    "csv_parse", "csv_process", "download", "vlm", "vlm.prefill", "vlm.decode",
+    "prompt_build", "llm", "llm.prefill", "llm.decode", "export", "export.pdf",
+]
+
+# Form fields as the UI submits them (lists are comma-separated text, tables are DataFrames)
+BRIEF_FORM = dict(
+    brand_name="Benchmark Brand",
+    product_name="Benchmark Product",
+    website_url="https://example.com",
+    target_audience="Busy parents aged 25-40",
+    tone="Warm and direct",
+    content_bank="before/after, testimonial, unboxing",
+    campaign_type="Evergreen",
+    reference_images=None,
+    angle_description="Saves ten minutes every morning",
+    angle_and_benefits="Fast, Quiet, Easy to clean",
+    headlines_df=pd.DataFrame({"Headline": ["Mornings, sorted", "Ten minutes back"]}),
+    auto_headlines=True,
+    subheadlines_df=pd.DataFrame({"Subheadline": ["Built for the school run"]}),
+    auto_subheadlines=True,
+    social_proof="4.8 stars from 2,000 reviews",
+    voiceover_tone="",
+    brand_guide=None,
+    campaign_deck=None,
+    misc_assets=None,
+)
+
+
+class TraceCollector:
+    """Telemetry exporter that keeps each run's trace record in memory"""
+
+    def __init__(self):
+        self.records: List[Dict[str, Any]] = []
+
+    def export(self, record: Dict[str, Any]):
+        self.records.append(record)
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile of values (q in 0-100)"""
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), math.ceil(q / 100 * len(ordered))))
+    return ordered[rank - 1]
+
+
+def peak_rss_bytes() -> int:
+    """Peak resident set size of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def git_revision() -> Optional[str]:
+    """Short hash of the checked-out commit (with -dirty for local changes), if available"""
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            capture_output=True, text=True, check=True, cwd=Path(__file__).resolve().parent,
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def pdf_renderer_available() -> bool:
+    """Whether WeasyPrint loads; without it export.pdf only times the failed render"""
+    try:
+        import weasyprint  # noqa: F401 (renders the PDF)
+        return True
+    except Exception as e:
+        print(f"PDF rendering unavailable: {e}")
+        return False
+
+
+@contextmanager
+def working_directory(path: str):
+    # save_brief_to_file writes to ../outputs/markdown relative to the working directory
+    previous = os.getcwd()
+    os.makedirs(path, exist_ok=True)
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def build_generator(args) -> CreativeBriefGenerator:
+    """Brief generator whose registry serves the tiny stand-in models"""
+    corpus = [line for path in sorted(TEMPLATES_DIR.glob("*.txt")) for line in path.read_text(encoding="utf-8").splitlines()]
+    tokenizer = build_tiny_tokenizer(corpus)
+    vlm = build_tiny_vlm(build_tiny_tokenizer(corpus))
+    llm_pipe = build_tiny_llm_pipeline(tokenizer, size=args.llm_size, max_new_tokens=args.new_tokens)
+    # min_new_tokens pins the decode length so tokens/s is comparable across runs
+    for generation_config in (getattr(llm_pipe, "generation_config", None), llm_pipe.model.generation_config):
+        if generation_config is not None:
+            generation_config.min_new_tokens = args.new_tokens
+
+    registry = ModelRegistry()
+    registry.register("vlm", lambda: vlm)
+    registry.register("llm", lambda: llm_pipe)
+    generator = CreativeBriefGenerator(registry=registry)
+    generator.max_tokens = args.new_tokens
+    generator.vlm_batch_size = args.vlm_batch_size
+    # Random weights never emit EOS, so cap descriptions near a real model's length
+    generator.vlm_max_new_tokens = args.vlm_new_tokens
+    # Load both up front so model construction is not timed as part of the first run
+    registry.get("vlm")
+    registry.get("llm")
+    return generator
+
+
+def form_inputs(csv_path: str, args) -> list:
+    """Positional callback inputs, in the order the UI passes them"""
+    fields = dict(
+        BRIEF_FORM,
+        swipe_csv=SimpleNamespace(name=csv_path),
+        num_image_briefs=args.image_briefs,
+        num_video_briefs=args.video_briefs,
+    )
+    return list(inspect.signature(prepare_brief_request).bind(**fields).args)
+
+
+def run_once(generator, exporter, collector, csv_path: str, work_dir: str, args) -> Dict[str, Any]:
+    """Submit the brief form once; returns the run's trace record"""
+    # The app's singletons, pointed at this run's caches
+    app.generator._generator_instance = generator
+    generator.description_cache = DescriptionCache(os.path.join(work_dir, "descriptions"), VLM_CACHE_MAX_ENTRIES)
+    generator.visual_parser = VisualParser(os.path.join(work_dir, "vlm_images"))
+    download_dir = os.path.join(work_dir, "downloads")
+    cache = DownloadCache(download_dir, ttl=DOWNLOAD_CACHE_TTL, max_bytes=DOWNLOAD_CACHE_MAX_BYTES)
+    app.downloader._downloader_instance = ImageDownloader(save_dir=download_dir, cache=cache)
+    # The export threads are kept across runs, the export cache is not
+    exporter.cache = ExportCache(os.path.join(work_dir, "exports"))
+    app.exporter._exporter_instance = exporter
+
+    with working_directory(os.path.join(work_dir, "cwd")):
+        output, md_path, _, _ = generate_brief_callback(*form_inputs(csv_path, args))
+    record = collector.records[-1]
+    if record["status"] != "ok" or md_path is None:
+        raise RuntimeError(f"Brief run failed ({record['status']}): {record['error'] or output}")
+    return record
+
+
+def stage_seconds(record: Dict[str, Any]) -> Dict[str, float]:
+    """Seconds per span name in one trace (spans of the same name are summed), plus the total"""
+    seconds: Dict[str, float] = {}
+    for span in record["spans"]:
+        seconds[span["name"]] = seconds.get(span["name"], 0.0) + span["duration_ms"] / 1000
+    seconds["total"] = record["duration_ms"] / 1000
+    return seconds
+
+
+def summarize(records: List[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    """Per-span p50/p90/p99 in milliseconds, plus LLM decode tokens/s"""
+    runs = [stage_seconds(record) for record in records]
+    seen = [name for run in runs for name in run]
+    names = [stage for stage in STAGES if stage in seen]
+    names += [name for name in dict.fromkeys(seen) if name not in names and name != "total"]
+    summary = {}
+    for name in names + ["total"]:
+        values = [run[name] for run in runs if name in run]
+        summary[name] = {
+            "p50_ms": round(percentile(values, 50) * 1000, 2),
+            "p90_ms": round(percentile(values, 90) * 1000, 2),
+            "p99_ms": round(percentile(values, 99) * 1000, 2),
+        }
+    tokens_per_s = [
+        record["counters"].get("llm.generated_tokens", 0) / run["llm.decode"]
+        for record, run in zip(records, runs) if run.get("llm.decode")
+    ]
+    if "llm.decode" in summary and tokens_per_s:
+        summary["llm.decode"]["tokens_per_s_p50"] = round(percentile(tokens_per_s, 50), 2)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=8, help="reference images served to the downloader")
+    parser.add_argument("--csv-rows", type=int, default=20, help="swipe CSV rows (image URLs are cycled)")
+    parser.add_argument("--image-briefs", type=int, default=3)
+    parser.add_argument("--video-briefs", type=int, default=2)
+    parser.add_argument("--new-tokens", type=int, default=64, help="LLM tokens decoded per generate call")
+    parser.add_argument("--llm-size", default="tiny", choices=["tiny", "small"], help="size of the random Llama stand-in")
+    parser.add_argument("--vlm-new-tokens", type=int, default=48, help="tokens decoded per image description")
+    parser.add_argument("--vlm-batch-size", type=int, default=8)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--warm-caches", action="store_true", help="keep download/description/export caches across runs")
+    parser.add_argument("--threads", type=int, default=0, help="torch CPU threads (0 = torch default)")
+    parser.add_argument("--verbose", action="store_true", help="show the app's own logging during runs")
+    parser.add_argument("--output", default="", help="write results as JSON to this path")
+    args = parser.parse_args()
+    if args.output:
+        args.output = os.path.abspath(args.output)
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    torch.manual_seed(0)
+
+    print("Building stand-in models...")
+    generator = build_generator(args)
+    exporter = BriefExporter()
+    pdf_available = pdf_renderer_available()
+    # Traces stay in memory instead of going to the app's JSONL/Prometheus exporters
+    collector = TraceCollector()
+    app.telemetry._telemetry_instance = Telemetry([collector])
+    log = sys.stdout if args.verbose else open(os.devnull, "w")
+
+    records = []
+    with tempfile.TemporaryDirectory(prefix="bench_pipeline_") as root:
+        image_dir = os.path.join(root, "served")
+        write_reference_images(image_dir, args.images)
+        with serve_directory(image_dir) as base_url:
+            urls = [f"{base_url}/{name}" for name in sorted(os.listdir(image_dir))]
+            csv_path = write_swipe_csv(os.path.join(root, "swipe.csv"), urls, args.csv_rows)
+
+            # Untimed warm-up so lazy init and kernel selection are not measured
+            with redirect_stdout(log):
+                run_once(generator, exporter, collector, csv_path, os.path.join(root, "warmup"), args)
+            generator._drop_prefix_cache()
+
+            for i in range(args.runs):
+                work_dir = os.path.join(root, "shared" if args.warm_caches else f"run_{i}")
+                if not args.warm_caches:
+                    generator._drop_prefix_cache()
+                with redirect_stdout(log):
+                    record = run_once(generator, exporter, collector, csv_path, work_dir, args)
+                records.append(record)
+                print(f"Run {i + 1}/{args.runs}: {record['duration_ms']:.0f} ms")
+
+    summary = summarize(records)
+    print(f"\n{'stage':<15} {'p50 ms':>10} {'p90 ms':>10} {'p99 ms':>10}")
+    for stage, stats in summary.items():
+        print(f"{stage:<15} {stats['p50_ms']:>10.1f} {stats['p90_ms']:>10.1f} {stats['p99_ms']:>10.1f}")
+    counters = records[-1]["counters"] if records else {}
+    if "tokens_per_s_p50" in summary.get("llm.decode", {}):
+        print(
+            f"\nLLM: {summary['llm.decode']['tokens_per_s_p50']:.1f} decode tokens/s (p50), "
+            f"{counters.get('llm.prompt_tokens', 0):.0f} prompt tokens"
+        )
+    if not pdf_available:
+        print("export.pdf timed a failed render (WeasyPrint unavailable)")
+    print(f"Peak RSS: {peak_rss_bytes() / 1024 ** 2:.0f} MB")
+
+    if args.output:
+        report = {
+            "git_revision": git_revision(),
+            "torch_version": torch.__version__,
+            "torch_threads": torch.get_num_threads(),
+            "config": vars(args),
+            "stages": summary,
+            "peak_rss_bytes": peak_rss_bytes(),
+            "counters": counters,
+            "pdf_rendered": pdf_available,
+            "traces": records,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, default=str)
+        print(f"\nWrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+CPU latency/memory benchmark for the precision modes in models/precision.py.
+
+    python -m benchmarks.bench_precision                      # random "small" Llama stand-in
+    python -m benchmarks.bench_precision --model google/gemma-3-1b-it --modes fp32,bf16,int8
+    python -m benchmarks.bench_precision --output outputs/bench_precision.json
+
+Each mode loads the model, applies the dtype/quantization exactly as the app's
+loaders do, then times prefill and greedy decoding of a fixed prompt.
+"""
+import argparse
+import json
+import statistics
+import time
+
+import torch
+from transformers import AutoModelForCausalLM
+
+from benchmarks.fixtures import build_random_llama
+from models.precision import PRECISION_MODES, resolve_dtype, apply_quantization, model_weight_bytes
+from models.registry import process_rss_bytes
+
+
+def load_for_mode(model_name: str, mode: str, size: str):
+    """Load the model in the given precision mode on CPU"""
+    dtype = resolve_dtype(mode, "cpu")
+    if model_name:
+        model = AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=dtype).eval()
+    else:
+        model = build_random_llama(size).to(dtype)
+    return apply_quantization(model, mode, "cpu")
+
+
+@torch.no_grad()
+def bench_mode(model_name: str, mode: str, size: str, prompt_tokens: int, new_tokens: int, runs: int) -> dict:
+    """Measure load time, weight bytes, prefill and decode latency for one mode"""
+    rss_before = process_rss_bytes()
+    started = time.perf_counter()
+    model = load_for_mode(model_name, mode, size)
+    load_seconds = time.perf_counter() - started
+    rss_after = process_rss_bytes()
+
+    torch.manual_seed(0)
+    input_ids = torch.randint(3, model.config.vocab_size, (1, prompt_tokens))
+    generate_kwargs = dict(
+        max_new_tokens=new_tokens,
+        min_new_tokens=new_tokens,
+        do_sample=False,
+        pad_token_id=model.config.pad_token_id or 0,
+    )
+
+    # Warm-up run so lazy init and kernel selection are not timed
+    model.generate(input_ids, **generate_kwargs)
+
+    prefill, total = [], []
+    for _ in range(runs):
+        started = time.perf_counter()
+        model(input_ids)
+        prefill.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        model.generate(input_ids, **generate_kwargs)
+        total.append(time.perf_counter() - started)
+
+    decode_seconds = max(statistics.median(total) - statistics.median(prefill), 1e-9)
+    return {
+        "mode": mode,
+        "dtype": str(resolve_dtype(mode, "cpu")),
+        "load_seconds": round(load_seconds, 3),
+        "weight_bytes": model_weight_bytes(model),
+        "rss_delta_bytes": rss_after - rss_before if rss_before is not None and rss_after is not None else None,
+        "prefill_ms_median": round(statistics.median(prefill) * 1000, 2),
+        "generate_ms_median": round(statistics.median(total) * 1000, 2),
+        "decode_tokens_per_s": round(new_tokens / decode_seconds, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="", help="HF model name/path; default is a random Llama stand-in")
+    parser.add_argument("--size", default="small", choices=["tiny", "small"], help="stand-in size when --model is not given")
+    parser.add_argument("--modes", default="fp32,bf16,fp16,int8", help=f"comma-separated subset of {','.join(PRECISION_MODES)}")
+    parser.add_argument("--prompt-tokens", type=int, default=256)
+    parser.add_argument("--new-tokens", type=int, default=32)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=0, help="torch CPU threads (0 = torch default)")
+    parser.add_argument("--output", default="", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    results = []
+    for mode in [m.strip() for m in args.modes.split(",") if m.strip()]:
+        print(f"Benchmarking {mode}...")
+        try:
+            results.append(bench_mode(args.model, mode, args.size, args.prompt_tokens, args.new_tokens, args.runs))
+        except Exception as e:
+            print(f"  {mode} failed: {e}")
+            results.append({"mode": mode, "error": str(e)})
+
+    print(f"\n{'mode':<6} {'weights MB':>11} {'load s':>7} {'prefill ms':>11} {'generate ms':>12} {'decode tok/s':>13}")
+    for r in results:
+        if "error" in r:
+            print(f"{r['mode']:<6} error: {r['error']}")
+            continue
+        print(f"{r['mode']:<6} {r['weight_bytes'] / 1024 ** 2:>11.1f} {r['load_seconds']:>7.2f} "
+              f"{r['prefill_ms_median']:>11.1f} {r['generate_ms_median']:>12.1f} {r['decode_tokens_per_s']:>13.1f}")
+
+    if args.output:
+        report = {
+            "model": args.model or f"random-llama-{args.size}",
+            "prompt_tokens": args.prompt_tokens,
+            "new_tokens": args.new_tokens,
+            "runs": args.runs,
+            "torch_threads": torch.get_num_threads(),
+            "results": results,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
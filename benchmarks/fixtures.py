@@ -0,0 +1,183 @@
+"""Tiny, randomly initialised stand-ins for the app's models so benchmarks run offline."""
+import functools
+import os
+import threading
+from contextlib import contextmanager
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterable, Iterator, List, Tuple
+
+import torch
+from transformers import LlamaConfig, LlamaForCausalLM
+
+# Sizes for random Llama stand-ins: "tiny" for pipeline plumbing, "small" to make
+# precision/quantization differences visible
+LLAMA_SIZES = {
+    "tiny": dict(hidden_size=64, intermediate_size=128, num_hidden_layers=2, num_attention_heads=4, num_key_value_heads=2),
+    "small": dict(hidden_size=512, intermediate_size=1536, num_hidden_layers=8, num_attention_heads=8, num_key_value_heads=4),
+}
+
+
+def build_random_llama(size: str = "tiny", vocab_size: int = 32000, seed: int = 0) -> LlamaForCausalLM:
+    """Build a randomly initialised Llama causal LM of the given size (fp32, eval mode)"""
+    torch.manual_seed(seed)
+    config = LlamaConfig(
+        vocab_size=vocab_size,
+        max_position_embeddings=4096,
+        bos_token_id=0,
+        eos_token_id=1,
+        pad_token_id=2,
+        **LLAMA_SIZES[size],
+    )
+    return LlamaForCausalLM(config).eval()
+
+
+# Special tokens the SmolVLM-style processor and the Llama chat template expect
+SPECIAL_TOKENS = ["<s>", "</s>", "<pad>", "<image>", "<fake_token_around_image>", "<global-img>", "<end_of_utterance>"]
+
+LLM_CHAT_TEMPLATE = (
+    "{% for m in messages %}<s>{{ m['role'] }}\n{{ m['content'] }}</s>{% endfor %}"
+    "{% if add_generation_prompt %}<s>assistant\n{% endif %}"
+)
+
+# Same shape as SmolVLM's template: "User:<image>prompt<end_of_utterance>\nAssistant:"
+VLM_CHAT_TEMPLATE = (
+    "<|im_start|>{% for message in messages %}{{ message['role'] | capitalize }}"
+    "{% if message['content'][0]['type'] == 'image' %}{{ ':' }}{% else %}{{ ': ' }}{% endif %}"
+    "{% for line in message['content'] %}{% if line['type'] == 'text' %}{{ line['text'] }}"
+    "{% elif line['type'] == 'image' %}{{ '<image>' }}{% endif %}{% endfor %}<end_of_utterance>\n{% endfor %}"
+    "{% if add_generation_prompt %}{{ 'Assistant:' }}{% endif %}"
+)
+
+
+def build_tiny_tokenizer(corpus: Iterable[str], vocab_size: int = 1000):
+    """Train a small byte-level BPE tokenizer on `corpus` (e.g. the prompt templates)"""
+    from tokenizers import Tokenizer, models, pre_tokenizers, decoders, trainers
+    from transformers import PreTrainedTokenizerFast
+
+    tokenizer = Tokenizer(models.BPE())
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(
+        vocab_size=vocab_size,
+        special_tokens=SPECIAL_TOKENS,
+        initial_alphabet=pre_tokenizers.ByteLevel.alphabet(),
+    )
+    tokenizer.train_from_iterator(corpus, trainer)
+    hf_tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer,
+        bos_token="<s>",
+        eos_token="</s>",
+        pad_token="<pad>",
+        additional_special_tokens=SPECIAL_TOKENS[3:],
+        model_input_names=["input_ids", "attention_mask"],
+    )
+    hf_tokenizer.chat_template = LLM_CHAT_TEMPLATE
+    return hf_tokenizer
+
+
+def build_tiny_llm_pipeline(tokenizer, size: str = "tiny", max_new_tokens: int = 64, seed: int = 0):
+    """Text-generation pipeline over a random Llama, configured like load_llm_pipeline"""
+    from transformers import pipeline
+
+    model = build_random_llama(size, vocab_size=len(tokenizer), seed=seed)
+    return pipeline(
+        "text-generation",
+        model=model,
+        tokenizer=tokenizer,
+        device="cpu",
+        max_new_tokens=max_new_tokens,
+        do_sample=True,
+        temperature=0.7,
+    )
+
+
+def build_tiny_vlm(tokenizer, image_size: int = 32, seed: int = 0):
+    """Random Idefics3 (SmolVLM architecture) model and processor, as returned by load_vlm"""
+    from transformers import Idefics3Config, Idefics3ForConditionalGeneration, Idefics3ImageProcessor, Idefics3Processor
+
+    image_processor = Idefics3ImageProcessor(
+        do_image_splitting=False,
+        size={"longest_edge": image_size},
+        max_image_size={"longest_edge": image_size},
+    )
+    processor = Idefics3Processor(
+        image_processor=image_processor,
+        tokenizer=tokenizer,
+        image_seq_len=4,
+        chat_template=VLM_CHAT_TEMPLATE,
+    )
+    processor.tokenizer.padding_side = "left"
+
+    torch.manual_seed(seed)
+    text_config = LlamaConfig(
+        vocab_size=len(tokenizer),
+        max_position_embeddings=4096,
+        bos_token_id=0,
+        eos_token_id=1,
+        pad_token_id=2,
+        **LLAMA_SIZES["tiny"],
+    )
+    config = Idefics3Config(
+        vision_config=dict(
+            hidden_size=32,
+            intermediate_size=64,
+            num_hidden_layers=1,
+            num_attention_heads=2,
+            image_size=image_size,
+            patch_size=8,
+        ),
+        text_config=text_config.to_dict(),
+        scale_factor=2,
+        image_token_id=tokenizer.convert_tokens_to_ids("<image>"),
+        pad_token_id=2,
+    )
+    model = Idefics3ForConditionalGeneration(config).eval()
+    return model, processor
+
+
+def write_reference_images(directory: str, count: int, size: Tuple[int, int] = (640, 480), seed: int = 0) -> List[str]:
+    """Write `count` noisy JPEGs to directory (noise keeps the files realistically large)"""
+    from PIL import Image
+
+    os.makedirs(directory, exist_ok=True)
+    generator = torch.Generator().manual_seed(seed)
+    paths = []
+    for i in range(count):
+        pixels = torch.randint(0, 256, (size[1], size[0], 3), dtype=torch.uint8, generator=generator)
+        path = os.path.join(directory, f"reference_{i:03d}.jpg")
+        Image.fromarray(pixels.numpy()).save(path, quality=85)
+        paths.append(path)
+    return paths
+
+
+def write_swipe_csv(path: str, image_urls: List[str], rows: int) -> str:
+    """Write a swipe CSV with the columns process_swipe_csv expects, cycling through image_urls"""
+    import pandas as pd
+
+    pd.DataFrame({
+        "Creative Concept Names": [f"Concept {i}" for i in range(rows)],
+        "Short Description": [f"Lifestyle shot number {i} with the product in use" for i in range(rows)],
+        "Content Requirements Per Variant": ["Headline, subheadline, CTA"] * rows,
+        "Format": ["Static" if i % 2 == 0 else "Video" for i in range(rows)],
+        "Reference Image": [image_urls[i % len(image_urls)] if image_urls else "" for i in range(rows)],
+    }).to_csv(path, index=False)
+    return path
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def serve_directory(directory: str) -> Iterator[str]:
+    """Serve `directory` over HTTP on a free localhost port; yields the base URL"""
+    handler = functools.partial(_QuietHandler, directory=directory)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,62 @@
+import torch
+from transformers import pipeline, Pipeline
+
+from models.precision import resolve_dtype, apply_quantization
+#import spaces
+
+
+def _device() -> str:
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def _quantize_pipeline(pipe: Pipeline, precision: str) -> Pipeline:
+    """Apply int8 dynamic quantization to a loaded pipeline's model when requested"""
+    pipe.model = apply_quantization(pipe.model, precision, pipe.device.type)
+    return pipe
+
+
+#@spaces.GPU
+def load_llm_pipeline(model_name: str, max_new_tokens: int, precision: str = "auto") -> Pipeline:
+    """Load the Llama text-generation pipeline that writes the briefs"""
+    # auto keeps the pipeline's own default dtype
+    dtype = None if precision == "auto" else resolve_dtype(precision, _device())
+    print(f"Loading {model_name} for text generation ({precision}, {dtype})...")
+    llm_pipe = pipeline(
+        "text-generation",
+        model=model_name,
+        torch_dtype=dtype,
+        max_new_tokens=max_new_tokens,
+        do_sample=True,
+        temperature=0.7,
+    )
+    llm_pipe = _quantize_pipeline(llm_pipe, precision)
+    print("Text generation model loaded successfully!")
+    return llm_pipe
+
+
+#@spaces.GPU
+def load_fallback_pipeline(model_name: str, max_new_tokens: int) -> Pipeline:
+    """Load the small text-only pipeline used when the main models fail to load"""
+    print("Loading fallback text-generation model...")
+    fallback_pipe = pipeline(
+        "text-generation",
+        model=model_name,
+        max_new_tokens=max_new_tokens,
+        do_sample=True,
+        temperature=0.4
+    )
+    print("Fallback model loaded successfully!")
+    return fallback_pipe
+
+
+#@spaces.GPU
+def load_headline_pipeline(model_name: str, precision: str = "auto") -> Pipeline:
+    """Load the Gemma pipeline used for headline and subheadline suggestions"""
+    dtype = resolve_dtype(precision, _device(), default=torch.bfloat16)
+    print(f"Loading {model_name} for headline generation ({precision}, {dtype})...")
+    headline_pipe = pipeline(
+        "text-generation",
+        model=model_name,
+        torch_dtype=dtype,
+    )
+    return _quantize_pipeline(headline_pipe, precision)
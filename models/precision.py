@@ -0,0 +1,55 @@
+from typing import Optional
+
+import torch
+#import spaces
+
+# fp32/fp16/bf16 cast the weights; int8 applies dynamic quantization to every
+# nn.Linear (CPU only, activations stay fp32); auto keeps each model's default
+PRECISION_MODES = ("auto", "fp32", "fp16", "bf16", "int8")
+
+_DTYPES = {"fp32": torch.float32, "fp16": torch.float16, "bf16": torch.bfloat16, "int8": torch.float32}
+
+
+def resolve_dtype(mode: str, device: str, default: Optional[torch.dtype] = None) -> torch.dtype:
+    """Weight dtype to load a model with for a precision mode on a device"""
+    if mode not in PRECISION_MODES:
+        raise ValueError(f"Unknown precision mode '{mode}', expected one of {PRECISION_MODES}")
+    if mode == "auto":
+        if default is not None and not (device == "cpu" and default == torch.float16):
+            return default
+        # fp16 matmuls are slow or missing on most CPUs
+        return torch.float16 if device == "cuda" else torch.float32
+    if mode == "fp16" and device == "cpu":
+        print("⚠️  fp16 on CPU is usually slower than fp32; consider bf16 or int8")
+    return _DTYPES[mode]
+
+
+def apply_quantization(model: torch.nn.Module, mode: str, device: str) -> torch.nn.Module:
+    """Apply post-load quantization for the precision mode (int8 dynamic on CPU)"""
+    if mode != "int8":
+        return model
+    if device != "cpu":
+        print("⚠️  int8 dynamic quantization only runs on CPU; keeping fp32 weights on GPU")
+        return model
+    from torch.ao.quantization import quantize_dynamic
+    return quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def model_weight_bytes(model: torch.nn.Module) -> int:
+    """Bytes held by a model's weights, counting packed int8 weights and shared tensors once"""
+    seen, total = set(), 0
+
+    def add(value):
+        nonlocal total
+        if isinstance(value, torch.Tensor):
+            key = (value.data_ptr(), value.numel())
+            if key not in seen:
+                seen.add(key)
+                total += value.numel() * value.element_size()
+        elif isinstance(value, (tuple, list)):
+            for item in value:
+                add(item)
+
+    for value in model.state_dict(keep_vars=True).values():
+        add(value)
+    return total
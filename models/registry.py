@@ -0,0 +1,200 @@
+import gc
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import torch
+
+from app.config import (
+    VLM_MODEL_NAME, LLM_MODEL_NAME, HEADLINE_MODEL_NAME, FALLBACK_MODEL_NAME,
+    MAX_NEW_TOKENS, MODEL_MEMORY_BUDGET_BYTES, MODEL_MIN_IDLE_SECONDS,
+    VLM_PRECISION, LLM_PRECISION, HEADLINE_PRECISION,
+)
+from models.precision import model_weight_bytes
+#import spaces
+
+
+def _torch_modules(obj: Any) -> List[torch.nn.Module]:
+    """Find the torch modules held by a loaded object (model, pipeline or tuple of them)"""
+    if isinstance(obj, torch.nn.Module):
+        return [obj]
+    if isinstance(obj, (tuple, list)):
+        return [module for item in obj for module in _torch_modules(item)]
+    model = getattr(obj, "model", None)
+    return [model] if isinstance(model, torch.nn.Module) else []
+
+
+def estimate_resident_bytes(obj: Any) -> int:
+    """Bytes held by the weights of every module in obj (int8-packed weights included)"""
+    return sum(model_weight_bytes(module) for module in _torch_modules(obj))
+
+
+def process_rss_bytes() -> Optional[int]:
+    """Current resident set size of this process (Linux), or None if unavailable"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        return None
+
+
+class ModelLoadError(Exception):
+    """Raised when a registered model failed to load"""
+
+
+class ModelRegistry:
+    """
+    Loads models on first use instead of at import time.
+    Each model is registered with a zero-argument loader. The registry records load
+    time and resident memory per model, can warm models in a background thread, and
+    evicts least recently used idle models when the total exceeds `memory_budget_bytes`.
+    """
+
+    def __init__(self, memory_budget_bytes: Optional[int] = None, min_idle_seconds: float = 60):
+        self.memory_budget_bytes = memory_budget_bytes
+        self.min_idle_seconds = min_idle_seconds
+        self._loaders: Dict[str, Callable[[], Any]] = {}
+        self._models: Dict[str, Any] = {}
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._errors: Dict[str, Exception] = {}
+        self._unload_callbacks: Dict[str, List[Callable[[], None]]] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, loader: Callable[[], Any]):
+        """Register (or replace) the loader for a model name"""
+        with self._lock:
+            self._loaders[name] = loader
+            self._locks.setdefault(name, threading.Lock())
+            self._errors.pop(name, None)
+        self.unload(name)
+
+    def on_unload(self, name: str, callback: Callable[[], None]):
+        """Call `callback` whenever the named model is evicted, so holders can drop references"""
+        with self._lock:
+            self._unload_callbacks.setdefault(name, []).append(callback)
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._models
+
+    def get(self, name: str) -> Any:
+        """Return the named model, loading it on first use"""
+        if name not in self._loaders:
+            raise KeyError(f"No model registered under '{name}'")
+        model = self._models.get(name)
+        if model is None:
+            with self._locks[name]:
+                model = self._models.get(name)
+                if model is None:
+                    model = self._load(name)
+        self._stats[name]["last_used"] = time.time()
+        return model
+
+    def _load(self, name: str) -> Any:
+        """Run the loader, recording time and memory; failures are remembered, not retried"""
+        if name in self._errors:
+            raise ModelLoadError(f"{name} failed to load earlier: {self._errors[name]}")
+        rss_before = process_rss_bytes()
+        started = time.perf_counter()
+        try:
+            model = self._loaders[name]()
+        except Exception as e:
+            self._errors[name] = e
+            raise ModelLoadError(f"{name} failed to load: {e}") from e
+        rss_after = process_rss_bytes()
+        self._stats[name] = {
+            "load_seconds": round(time.perf_counter() - started, 2),
+            "resident_bytes": estimate_resident_bytes(model),
+            "rss_delta_bytes": rss_after - rss_before if rss_before is not None and rss_after is not None else None,
+            "last_used": time.time(),
+        }
+        self._models[name] = model
+        print(f"Loaded {name} in {self._stats[name]['load_seconds']}s "
+              f"({self._stats[name]['resident_bytes'] / 1024 ** 2:.0f} MB resident)")
+        self._enforce_budget(keep=name)
+        return model
+
+    def warm(self, name: str) -> threading.Thread:
+        """Load a model in a background thread"""
+        def load_quietly():
+            try:
+                self.get(name)
+            except Exception as e:
+                print(f"Error warming {name}: {e}")
+
+        thread = threading.Thread(target=load_quietly, name=f"warm-{name}", daemon=True)
+        thread.start()
+        return thread
+
+    def unload(self, name: str) -> bool:
+        """Drop the named model and release its memory"""
+        with self._lock:
+            model = self._models.pop(name, None)
+            callbacks = list(self._unload_callbacks.get(name, []))
+        if model is None:
+            return False
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Error in unload callback for {name}: {e}")
+        del model
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        print(f"Unloaded {name}")
+        return True
+
+    def _enforce_budget(self, keep: Optional[str] = None):
+        """Evict least recently used idle models until resident memory fits the budget"""
+        if self.memory_budget_bytes is None:
+            return
+        now = time.time()
+        for name in sorted(self._models, key=lambda n: self._stats[n]["last_used"]):
+            if self.resident_bytes() <= self.memory_budget_bytes:
+                return
+            if name == keep or now - self._stats[name]["last_used"] < self.min_idle_seconds:
+                continue
+            self.unload(name)
+        if self.resident_bytes() > self.memory_budget_bytes:
+            print(f"Model memory {self.resident_bytes() / 1024 ** 2:.0f} MB exceeds the budget; no idle model left to evict")
+
+    def evict_idle(self, max_idle_seconds: float) -> List[str]:
+        """Unload every model unused for longer than max_idle_seconds"""
+        now = time.time()
+        idle = [name for name in list(self._models) if now - self._stats[name]["last_used"] > max_idle_seconds]
+        return [name for name in idle if self.unload(name)]
+
+    def resident_bytes(self) -> int:
+        """Total resident bytes of the loaded models"""
+        return sum(self._stats[name]["resident_bytes"] for name in list(self._models))
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-model load time, resident memory, last use and whether it is loaded"""
+        report = {}
+        for name in self._loaders:
+            report[name] = dict(self._stats.get(name, {}), loaded=name in self._models)
+            if name in self._errors:
+                report[name]["error"] = str(self._errors[name])
+        return report
+
+
+# Global registry shared by the brief generator and the headline helpers
+_registry_instance = None
+
+#@spaces.GPU
+def get_registry() -> ModelRegistry:
+    """Get the singleton registry with the app's models registered"""
+    global _registry_instance
+    if _registry_instance is None:
+        from models.llm_model import load_llm_pipeline, load_fallback_pipeline, load_headline_pipeline
+        from models.vlm_model import load_vlm
+
+        registry = ModelRegistry(MODEL_MEMORY_BUDGET_BYTES, MODEL_MIN_IDLE_SECONDS)
+        registry.register("vlm", lambda: load_vlm(VLM_MODEL_NAME, VLM_PRECISION))
+        registry.register("llm", lambda: load_llm_pipeline(LLM_MODEL_NAME, MAX_NEW_TOKENS, LLM_PRECISION))
+        registry.register("headline", lambda: load_headline_pipeline(HEADLINE_MODEL_NAME, HEADLINE_PRECISION))
+        registry.register("fallback", lambda: load_fallback_pipeline(FALLBACK_MODEL_NAME, MAX_NEW_TOKENS))
+        _registry_instance = registry
+    return _registry_instance
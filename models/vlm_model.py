@@ -0,0 +1,29 @@
+from typing import Tuple
+
+import torch
+from transformers import AutoModelForVision2Seq, AutoProcessor
+
+from models.precision import resolve_dtype, apply_quantization
+#import spaces
+
+
+#@spaces.GPU
+def load_vlm(model_name: str, precision: str = "auto") -> Tuple[AutoModelForVision2Seq, AutoProcessor]:
+    """Load the SmolVLM model and processor used to describe reference images"""
+    DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+    dtype = resolve_dtype(precision, DEVICE, default=torch.float16)
+    print(f"Loading {model_name} on {DEVICE} ({precision}, {dtype})...")
+
+    # Load processor and model separately for better control
+    model = AutoModelForVision2Seq.from_pretrained(
+        model_name,
+        torch_dtype=dtype,
+        #device_map="auto",
+        #_attn_implementation="flash_attention_2" if DEVICE == "cuda" else "eager"
+    ).to(DEVICE)
+    model = apply_quantization(model, precision, DEVICE)
+    processor = AutoProcessor.from_pretrained(model_name)
+    # Batched generation needs left padding so every row ends at the prompt boundary
+    processor.tokenizer.padding_side = "left"
+    print("VLM Model loaded successfully!")
+    return model, processor
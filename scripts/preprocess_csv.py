@@ -0,0 +1,127 @@
+"""
+Normalize a raw swipe CSV into a compact Parquet file the app loads instead of the CSV.
+
+    python -m scripts.preprocess_csv swipe.csv
+    python -m scripts.preprocess_csv swipe.csv --output data/processed/swipe.parquet --keep-duplicates
+
+Streams the CSV row by row, so memory stays flat however large the file is:
+
+- aliased headers ('Concept Name', 'Image URL', ...) are mapped to the columns
+  process_swipe_csv expects; other columns are dropped
+- cells are stripped, blank rows skipped, Google Drive links converted to
+  direct downloads
+- repeated concepts (same name and reference image) are kept once
+
+By default the output goes to data/processed/, named after the CSV's content hash.
+parse_csv_file finds it there when the same file is uploaded, and skips parsing.
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+from typing import Dict, Iterator, List, Optional
+
+from app.config import PROCESSED_DIR
+from app.io import SWIPE_COLUMNS, swipe_column_mapping, convert_google_drive_url, processed_csv_path
+
+ROW_GROUP_SIZE = 10_000
+
+
+def iter_normalized_rows(csv_path: str, dedupe: bool = True, stats: Optional[Dict[str, int]] = None) -> Iterator[Dict[str, Optional[str]]]:
+    """Yield each usable row as {expected column: value or None}"""
+    stats = stats if stats is not None else {}
+    for key in ("rows", "blank", "duplicates"):
+        stats.setdefault(key, 0)
+    seen = set()
+    with open(csv_path, "r", encoding="utf-8-sig", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        mapping = swipe_column_mapping(header)
+        positions = [(index, mapping[name]) for index, name in enumerate(header) if name in mapping]
+
+        for raw_row in reader:
+            stats["rows"] += 1
+            row: Dict[str, Optional[str]] = dict.fromkeys(mapping.values())
+            for index, column in positions:
+                value = raw_row[index].strip() if index < len(raw_row) else ""
+                row[column] = value or None
+            if not any(row.values()):
+                stats["blank"] += 1
+                continue
+            if row.get("Reference Image"):
+                row["Reference Image"] = convert_google_drive_url(row["Reference Image"])
+            if dedupe:
+                # Same concept name (any case) and reference image; whole row without a name
+                name = row.get("Creative Concept Names")
+                key = (name.casefold(), row.get("Reference Image")) if name else tuple(row.values())
+                if key in seen:
+                    stats["duplicates"] += 1
+                    continue
+                seen.add(key)
+            yield row
+
+
+def write_parquet(rows: Iterator[Dict[str, Optional[str]]], output_path: str, columns: List[str]) -> int:
+    """Write rows to Parquet in row groups of ROW_GROUP_SIZE; returns the number written"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(column, pa.string()) for column in columns])
+    tmp_path = f"{output_path}.tmp"
+    written = 0
+    with pq.ParquetWriter(tmp_path, schema, compression="zstd") as writer:
+        batch: List[Dict[str, Optional[str]]] = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= ROW_GROUP_SIZE:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                written += len(batch)
+                batch = []
+        if batch or not written:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            written += len(batch)
+    os.replace(tmp_path, output_path)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("csv_path", help="raw swipe CSV")
+    parser.add_argument("--output", default="", help=f"Parquet path (default: {PROCESSED_DIR}/swipe-<content hash>.parquet)")
+    parser.add_argument("--keep-duplicates", action="store_true", help="keep repeated concepts")
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.csv_path):
+        sys.exit(f"No such file: {args.csv_path}")
+    output_path = args.output or str(processed_csv_path(args.csv_path))
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+
+    with open(args.csv_path, "r", encoding="utf-8-sig", newline="") as f:
+        header = next(csv.reader(f), [])
+    mapping = swipe_column_mapping(header)
+    columns = [column for column in SWIPE_COLUMNS if column in mapping.values()]
+    if not columns:
+        sys.exit(f"None of the expected columns ({', '.join(SWIPE_COLUMNS)}) found in {args.csv_path}")
+    for raw, canonical in mapping.items():
+        if raw != canonical:
+            print(f"Column '{raw}' -> '{canonical}'")
+    missing = [column for column in SWIPE_COLUMNS if column not in columns]
+    if missing:
+        print(f"Missing columns (shown as N/A in prompts): {', '.join(missing)}")
+
+    started = time.perf_counter()
+    stats: Dict = {}
+    rows = iter_normalized_rows(args.csv_path, dedupe=not args.keep_duplicates, stats=stats)
+    written = write_parquet(rows, output_path, columns)
+    elapsed = time.perf_counter() - started
+
+    print(f"Read {stats.get('rows', 0)} rows: {written} kept, {stats.get('duplicates', 0)} duplicates, "
+          f"{stats.get('blank', 0)} blank ({elapsed:.2f}s)")
+    print(f"Wrote {output_path} ({os.path.getsize(output_path) / 1024:.1f} KB)")
+
+
+if __name__ == "__main__":
+    main()
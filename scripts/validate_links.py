@@ -0,0 +1,110 @@
+"""
+Check every reference image link in a swipe CSV before a brief session, and optionally prefetch them.
+
+    python -m scripts.validate_links swipe.csv
+    python -m scripts.validate_links swipe.csv --prefetch          # also fill the download cache
+    python -m scripts.validate_links swipe.csv --output outputs/links.json --strict
+
+Each unique "Reference Image" URL (Drive links converted as the app does) is
+checked concurrently with a HEAD request, or a one-byte range GET where HEAD is
+refused. The report shows status, content type and size for each link. A link
+passes only if it answers with an image, which catches private Drive files that
+serve a sign-in page. With --prefetch the valid images are downloaded into the
+app's download cache (or --cache-dir). The cache index is merged on write, so a
+running app picks the new entries up on its next lookup.
+"""
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+from app.cache import DownloadCache
+from app.config import DOWNLOAD_CACHE_TTL, DOWNLOAD_CACHE_MAX_BYTES, DOWNLOAD_CACHE_TRIM_GRACE
+from app.downloader import get_downloader
+from app.io import parse_csv_file, extract_image_urls_from_csv
+
+
+def format_size(size) -> str:
+    if size is None:
+        return "?"
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+def check_links(urls: List[str], workers: int) -> List[Dict[str, Any]]:
+    """Probe URLs concurrently (per-host limits from the shared downloader); results keep input order"""
+    downloader = get_downloader()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(downloader.probe, urls))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("csv_path", help="swipe CSV with a Reference Image column")
+    parser.add_argument("--prefetch", action="store_true", help="download valid images into the download cache")
+    parser.add_argument("--workers", type=int, default=0, help="concurrent checks (default: the downloader's worker count)")
+    parser.add_argument("--timeout", type=float, default=0, help="per-request timeout in seconds (default: the app's)")
+    parser.add_argument("--cache-dir", default="", help="download cache to prefetch into (default: the app's)")
+    parser.add_argument("--deadline", type=float, default=0, help="overall prefetch deadline in seconds (default: the app's)")
+    parser.add_argument("--output", default="", help="write the report as JSON to this path")
+    parser.add_argument("--strict", action="store_true", help="exit with status 1 if any link is broken")
+    args = parser.parse_args()
+
+    csv_df = parse_csv_file(SimpleNamespace(name=args.csv_path))
+    if csv_df is None:
+        sys.exit(f"Could not read {args.csv_path}")
+    urls = list(dict.fromkeys(extract_image_urls_from_csv(csv_df)))
+    if not urls:
+        sys.exit(f"No Reference Image URLs in {args.csv_path}")
+
+    downloader = get_downloader()
+    if args.cache_dir:
+        downloader.cache = DownloadCache(args.cache_dir, ttl=DOWNLOAD_CACHE_TTL, max_bytes=DOWNLOAD_CACHE_MAX_BYTES, trim_grace=DOWNLOAD_CACHE_TRIM_GRACE)
+        downloader.save_dir = str(downloader.cache.cache_dir)
+    if args.timeout:
+        downloader.timeout = args.timeout
+    if args.deadline:
+        downloader.deadline = args.deadline
+
+    print(f"Checking {len(urls)} links...")
+    started = time.perf_counter()
+    results = check_links(urls, args.workers or downloader.max_workers)
+    elapsed = time.perf_counter() - started
+
+    print(f"\n{'':4} {'status':>6} {'type':<12} {'size':>9} {'ms':>7}  url")
+    for r in results:
+        print(f"{'ok' if r['ok'] else 'FAIL':<4} {r['status'] or '-':>6} {(r['content_type'] or '-')[:12]:<12} "
+              f"{format_size(r['size']):>9} {r['elapsed_ms']:>7.0f}  {r['url']}")
+        if r["error"]:
+            print(f"{'':12}-> {r['error']}")
+
+    valid = [r["url"] for r in results if r["ok"]]
+    print(f"\n{len(valid)}/{len(results)} links OK in {elapsed:.1f}s")
+
+    if args.prefetch and valid:
+        print(f"Prefetching {len(valid)} images into {downloader.save_dir}...")
+        started = time.perf_counter()
+        paths = downloader.download_all(valid)
+        fetched = {url: path for url, path in zip(valid, paths)}
+        for r in results:
+            if r["ok"]:
+                r["cached_path"] = fetched.get(r["url"])
+        print(f"Prefetched {sum(1 for path in paths if path)}/{len(valid)} in {time.perf_counter() - started:.1f}s")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"csv": args.csv_path, "checked": len(results), "ok": len(valid), "links": results}, f, indent=2)
+        print(f"Wrote {args.output}")
+
+    if args.strict and len(valid) < len(results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Shared fixtures: small offline stand-ins for uploads, reference-image hosts and models."""
+import functools
+import os
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import pytest
+import torch
+
+# Byte-level tokens are enough for the tests; these are the specials the app relies on
+SPECIAL_TOKENS = ["<s>", "</s>", "<pad>"]
+
+CHAT_TEMPLATE = (
+    "{% for m in messages %}<s>{{ m['role'] }}\n{{ m['content'] }}</s>{% endfor %}"
+    "{% if add_generation_prompt %}<s>assistant\n{% endif %}"
+)
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def write_images():
+    """Write `count` small JPEGs to a directory; returns their paths"""
+    from PIL import Image
+
+    def write(directory, count, size=(64, 48)):
+        os.makedirs(directory, exist_ok=True)
+        generator = torch.Generator().manual_seed(0)
+        paths = []
+        for i in range(count):
+            pixels = torch.randint(0, 256, (size[1], size[0], 3), dtype=torch.uint8, generator=generator)
+            path = os.path.join(str(directory), f"reference_{i:03d}.jpg")
+            Image.fromarray(pixels.numpy()).save(path, quality=85)
+            paths.append(path)
+        return paths
+
+    return write
+
+
+@pytest.fixture
+def write_swipe_csv():
+    """Write a swipe CSV with the columns process_swipe_csv expects; returns its path"""
+
+    def write(path, image_urls, rows=None):
+        rows = rows if rows is not None else len(image_urls)
+        pd.DataFrame({
+            "Creative Concept Names": [f"Concept {i}" for i in range(rows)],
+            "Short Description": [f"Lifestyle shot {i}" for i in range(rows)],
+            "Content Requirements Per Variant": ["Headline, subheadline, CTA"] * rows,
+            "Format": ["Static" if i % 2 == 0 else "Video" for i in range(rows)],
+            "Reference Image": [image_urls[i % len(image_urls)] if image_urls else "" for i in range(rows)],
+        }).to_csv(path, index=False)
+        return str(path)
+
+    return write
+
+
+@pytest.fixture
+def serve_directory():
+    """Serve a directory over HTTP on a free localhost port; returns the base URL"""
+    servers = []
+
+    def serve(directory):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(_QuietHandler, directory=str(directory)))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}"
+
+    yield serve
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture(scope="session")
+def tiny_tokenizer():
+    """Byte-level BPE tokenizer with a chat template and a pad token"""
+    from tokenizers import Tokenizer, models, pre_tokenizers, decoders, trainers
+    from transformers import PreTrainedTokenizerFast
+
+    tokenizer = Tokenizer(models.BPE())
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(
+        vocab_size=300, special_tokens=SPECIAL_TOKENS, initial_alphabet=pre_tokenizers.ByteLevel.alphabet(),
+    )
+    tokenizer.train_from_iterator(["Write a creative brief for the brand."], trainer)
+    hf_tokenizer = PreTrainedTokenizerFast(tokenizer_object=tokenizer, bos_token="<s>", eos_token="</s>", pad_token="<pad>")
+    hf_tokenizer.chat_template = CHAT_TEMPLATE
+    return hf_tokenizer
+
+
+@pytest.fixture(scope="session")
+def tiny_llama(tiny_tokenizer):
+    """Randomly initialised two-layer Llama sized to tiny_tokenizer (fp32, eval mode)"""
+    from transformers import LlamaConfig, LlamaForCausalLM
+
+    torch.manual_seed(0)
+    config = LlamaConfig(
+        vocab_size=len(tiny_tokenizer),
+        hidden_size=32,
+        intermediate_size=64,
+        num_hidden_layers=2,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        max_position_embeddings=1024,
+        bos_token_id=0,
+        eos_token_id=1,
+        pad_token_id=2,
+    )
+    return LlamaForCausalLM(config).eval()
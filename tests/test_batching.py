@@ -0,0 +1,88 @@
+import threading
+
+import pytest
+
+from app.batching import MicroBatcher
+
+
+class Recorder:
+    """process_batch that records each batch and can be held until released"""
+
+    def __init__(self):
+        self.batches = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, items):
+        self.started.set()
+        self.release.wait(timeout=5)
+        self.batches.append(list(items))
+        return [item * 10 for item in items]
+
+
+@pytest.fixture
+def recorder():
+    return Recorder()
+
+
+@pytest.fixture
+def make_batcher():
+    """MicroBatcher factory; every batcher is shut down at teardown"""
+    batchers = []
+
+    def make(process_batch, **kwargs):
+        batchers.append(MicroBatcher(process_batch, **kwargs))
+        return batchers[-1]
+
+    yield make
+    for batcher in batchers:
+        batcher.shutdown(wait=False)
+
+
+def results(futures):
+    return [future.result(timeout=5) for future in futures]
+
+
+def test_items_with_the_same_key_share_a_batch(recorder, make_batcher):
+    batcher = make_batcher(recorder, max_batch_size=3, max_wait_seconds=5, key_fn=lambda item: item % 2)
+    futures = [batcher.submit(item) for item in (1, 2, 3, 4, 5)]
+    # Odd items fill a batch at once; the even pair waits until shutdown flushes it
+    assert results(futures[::2]) == [10, 30, 50]
+    assert recorder.batches == [[1, 3, 5]]
+    batcher.shutdown()
+    assert results(futures[1::2]) == [20, 40]
+    assert recorder.batches == [[1, 3, 5], [2, 4]]
+    assert batcher.stats()["max_batch"] == 3
+
+
+def test_partial_batch_is_sent_after_max_wait(recorder, make_batcher):
+    batcher = make_batcher(recorder, max_batch_size=8, max_wait_seconds=0.05)
+    assert results([batcher.submit(1), batcher.submit(2)]) == [10, 20]
+    assert recorder.batches == [[1, 2]]
+
+
+def test_concurrency_bound_and_cancelled_items(recorder, make_batcher):
+    recorder.release.clear()
+    batcher = make_batcher(recorder, max_batch_size=1, max_wait_seconds=0, max_concurrency=1)
+    running = batcher.submit(1)
+    assert recorder.started.wait(timeout=5)
+    queued = [batcher.submit(item) for item in (2, 3, 4)]
+    # Only one batch runs at a time, so the rest wait in arrival order
+    assert [batcher.position(future) for future in queued] == [0, 1, 2]
+    assert queued[1].cancel()
+    recorder.release.set()
+    assert results([running, queued[0], queued[2]]) == [10, 20, 40]
+    assert recorder.batches == [[1], [2], [4]]
+    assert batcher.position(running) is None
+
+
+def test_errors_reach_every_future_in_the_batch(make_batcher):
+    batcher = make_batcher(lambda items: items[:1], max_batch_size=2, max_wait_seconds=5)
+    futures = [batcher.submit(1), batcher.submit(2)]
+    for future in futures:
+        with pytest.raises(RuntimeError, match="1 results for 2 items"):
+            future.result(timeout=5)
+    batcher.shutdown()
+    with pytest.raises(RuntimeError):
+        batcher.submit(3)
@@ -0,0 +1,65 @@
+import torch
+
+from app.decoding import BriefCompletionCriteria, RepetitionCriteria
+
+PROMPT = "Write Image Brief 1 of 3 in this format:\n## Image Brief 1\n- Color Palette: <colors>\n"
+
+
+def ids(tokenizer, *texts):
+    """One (rows, width) id tensor, shorter rows left-padded"""
+    rows = [tokenizer.encode(text, add_special_tokens=False) for text in texts]
+    width = max(len(row) for row in rows)
+    return torch.tensor([[tokenizer.pad_token_id] * (width - len(row)) + row for row in rows])
+
+
+def test_completion_counts_only_generated_text(tiny_tokenizer):
+    prompt = ids(tiny_tokenizer, PROMPT)
+    generated = ids(tiny_tokenizer, "## Image Brief 1\n- Color Palette: sage\n## Image Brief 2\n- Color Palette: sand\n")
+    full = torch.cat([prompt, generated], dim=1)
+    scores = torch.zeros(1, len(tiny_tokenizer))
+
+    # The prompt's own example brief is not a written brief
+    criteria = BriefCompletionCriteria(tiny_tokenizer, [(1, 0)], prompt.shape[1])
+    assert not criteria(torch.cat([prompt, ids(tiny_tokenizer, "Sure\n")], dim=1), scores).item()
+
+    # First call after many tokens at once, as with a passed-in cache
+    assert BriefCompletionCriteria(tiny_tokenizer, [(2, 0)], prompt.shape[1])(full, scores).item()
+    assert not BriefCompletionCriteria(tiny_tokenizer, [(3, 0)], prompt.shape[1])(full, scores).item()
+
+
+def test_completion_tracks_rows_separately(tiny_tokenizer):
+    done = "## Video Brief 1\n- Voiceover Style: warm\n"
+    busy = "## Video Brief 1\n- Hook: a slow pan..\n"
+    generated = ids(tiny_tokenizer, done, busy)
+    prompt = ids(tiny_tokenizer, PROMPT, PROMPT)
+    criteria = BriefCompletionCriteria(tiny_tokenizer, [(0, 1), (0, 1)], prompt.shape[1])
+    stop = criteria(torch.cat([prompt, generated], dim=1), torch.zeros(2, len(tiny_tokenizer)))
+    assert stop.tolist() == [True, False]
+
+
+def check_repetition(tokenizer, generated_text, **kwargs):
+    prompt = ids(tokenizer, PROMPT)
+    full = torch.cat([prompt, ids(tokenizer, generated_text)], dim=1)
+    criteria = RepetitionCriteria(tokenizer, prompt.shape[1], check_every=1, **kwargs)
+    return criteria(full, torch.zeros(1, len(tokenizer))).item()
+
+
+def test_repeated_structure_is_not_a_loop(tiny_tokenizer):
+    assert not check_repetition(tiny_tokenizer, "| --- | --- | --- |\n" * 40)
+    assert not check_repetition(tiny_tokenizer, "\n---\n\n" * 60)
+    # Empty field scaffolding repeated across briefs
+    assert not check_repetition(tiny_tokenizer, "**Headline:**\n**Subheadline:**\n**CTA:**\n" * 12)
+
+
+def test_repeated_sentences_are_a_loop(tiny_tokenizer):
+    sentence = "The purifier keeps the whole home fresh and clean every single day for the family. "
+    assert check_repetition(tiny_tokenizer, "Intro line.\n" + sentence * 6)
+    assert not check_repetition(tiny_tokenizer, "Intro line.\n" + sentence * 2)
+
+
+def test_repetition_in_the_prompt_is_ignored(tiny_tokenizer):
+    sentence = "The purifier keeps the whole home fresh and clean every single day for the family. "
+    prompt = ids(tiny_tokenizer, sentence * 6)
+    full = torch.cat([prompt, ids(tiny_tokenizer, "A fresh start for the brief.\n" * 1)], dim=1)
+    criteria = RepetitionCriteria(tiny_tokenizer, prompt.shape[1], check_every=1)
+    assert not criteria(full, torch.zeros(1, len(tiny_tokenizer))).item()
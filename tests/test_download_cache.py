@@ -0,0 +1,83 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from app.cache import DownloadCache
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def test_prefetch_is_visible_to_a_running_cache(tmp_path, write_images, write_swipe_csv, serve_directory):
+    image_dir = tmp_path / "served"
+    cache_dir = tmp_path / "downloads"
+    write_images(image_dir, 2)
+
+    # The app's cache is already open, with an entry of its own not yet flushed
+    app_cache = DownloadCache(cache_dir)
+    own_file = cache_dir / "own.jpg"
+    cache_dir.mkdir()
+    own_file.write_bytes(b"x" * 10)
+    app_cache.store("https://example.com/own.jpg", own_file, None, None, 10)
+
+    base_url = serve_directory(image_dir)
+    urls = [f"{base_url}/{name}" for name in sorted(os.listdir(image_dir))]
+    csv_path = write_swipe_csv(tmp_path / "swipe.csv", urls)
+    subprocess.run(
+        [sys.executable, "-m", "scripts.validate_links", csv_path, "--prefetch", "--strict", "--cache-dir", str(cache_dir)],
+        cwd=REPO_ROOT, check=True, capture_output=True,
+    )
+
+    # A separate instance, opened before the prefetch, finds the prefetched files
+    for url in urls:
+        entry = app_cache.lookup(url)
+        assert entry is not None and Path(entry["path"]).exists()
+
+    # Flushing the app's cache keeps the prefetched entries alongside its own
+    app_cache.flush()
+    reopened = DownloadCache(cache_dir)
+    assert all(reopened.lookup(url) is not None for url in urls + ["https://example.com/own.jpg"])
+
+
+def test_concurrent_writers_keep_each_others_entries(tmp_path):
+    first, second = DownloadCache(tmp_path), DownloadCache(tmp_path)
+    for cache, name in ((first, "a.jpg"), (second, "b.jpg")):
+        (tmp_path / name).write_bytes(b"x")
+        cache.store(f"https://example.com/{name}", tmp_path / name, None, None, 1)
+    first.flush()
+    second.flush()
+    assert not list(tmp_path.glob("*.tmp"))
+    reopened = DownloadCache(tmp_path)
+    assert reopened.lookup("https://example.com/a.jpg") is not None
+    assert reopened.lookup("https://example.com/b.jpg") is not None
+
+
+def test_new_content_type_removes_the_old_file(tmp_path):
+    cache = DownloadCache(tmp_path)
+    url = "https://example.com/pack"
+    old_path, new_path = cache.path_for(url, "image/jpeg"), cache.path_for(url, "image/png")
+    old_path.write_bytes(b"x" * 4)
+    cache.store(url, old_path, None, None, 4)
+    new_path.write_bytes(b"y" * 6)
+    cache.store(url, new_path, None, None, 6)
+
+    assert not old_path.exists() and new_path.exists()
+    assert cache.stats()["bytes"] == 6
+
+
+def test_trim_after_merge_spares_files_just_used_elsewhere(tmp_path):
+    ours = DownloadCache(tmp_path, max_bytes=10)
+    theirs = DownloadCache(tmp_path, max_bytes=10)
+    for cache, name in ((ours, "ours.jpg"), (theirs, "theirs.jpg")):
+        (tmp_path / name).write_bytes(b"x" * 8)
+        cache.store(f"https://example.com/{name}", tmp_path / name, None, None, 8)
+    theirs.flush()
+
+    # Merging their index takes us over max_bytes, but their file was just used
+    assert ours.lookup("https://example.com/theirs.jpg") is not None
+    assert (tmp_path / "theirs.jpg").exists() and (tmp_path / "ours.jpg").exists()
+
+    # Past the grace window the least recently used file goes as usual
+    ours.trim_grace = 0
+    ours.flush()
+    assert sorted(p.name for p in tmp_path.glob("*.jpg")) == ["theirs.jpg"]
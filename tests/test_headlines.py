@@ -0,0 +1,46 @@
+import pytest
+
+from app import form_models
+from app.form_models import HeadlineParseError, parse_headline_output
+
+
+def test_parse_headline_output_accepts_format_variants():
+    text = "\n".join([
+        "Sure! Here you go:",
+        "###Headline 1. Breathe easy at home",
+        "### Headline 2: \"Clean air, zero chemicals\"",
+        "**Sub-headline 1.** Plant-based purification",
+        "Subheadline 2) Quiet enough for the nursery",
+        "###Headline 3. breathe easy at home",
+    ])
+    assert parse_headline_output(text) == {
+        "headline": ["Breathe easy at home", "Clean air, zero chemicals"],
+        "subheadline": ["Plant-based purification", "Quiet enough for the nursery"],
+    }
+
+
+def test_parse_headline_output_raises_without_items():
+    with pytest.raises(HeadlineParseError):
+        parse_headline_output("I cannot help with that.\nHeadline: missing number")
+
+
+def test_spare_sets_of_the_other_kind_are_capped(monkeypatch):
+    calls = []
+
+    def fake_sets(brand_name, angle_description):
+        calls.append(1)
+        n = len(calls)
+        return [
+            {"headline": [f"h{n}.{i}"], "subheadline": [f"s{n}.{i}"]}
+            for i in range(form_models.HEADLINE_NUM_SEQUENCES)
+        ]
+
+    monkeypatch.setattr(form_models, "generate_headline_sets", fake_sets)
+    monkeypatch.setattr(form_models, "_unused_sets", type(form_models._unused_sets)())
+
+    # Keep clicking only "headlines": the unclicked subheadlines must not pile up
+    shown = [form_models._take_items("headline", "Brand", "Angle") for _ in range(10)]
+    pool = form_models._unused_sets[("Brand", "Angle")]
+    assert shown[0] == ["h1.0"]
+    assert len(pool["subheadline"]) <= form_models.HEADLINE_NUM_SEQUENCES
+    assert len(set(map(tuple, shown))) == len(shown)
@@ -0,0 +1,79 @@
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pandas as pd
+
+from app import io
+from app.io import extract_zip_assets, parse_csv_file, select_zip_members
+
+
+def write_zip(path, members, compression=zipfile.ZIP_STORED):
+    with zipfile.ZipFile(path, "w", compression=compression) as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return str(path)
+
+
+def selected_names(path, **limits):
+    with zipfile.ZipFile(path) as archive:
+        return [info.filename for info in select_zip_members(archive, {".jpg", ".pdf"}, **limits)]
+
+
+def test_zip_member_count_and_size_limits(tmp_path):
+    members = {f"img{i}.jpg": b"x" * 100 for i in range(5)}
+    members.update({"big.jpg": b"y" * 1000, "notes.txt": b"skip", "__MACOSX/img0.jpg": b"x", "dir/.hidden.jpg": b"x"})
+    path = write_zip(tmp_path / "assets.zip", members)
+
+    assert selected_names(path, max_member_bytes=500) == [f"img{i}.jpg" for i in range(5)]
+    assert selected_names(path, max_member_bytes=500, max_members=3) == ["img0.jpg", "img1.jpg", "img2.jpg"]
+    assert selected_names(path, max_member_bytes=500, max_total_bytes=250) == ["img0.jpg", "img1.jpg"]
+
+
+def test_zip_members_packed_too_tightly_are_skipped(tmp_path):
+    path = write_zip(tmp_path / "bomb.zip", {"zeros.pdf": b"\0" * 200_000, "ok.jpg": os.urandom(2000)}, zipfile.ZIP_DEFLATED)
+    assert selected_names(path, max_compression_ratio=100) == ["ok.jpg"]
+
+
+def test_member_larger_than_its_header_is_not_extracted(tmp_path, monkeypatch):
+    path = write_zip(tmp_path / "assets.zip", {"a.jpg": b"a" * 10, "b.jpg": b"b" * 5000})
+    monkeypatch.setattr(io, "ZIP_MAX_MEMBER_BYTES", 1000)
+    # Pretend the central directory understated b.jpg's size
+    monkeypatch.setattr(io, "select_zip_members", lambda archive, suffixes: archive.infolist())
+    extracted = extract_zip_assets(path, extract_dir=tmp_path / "out", suffixes={".jpg"})
+    assert [os.path.basename(p) for p in extracted] == ["0000_a.jpg"]
+    assert not list((tmp_path / "out").rglob("*.part"))
+
+
+def test_concurrent_extractions_of_one_archive(tmp_path):
+    members = {f"img{i}.jpg": os.urandom(5000) for i in range(20)}
+    path = write_zip(tmp_path / "assets.zip", members)
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(lambda _: extract_zip_assets(path, extract_dir=tmp_path / "out"), range(4)))
+    assert all(len(paths) == 20 for paths in results)
+    for extracted in results[0]:
+        name = os.path.basename(extracted).split("_", 1)[1]
+        with open(extracted, "rb") as f:
+            assert f.read() == members[name]
+    assert not list((tmp_path / "out").rglob("*.part"))
+
+
+def test_small_and_chunked_csv_reads_agree(tmp_path, monkeypatch):
+    csv_path = tmp_path / "swipe.csv"
+    csv_path.write_text(
+        "Concept Name,Notes,image url,Format\n"
+        "Morning routine,internal,https://example.com/a.jpg,Static\n"
+        ",only a note,,\n"
+        "Unboxing,,https://example.com/b.jpg,Video\n"
+    )
+    upload = SimpleNamespace(name=str(csv_path))
+    monkeypatch.setattr(io, "processed_csv_path", lambda path: tmp_path / "missing.parquet")
+    small = parse_csv_file(upload)
+    monkeypatch.setattr(io, "CSV_CHUNK_THRESHOLD_BYTES", 0)
+    monkeypatch.setattr(io, "CSV_CHUNK_ROWS", 1)
+    chunked = parse_csv_file(upload)
+
+    assert list(small.columns) == ["Creative Concept Names", "Reference Image", "Format"]
+    pd.testing.assert_frame_equal(small, chunked)
+    assert small["Creative Concept Names"].tolist() == ["Morning routine", "Unboxing"]
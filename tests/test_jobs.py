@@ -0,0 +1,71 @@
+import json
+import threading
+
+from app.jobs import JobManager
+
+
+def wait_finished(manager, job_id):
+    for job in manager.follow(job_id, poll_interval=0.05):
+        pass
+    return manager.get(job_id)
+
+
+def test_returned_and_streamed_outputs_finish_done(tmp_path):
+    def handler(text, stream):
+        if stream:
+            return (f"{text} {i}" for i in (1, 2))
+        return text
+
+    manager = JobManager(handler, jobs_dir=tmp_path)
+    returned = wait_finished(manager, manager.submit("brief", False))
+    streamed = wait_finished(manager, manager.submit("brief", True))
+    assert (returned.status, returned.output) == ("done", "brief")
+    assert (streamed.status, streamed.output) == ("done", "brief 2")
+    # The record on disk is written once the worker is done with the job
+    streamed.future.result(timeout=5)
+    record = json.loads((tmp_path / f"{streamed.job_id}.json").read_text())
+    assert record["status"] == "done" and record["output"] == "brief 2"
+
+
+def test_raised_and_reported_errors_finish_failed(tmp_path):
+    def handler(mode):
+        if mode == "raise":
+            raise ValueError("model missing")
+        yield "❌ bad input", None
+
+    manager = JobManager(handler, jobs_dir=tmp_path, error_fn=lambda output: output[0] if output[0].startswith("❌") else None)
+    raised = wait_finished(manager, manager.submit("raise"))
+    reported = wait_finished(manager, manager.submit("report"))
+    assert (raised.status, raised.error) == ("failed", "model missing")
+    assert (reported.status, reported.error) == ("failed", "❌ bad input")
+
+
+def test_cancel_queued_and_running_jobs(tmp_path):
+    started, release, closed = threading.Event(), threading.Event(), threading.Event()
+    calls = []
+
+    def handler(name):
+        calls.append(name)
+        try:
+            started.set()
+            yield "partial"
+            release.wait(timeout=5)
+            yield "more"
+        finally:
+            closed.set()
+
+    manager = JobManager(handler, jobs_dir=tmp_path, max_concurrency=1)
+    running = manager.submit("running")
+    assert started.wait(timeout=5)
+    queued = manager.submit("queued")
+    assert manager.queue_position(queued) == 0
+    assert manager.queue_position(running) is None
+
+    assert manager.cancel(queued)
+    assert manager.get(queued).status == "cancelled"
+    assert manager.cancel(running)
+    release.set()
+    assert wait_finished(manager, running).status == "cancelled"
+    assert closed.is_set()
+    assert calls == ["running"]
+    assert not manager.cancel(running)
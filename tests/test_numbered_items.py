@@ -0,0 +1,81 @@
+import torch
+from transformers import LogitsProcessorList, StoppingCriteriaList
+
+from app.decoding import NumberedItemsProcessor, StopWhenItemsComplete
+from app.form_models import parse_headline_output
+
+
+def make_processor(tokenizer, count=2, max_item_tokens=4):
+    return NumberedItemsProcessor.for_kinds(
+        tokenizer, ("Headline", "Subheadline"), count, tokenizer.eos_token_id, max_item_tokens
+    )
+
+
+def test_random_scores_still_produce_parseable_items(tiny_tokenizer):
+    processor = make_processor(tiny_tokenizer)
+    stop = StopWhenItemsComplete(processor)
+    input_ids = torch.tensor([tiny_tokenizer.encode("Write headlines:\n", add_special_tokens=False)] * 2)
+    generator = torch.Generator().manual_seed(0)
+
+    for _ in range(processor.token_budget()):
+        scores = torch.randn(2, len(tiny_tokenizer), generator=generator)
+        next_tokens = processor(input_ids, scores).argmax(dim=-1, keepdim=True)
+        input_ids = torch.cat([input_ids, next_tokens], dim=1)
+        if stop(input_ids, scores).all():
+            break
+    assert stop(input_ids, scores).all()
+
+    for row in input_ids:
+        text = tiny_tokenizer.decode(row, skip_special_tokens=True)
+        lines = text.split("\n")[1:]
+        assert [line.split(".")[0] for line in lines if line] == [
+            "###Headline 1", "###Headline 2", "###Subheadline 1", "###Subheadline 2",
+        ]
+        items = parse_headline_output(text)
+        assert len(items["headline"]) <= 2 and len(items["subheadline"]) <= 2
+
+
+def test_items_are_capped_and_end_with_eos(tiny_tokenizer):
+    processor = make_processor(tiny_tokenizer, count=1, max_item_tokens=3)
+    input_ids = torch.tensor([tiny_tokenizer.encode("Go:\n", add_special_tokens=False)])
+    newline = tiny_tokenizer.encode("\n", add_special_tokens=False)[-1]
+    # A model that never wants to end a line
+    scores = torch.zeros(1, len(tiny_tokenizer))
+    scores[0, tiny_tokenizer.encode("a", add_special_tokens=False)[0]] = 10
+    scores[0, newline] = -10
+
+    for _ in range(processor.token_budget()):
+        next_token = processor(input_ids, scores.clone()).argmax(dim=-1, keepdim=True)
+        input_ids = torch.cat([input_ids, next_token], dim=1)
+        if next_token.item() == tiny_tokenizer.eos_token_id:
+            break
+    text = tiny_tokenizer.decode(input_ids[0], skip_special_tokens=True)
+    assert text == "Go:\n###Headline 1.aaa\n###Subheadline 1.aaa\n"
+    assert input_ids[0, -1].item() == tiny_tokenizer.eos_token_id
+
+
+def test_forced_token_survives_earlier_suppression(tiny_tokenizer):
+    processor = make_processor(tiny_tokenizer)
+    input_ids = torch.tensor([tiny_tokenizer.encode("Go:\n", add_special_tokens=False)])
+    scores = torch.full((1, len(tiny_tokenizer)), float("-inf"))
+    masked = processor(input_ids, scores)
+    first_label_token = processor.label_ids[0][0]
+    assert masked.argmax().item() == first_label_token
+    assert torch.isfinite(masked[0, first_label_token])
+
+
+def test_generate_with_a_model_stops_after_the_last_item(tiny_tokenizer, tiny_llama):
+    processor = make_processor(tiny_tokenizer)
+    input_ids = torch.tensor([tiny_tokenizer.encode("Write headlines:\n", add_special_tokens=False)])
+    output = tiny_llama.generate(
+        input_ids=input_ids,
+        attention_mask=torch.ones_like(input_ids),
+        do_sample=True,
+        max_new_tokens=processor.token_budget(),
+        logits_processor=LogitsProcessorList([processor]),
+        stopping_criteria=StoppingCriteriaList([StopWhenItemsComplete(processor)]),
+        pad_token_id=tiny_tokenizer.pad_token_id,
+    )
+    text = tiny_tokenizer.decode(output[0, input_ids.shape[1]:], skip_special_tokens=True)
+    assert text.count("\n") == 4 and text.startswith("###Headline 1.")
+    assert "###Subheadline 2." in text
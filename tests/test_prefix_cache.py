@@ -0,0 +1,50 @@
+import torch
+
+from app.prefix_cache import PrefixCache
+
+SYSTEM = [{"role": "system", "content": "You write creative briefs for the brand. " * 4}]
+CONVERSATIONS = [
+    SYSTEM + [{"role": "user", "content": "Write Image Brief 1."}],
+    SYSTEM + [{"role": "user", "content": "Write Video Brief 2 with a hook and a voiceover."}],
+    SYSTEM + [{"role": "user", "content": "Brief 3"}],
+]
+GREEDY = dict(do_sample=False, max_new_tokens=8)
+
+
+def plain_reply(model, tokenizer, conversation):
+    input_ids = tokenizer.apply_chat_template(conversation, add_generation_prompt=True, return_tensors="pt")
+    output = model.generate(
+        input_ids=input_ids, attention_mask=torch.ones_like(input_ids), pad_token_id=tokenizer.pad_token_id, **GREEDY
+    )
+    return tokenizer.decode(output[0, input_ids.shape[1]:], skip_special_tokens=True)
+
+
+def test_batch_rows_are_prefix_pad_suffix(tiny_llama, tiny_tokenizer, monkeypatch):
+    cache = PrefixCache(tiny_llama, tiny_tokenizer, min_prefix_tokens=8)
+    seen = {}
+    generate = tiny_llama.generate
+
+    def recording_generate(**kwargs):
+        seen.update(kwargs, cached=kwargs["past_key_values"].get_seq_length())
+        return generate(**kwargs)
+
+    monkeypatch.setattr(tiny_llama, "generate", recording_generate)
+    cache.generate_batch(CONVERSATIONS, prefix_messages=SYSTEM, **GREEDY)
+
+    rows = [tiny_tokenizer.apply_chat_template(c, add_generation_prompt=True) for c in CONVERSATIONS]
+    cached, input_ids, mask = seen["cached"], seen["input_ids"], seen["attention_mask"]
+    assert cached >= 8 and input_ids.shape[1] == max(len(row) for row in rows) > min(len(row) for row in rows)
+    for i, row in enumerate(rows):
+        padding = input_ids.shape[1] - len(row)
+        assert input_ids[i, :cached].tolist() == row[:cached]
+        assert input_ids[i, cached + padding:].tolist() == row[cached:]
+        assert mask[i].tolist() == [1] * cached + [0] * padding + [1] * (len(row) - cached)
+
+
+def test_batched_replies_match_unbatched_generation(tiny_llama, tiny_tokenizer):
+    cache = PrefixCache(tiny_llama, tiny_tokenizer, min_prefix_tokens=8)
+    expected = [plain_reply(tiny_llama, tiny_tokenizer, conversation) for conversation in CONVERSATIONS]
+    assert cache.generate_batch(CONVERSATIONS, prefix_messages=SYSTEM, **GREEDY) == expected
+    # A second batch reuses the cached prefix and still agrees
+    assert cache.generate_batch(CONVERSATIONS, prefix_messages=SYSTEM, **GREEDY) == expected
+    assert cache.stats()["hits"] == 1
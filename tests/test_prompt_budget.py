@@ -0,0 +1,52 @@
+from app.config import EVERGREEN_USER_PROMPT_PATH
+from app.prompts import PromptBuilder
+
+BRIEF = dict(
+    brand_name="Azuna",
+    website_url="https://example.com",
+    product_name="Air Purifier",
+    target_audience="New parents",
+    tone="Calm",
+    angle_description="Clean air without chemicals",
+    headlines=["Breathe easy"],
+    content_bank=["unboxing", "testimonial"],
+)
+
+DESCRIPTIONS = [f"A bright kitchen scene number {i} with the purifier on the counter" for i in range(40)]
+
+
+def build(tokenizer, budget, descriptions=DESCRIPTIONS):
+    builder = PromptBuilder(str(EVERGREEN_USER_PROMPT_PATH), tokenizer=tokenizer, token_budget=budget)
+    return builder, builder.build_prompt(reference_image_description=list(descriptions), **BRIEF)
+
+
+def test_prompt_within_budget_is_left_alone(tiny_tokenizer):
+    builder, prompt = build(tiny_tokenizer, budget=None)
+    assert builder.last_report is None
+    fitted, fitted_prompt = build(tiny_tokenizer, budget=builder.count_tokens(prompt))
+    assert fitted_prompt == prompt
+    assert fitted.last_report["dropped"] == {}
+
+
+def test_reference_descriptions_are_trimmed_first(tiny_tokenizer):
+    full, full_prompt = build(tiny_tokenizer, budget=None)
+    budget = full.count_tokens(full_prompt) - 200
+    builder, prompt = build(tiny_tokenizer, budget=budget)
+    report = builder.last_report
+
+    assert report["tokens"] <= budget < report["original_tokens"]
+    assert list(report["dropped"]) == ["reference_image_description"]
+    # Trailing descriptions go first; the rest of the prompt is untouched
+    kept = len(DESCRIPTIONS) - report["dropped"]["reference_image_description"]
+    assert f"[Image {kept}] {DESCRIPTIONS[kept - 1]}" in prompt
+    assert f"[Image {kept + 1}]" not in prompt
+    assert "testimonial" in prompt and "Breathe easy" in prompt
+
+
+def test_trimming_moves_on_to_the_next_section(tiny_tokenizer):
+    without_images, prompt = build(tiny_tokenizer, budget=None, descriptions=[])
+    builder, trimmed = build(tiny_tokenizer, budget=without_images.count_tokens(prompt) - 2)
+    dropped = builder.last_report["dropped"]
+    assert dropped["reference_image_description"] == len(DESCRIPTIONS)
+    assert dropped["content_bank"] >= 1
+    assert "headlines" not in dropped
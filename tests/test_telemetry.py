@@ -0,0 +1,36 @@
+import torch
+
+from app.telemetry import GenerationTimer, Telemetry
+
+PAD = 0
+
+
+def run_timer(steps, prompt, **kwargs):
+    records = []
+    exporter = type("Collect", (), {"export": lambda self, record: records.append(record)})()
+    trace = Telemetry([exporter]).start_trace("test")
+    with trace.active():
+        timer = GenerationTimer("llm", **kwargs)
+        timer.put(prompt)
+        for step in steps:
+            timer.put(step)
+        timer.end()
+    trace.finish()
+    return records[0]["counters"]
+
+
+def test_padding_is_not_counted():
+    # Two left-padded rows; the second finishes after one token and is then padded
+    prompt = torch.tensor([[PAD, PAD, 5, 6], [7, 8, 9, 10]])
+    steps = [torch.tensor([11, 12]), torch.tensor([13, PAD]), torch.tensor([14, PAD])]
+    counters = run_timer(steps, prompt, pad_token_id=PAD)
+    assert counters["llm.prompt_tokens"] == 6
+    assert counters["llm.generated_tokens"] == 4
+
+
+def test_known_prompt_size_and_single_rows():
+    # The [prefix][pad][suffix] layout pads mid-row; the caller passes the real size
+    prompt = torch.tensor([[1, 2, PAD, 3], [1, 2, 4, 5]])
+    assert run_timer([], prompt, pad_token_id=PAD, prompt_tokens=7)["llm.prompt_tokens"] == 7
+    # A single row is never padded, even if it holds the pad id (an EOS used as pad)
+    assert run_timer([], torch.tensor([[1, PAD, 2]]), pad_token_id=PAD)["llm.prompt_tokens"] == 3
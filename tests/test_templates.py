@@ -0,0 +1,72 @@
+"""
+Golden prompts: each user template rendered from fixed inputs. A failure means a
+template or the compiler changed the prompt text; if that is intended, regenerate with
+
+    UPDATE_GOLDEN=1 python -m pytest tests/test_templates.py
+"""
+import os
+from pathlib import Path
+
+import pytest
+
+from app.config import EVERGREEN_TEMPLATE_PATH, EVERGREEN_USER_PROMPT_PATH, PROMO_TEMPLATE_PATH
+from app.prompts import PromptBuilder
+from app.template_compiler import CompiledTemplate
+
+GOLDEN_DIR = Path(__file__).parent / "golden"
+
+REQUIRED = dict(
+    brand_name="Azuna",
+    website_url="https://example.com",
+    product_name="Air Purifier",
+    target_audience="New parents",
+    tone="Calm",
+    angle_description="Clean air without chemicals",
+)
+FULL = dict(
+    REQUIRED,
+    headlines=["Breathe easy", "Fresh air, every day"],
+    subheadlines=["Plant-based purification", "Whisper quiet"],
+    customer_reviews="Our nursery finally smells fresh - Sam",
+    benefits=["No replacement filters", "Silent at night"],
+    social_proof=["10,000 happy homes", "4.8 stars"],
+    content_bank=["Unboxing videos", "Customer testimonials"],
+    angle_and_benefits="clean air without chemicals",
+    num_image_briefs=3,
+    num_video_briefs=2,
+    offer_headline_options="20% off this week",
+    reference_image_description=["A bright kitchen", "A calm nursery"],
+)
+TEMPLATES = {
+    "evergreen_user": EVERGREEN_USER_PROMPT_PATH,
+    "evergreen_template": EVERGREEN_TEMPLATE_PATH,
+    "promo_template": PROMO_TEMPLATE_PATH,
+}
+
+
+@pytest.mark.parametrize("inputs", ["full", "required"])
+@pytest.mark.parametrize("template", sorted(TEMPLATES))
+def test_template_matches_golden(template, inputs):
+    kwargs = FULL if inputs == "full" else REQUIRED
+    prompt = PromptBuilder(str(TEMPLATES[template])).build_prompt(**kwargs)
+    golden_path = GOLDEN_DIR / f"{template}.{inputs}.txt"
+    if os.environ.get("UPDATE_GOLDEN"):
+        golden_path.write_text(prompt + "\n", encoding="utf-8")
+    assert prompt + "\n" == golden_path.read_text(encoding="utf-8")
+
+
+def test_sections_stop_at_the_next_header():
+    template = CompiledTemplate(
+        "Headlines Options:\n{headline_options}\n\n"
+        "Subheadline/Explainer Options:\n[Subheadline 1]\n"
+        "Product Benefits:\n- default\n\n"
+        "Content Bank - types:\n{content_bank_description}\nReference Materials:\nNone\n"
+    )
+    assert template.sections == ["headlines", "subheadlines", "benefits", "content_bank"]
+    assert template.render({}, {"headlines": ["A"], "content_bank": ["B"]}) == (
+        "Headlines Options:\n[Headline 1] A\n\n"
+        "Product Benefits:\n- default\n\n"
+        "Content Bank - Please limit your visual recommendations to the following types of content, "
+        "and anything that deviates from this list must only be very realistically accessible stock images/videos:\n"
+        "B\n\nReference Materials:\nNone"
+    )
@@ -0,0 +1,18 @@
+from app import visual_parser
+from app.cache import file_digest
+from app.visual_parser import VisualParser
+
+
+def test_prepare_many_reuses_the_callers_digests(tmp_path, write_images, monkeypatch):
+    paths = [str(p) for p in write_images(tmp_path / "images", 3, size=(200, 100))]
+    digests = [file_digest(path) for path in paths]
+    parser = VisualParser(cache_dir=tmp_path / "prepared", max_side=64)
+
+    def no_hashing(path):
+        raise AssertionError(f"{path} hashed again")
+
+    monkeypatch.setattr(visual_parser, "file_digest", no_hashing)
+    ready = dict(parser.prepare_many(paths, digests=digests))
+    assert sorted(ready) == [0, 1, 2] and all(ready.values())
+    # A second pass is served from the cache under the same keys
+    assert dict(parser.prepare_many(paths, digests=digests)) == ready